@@ -5,6 +5,7 @@ from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from .models import UserProfile, Address
 from .forms import UserForm, AddressForm
+from cart.guest import merge_guest_cart
 
 def register(request):
     if request.method == 'POST':
@@ -22,7 +23,7 @@ def register(request):
         user = User.objects.create_user(username=username, email=email, password=password)
         UserProfile.objects.create(user=user)
         login(request, user)
-        return redirect('home')
+        return merge_guest_cart(request, redirect('home'), user)
     
     return render(request, 'accounts/register.html')
 
@@ -34,7 +35,7 @@ def login_view(request):
         
         if user:
             login(request, user)
-            return redirect(request.GET.get('next', 'home'))
+            return merge_guest_cart(request, redirect(request.GET.get('next', 'home')), user)
         else:
             return render(request, 'accounts/login.html', {'error': 'Invalid credentials'})
     
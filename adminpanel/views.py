@@ -8,7 +8,10 @@ from datetime import timedelta
 
 from products.models import Product, Category
 from orders.models import Order, OrderItem, Coupon
-from delivery.models import DeliveryTracking, DeliveryStatusUpdate
+from orders.services import update_status
+from products.pagination import KeysetPaginator, next_page_url
+from products.search import order_by_rank, search_products
+from products.slugs import allocate_slug
 
 def is_admin(user):
     return user.is_staff and user.is_superuser
@@ -37,9 +40,22 @@ def admin_dashboard(request):
 @login_required(login_url='login')
 @user_passes_test(is_admin)
 def manage_products(request):
-    products = Product.objects.all()
+    products = Product.objects.select_related('category')
     
-    context = {'products': products}
+    search_query = request.GET.get('search')
+    if search_query:
+        products = order_by_rank(products, search_products(search_query))
+        ordering = ('search_rank', 'id')
+    else:
+        ordering = ('-created_at', '-id')
+    
+    page = KeysetPaginator(products, ordering, page_size=50).page(request.GET.get('cursor'))
+    
+    context = {
+        'products': page,
+        'search_query': search_query or '',
+        'next_page_url': next_page_url(request, page),
+    }
     return render(request, 'adminpanel/products.html', context)
 
 @login_required(login_url='login')
@@ -51,7 +67,7 @@ def add_product(request):
         product = Product.objects.create(
             category_id=request.POST.get('category'),
             name=request.POST.get('name'),
-            slug=request.POST.get('name').lower().replace(' ', '-'),
+            slug=allocate_slug(Product, request.POST.get('name')),
             description=request.POST.get('description'),
             price=request.POST.get('price'),
             discount_price=request.POST.get('discount_price') or None,
@@ -113,7 +129,7 @@ def add_category(request):
     if request.method == 'POST':
         Category.objects.create(
             name=request.POST.get('name'),
-            slug=request.POST.get('name').lower().replace(' ', '-'),
+            slug=allocate_slug(Category, request.POST.get('name')),
             description=request.POST.get('description'),
             icon=request.POST.get('icon', 'fas fa-box')
         )
@@ -167,20 +183,11 @@ def order_update(request, order_id):
     order_items = OrderItem.objects.filter(order=order)
     
     if request.method == 'POST':
-        new_status = request.POST.get('status')
-        order.status = new_status
-        order.save()
-        
-        # Create delivery tracking if not exists
-        if not hasattr(order, 'tracking'):
-            DeliveryTracking.objects.create(order=order)
-        
-        # Add status update to tracking
-        DeliveryStatusUpdate.objects.create(
-            tracking=order.tracking,
-            status=new_status,
+        # Tracking and the customer email follow on the task queue
+        update_status(
+            order, request.POST.get('status'),
             location=request.POST.get('location', ''),
-            notes=request.POST.get('notes', '')
+            notes=request.POST.get('notes', ''),
         )
         
         return redirect('manage_orders')
@@ -202,22 +209,8 @@ def update_order_status(request):
     notes = request.POST.get('notes', '')
     
     order = get_object_or_404(Order, id=order_id)
-    order.status = new_status
-    order.save()
-    
-    # Create or update tracking
-    tracking, created = DeliveryTracking.objects.get_or_create(order=order)
-    tracking.current_location = location
-    tracking.notes = notes
-    tracking.save()
-    
-    # Add status update
-    DeliveryStatusUpdate.objects.create(
-        tracking=tracking,
-        status=new_status,
-        location=location,
-        notes=notes
-    )
+    # Tracking and the customer email follow on the task queue
+    update_status(order, new_status, location=location, notes=notes)
     
     return JsonResponse({'success': True})
 
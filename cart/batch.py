@@ -0,0 +1,126 @@
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from products.reservations import available_stock
+from products.versioning import bump_version
+
+from .models import CartItem, cart_version_name
+
+# Several cart changes in one request: operations are folded into a final
+# quantity per product, checked against available stock in one pass, and written
+# with at most one bulk_create, one bulk_update and one delete.
+OPERATIONS = ('add', 'set', 'remove')
+MAX_OPERATIONS = 100
+# Times a batch is re-applied after losing an insert race to a concurrent add
+CONFLICT_RETRIES = 3
+
+
+class CartBatchError(ValueError):
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+def parse_operations(payload):
+    """Validate the request body into [(op, product_id, quantity)]."""
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise CartBatchError(['"operations" must be a non-empty list'])
+    if len(operations) > MAX_OPERATIONS:
+        raise CartBatchError([f'at most {MAX_OPERATIONS} operations per request'])
+
+    parsed, errors = [], []
+    for position, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            errors.append(f'operation {position}: "op" must be one of {", ".join(OPERATIONS)}')
+            continue
+        op = operation['op']
+        product_id = operation.get('product_id')
+        quantity = operation.get('quantity', 1 if op == 'add' else None)
+        if not isinstance(product_id, int) or isinstance(product_id, bool):
+            errors.append(f'operation {position}: "product_id" must be an integer')
+            continue
+        if op != 'remove':
+            minimum = 1 if op == 'add' else 0
+            if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < minimum:
+                errors.append(f'operation {position}: "quantity" must be an integer >= {minimum}')
+                continue
+        parsed.append((op, product_id, quantity))
+    if errors:
+        raise CartBatchError(errors)
+    return parsed
+
+
+def apply_operations(user, operations):
+    """
+    Apply parsed operations to `user`'s cart atomically. Raises
+    CartBatchError (and changes nothing) if any product is unknown or short
+    of stock.
+    """
+    for attempt in range(CONFLICT_RETRIES + 1):
+        try:
+            return _apply_operations(user, operations)
+        except IntegrityError:
+            # A concurrent add created one of our new lines after we read the
+            # cart; apply the batch again on top of it
+            if attempt == CONFLICT_RETRIES:
+                raise
+
+
+def _locked_lines(user, product_ids):
+    # Only existing lines can be locked; one another request is inserting
+    # right now shows up as a unique violation on our insert instead
+    return {
+        item.product_id: item
+        for item in CartItem.objects.select_for_update().filter(user=user, product_id__in=product_ids)
+    }
+
+
+def _apply_operations(user, operations):
+    product_ids = {product_id for _, product_id, _ in operations}
+
+    with transaction.atomic():
+        lines = _locked_lines(user, product_ids)
+        stock = available_stock(product_ids, exclude_user=user)
+
+        quantities = {pk: lines[pk].quantity if pk in lines else 0 for pk in product_ids}
+        for op, product_id, quantity in operations:
+            if op == 'add':
+                quantities[product_id] += quantity
+            elif op == 'set':
+                quantities[product_id] = quantity
+            else:
+                quantities[product_id] = 0
+
+        errors = []
+        for product_id in sorted(product_ids):
+            if product_id not in stock:
+                errors.append(f'product {product_id}: not found')
+            elif quantities[product_id] > stock[product_id]:
+                errors.append(f'product {product_id}: insufficient stock')
+        if errors:
+            raise CartBatchError(errors)
+
+        now = timezone.now()
+        to_create, to_update, to_delete = [], [], []
+        for product_id, quantity in quantities.items():
+            line = lines.get(product_id)
+            if quantity == 0:
+                if line is not None:
+                    to_delete.append(line.pk)
+            elif line is None:
+                to_create.append(CartItem(user=user, product_id=product_id, quantity=quantity))
+            elif line.quantity != quantity:
+                line.quantity = quantity
+                line.updated_at = now
+                to_update.append(line)
+
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_create or to_update:
+            # Bulk writes send no signals (the delete above does)
+            transaction.on_commit(lambda: bump_version(cart_version_name(user.pk)))
@@ -0,0 +1,100 @@
+import json
+from decimal import Decimal
+
+from django.core import signing
+from django.db import transaction
+
+from products.models import Product
+from products.reservations import available_stock
+from products.versioning import bump_version
+
+from .models import CartItem, cart_version_name
+from .summary import CartSummary
+
+# Anonymous carts live in a signed cookie ({product_id: quantity}), so guests
+# browsing and adding to the cart cause no database writes. The cookie is
+# merged into CartItem rows when the guest logs in or registers.
+GUEST_CART_COOKIE = 'guest_cart'
+GUEST_CART_SALT = 'cart.guest'
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 30
+MAX_GUEST_LINES = 50
+
+
+class GuestCartLine:
+    # Quacks like a CartItem for the cart template; the id is the product id
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product_id = product.id
+        self.product = product
+        self.quantity = quantity
+        self.line_total = product.effective_price * quantity
+
+    @property
+    def total_price(self):
+        return self.line_total
+
+
+def read_guest_cart(request):
+    """{product_id: quantity} from the request's cookie; tampered or stale cookies read as empty."""
+    if not hasattr(request, '_guest_cart'):
+        cart = {}
+        try:
+            raw = request.get_signed_cookie(GUEST_CART_COOKIE, salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE)
+            cart = {int(pk): int(qty) for pk, qty in json.loads(raw).items() if int(qty) > 0}
+        except (KeyError, signing.BadSignature, ValueError, TypeError, AttributeError):
+            pass
+        request._guest_cart = cart
+    return request._guest_cart
+
+
+def write_guest_cart(request, response, cart):
+    request._guest_cart = cart
+    if cart:
+        response.set_signed_cookie(
+            GUEST_CART_COOKIE, json.dumps(cart, separators=(',', ':')), salt=GUEST_CART_SALT,
+            max_age=GUEST_CART_MAX_AGE, httponly=True, samesite='Lax',
+        )
+    else:
+        response.delete_cookie(GUEST_CART_COOKIE, samesite='Lax')
+    return response
+
+
+def guest_cart_count(request):
+    return len(read_guest_cart(request))
+
+
+def guest_cart_summary(request, cart=None):
+    cart = read_guest_cart(request) if cart is None else cart
+    products = Product.objects.in_bulk(list(cart))
+    items = [GuestCartLine(products[pk], qty) for pk, qty in cart.items() if pk in products]
+    total = sum((item.line_total for item in items), Decimal('0.00'))
+    return CartSummary(items, total, len(items))
+
+
+def merge_guest_cart(request, response, user):
+    """
+    Fold the guest cart into `user`'s CartItem rows with one bulk upsert,
+    capping each line at the product's stock, then drop the cookie.
+    """
+    cart = read_guest_cart(request)
+    if not cart:
+        return response
+
+    stock = available_stock(list(cart), exclude_user=user)
+    existing = dict(
+        CartItem.objects.filter(user=user, product_id__in=list(stock)).values_list('product_id', 'quantity')
+    )
+    lines = [
+        CartItem(user=user, product_id=pk, quantity=min(existing.get(pk, 0) + qty, stock[pk]))
+        for pk, qty in cart.items()
+        if pk in stock and stock[pk] > 0
+    ]
+    if lines:
+        with transaction.atomic():
+            CartItem.objects.bulk_create(
+                lines, update_conflicts=True,
+                unique_fields=['user', 'product'], update_fields=['quantity', 'updated_at'],
+            )
+            # Bulk writes send no signals
+            transaction.on_commit(lambda: bump_version(cart_version_name(user.pk)))
+    return write_guest_cart(request, response, {})
@@ -1,7 +1,63 @@
-from django.db import models
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models import F
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from products.models import Product
+from products.versioning import bump_version
+
+def cart_version_name(user_id):
+    # Versioned per user; bumped whenever that user's cart changes
+    return f'cart:{user_id}'
+
+class CartItemQuerySet(models.QuerySet):
+    def add(self, user_id, product_id, quantity):
+        """
+        Add `quantity` to the (user, product) line, creating it if needed, in a
+        single statement where the database supports INSERT ... ON CONFLICT.
+        Returns the line's new quantity.
+        """
+        now = timezone.now()
+        connection = connections[router.db_for_write(self.model)]
+        features = connection.features
+        if features.supports_update_conflicts_with_target and features.can_return_rows_from_bulk_insert:
+            quantity = self._upsert(connection, user_id, product_id, quantity, now)
+        else:
+            quantity = self._update_or_create(user_id, product_id, quantity, now)
+        # Raw SQL and queryset updates send no signals
+        transaction.on_commit(
+            lambda: bump_version(cart_version_name(user_id)), using=connection.alias,
+        )
+        return quantity
+
+    def _upsert(self, connection, user_id, product_id, quantity, now):
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        table = qn(opts.db_table)
+        column = {name: qn(opts.get_field(name).column) for name in ('user', 'product', 'quantity', 'created_at', 'updated_at')}
+        stamp = connection.ops.adapt_datetimefield_value(now)
+        sql = (
+            f"INSERT INTO {table} ({column['user']}, {column['product']}, {column['quantity']}, "
+            f"{column['created_at']}, {column['updated_at']}) VALUES (%s, %s, %s, %s, %s) "
+            f"ON CONFLICT ({column['user']}, {column['product']}) DO UPDATE SET "
+            f"{column['quantity']} = {table}.{column['quantity']} + EXCLUDED.{column['quantity']}, "
+            f"{column['updated_at']} = EXCLUDED.{column['updated_at']} "
+            f"RETURNING {column['quantity']}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user_id, product_id, quantity, stamp, stamp])
+            return cursor.fetchone()[0]
+
+    def _update_or_create(self, user_id, product_id, quantity, now):
+        line = self.filter(user_id=user_id, product_id=product_id)
+        if not line.update(quantity=F('quantity') + quantity, updated_at=now):
+            try:
+                with transaction.atomic(using=self.db):
+                    return self.create(user_id=user_id, product_id=product_id, quantity=quantity).quantity
+            except IntegrityError:
+                # A concurrent add created the line first
+                line.update(quantity=F('quantity') + quantity, updated_at=now)
+        return line.values_list('quantity', flat=True).get()
 
 class CartItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='cart_items')
@@ -10,6 +66,8 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CartItemQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
@@ -17,6 +75,11 @@ class CartItem(models.Model):
     def total_price(self):
         return self.product.current_price * self.quantity
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_item'),
+        ]
+
 
 # ================================
 # ORDERS - models.py
@@ -0,0 +1,91 @@
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum, Window
+
+from products.versioning import CATALOG_VERSION, get_version
+
+from .models import CartItem, cart_version_name
+
+# Cart contents and totals from one query: items joined to their products,
+# with per-line totals and the cart-wide total/count computed by the database
+# as window aggregates. The count and total are also cached per user, keyed by
+# the user's cart version (bumped by CartItem signals on every mutation) and
+# the catalog version (prices).
+CART_CACHE_TIMEOUT = 60 * 60
+
+_line_total = ExpressionWrapper(
+    F('product__effective_price') * F('quantity'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+class CartSummary:
+    def __init__(self, items, total, count):
+        self.items = items
+        self.total = total
+        self.count = count
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+
+def _totals_key(user_id):
+    return f"cart_totals:{user_id}:{get_version(cart_version_name(user_id))}:{get_version(CATALOG_VERSION)}"
+
+
+def _count_key(user_id):
+    return f"cart_count:{user_id}:{get_version(cart_version_name(user_id))}"
+
+
+def cart_items(user):
+    return (
+        CartItem.objects.filter(user=user)
+        .select_related('product')
+        .annotate(
+            line_total=_line_total,
+            cart_total=Window(Sum(_line_total)),
+            cart_count=Window(Count('id')),
+        )
+        .order_by('created_at', 'id')
+    )
+
+
+def cart_summary(user):
+    items = list(cart_items(user))
+    if items:
+        total = Decimal(items[0].cart_total).quantize(Decimal('0.01'))
+        count = items[0].cart_count
+    else:
+        total, count = Decimal('0.00'), 0
+    cache.set_many({
+        _totals_key(user.pk): (count, total),
+        _count_key(user.pk): count,
+    }, CART_CACHE_TIMEOUT)
+    return CartSummary(items, total, count)
+
+
+def cart_count(user):
+    key = _count_key(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = CartItem.objects.filter(user=user).count()
+        cache.set(key, count, CART_CACHE_TIMEOUT)
+    return count
+
+
+def cart_totals(user):
+    """(count, total) without loading the items."""
+    key = _totals_key(user.pk)
+    totals = cache.get(key)
+    if totals is None:
+        aggregate = CartItem.objects.filter(user=user).aggregate(total=Sum(_line_total), count=Count('id'))
+        totals = (aggregate['count'], (aggregate['total'] or Decimal('0')).quantize(Decimal('0.01')))
+        cache.set(key, totals, CART_CACHE_TIMEOUT)
+    return totals
@@ -1,3 +1,242 @@
-from django.test import TestCase
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase
+
+from accounts.models import Address
+from orders.services import place_order
+from products.models import Category, Product
+
+from .batch import CartBatchError, _locked_lines, apply_operations
+from .models import CartItem
+from .summary import cart_count, cart_summary, cart_totals
+
+
+def make_product(**kwargs):
+    category = Category.objects.create(name='Electronics', slug='electronics')
+    defaults = dict(category=category, name='Laptop Pro', description='d', price=10, stock=1000, image='x.jpg')
+    defaults.update(kwargs)
+    return Product.objects.create(**defaults)
+
+
+class CartItemAddTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        self.product = make_product()
+
+    def test_add_creates_then_increments_one_line(self):
+        self.assertEqual(CartItem.objects.add(self.user.pk, self.product.pk, 2), 2)
+        self.assertEqual(CartItem.objects.add(self.user.pk, self.product.pk, 3), 5)
+        self.assertEqual(CartItem.objects.get(user=self.user, product=self.product).quantity, 5)
+
+    def test_add_to_cart_view(self):
+        self.client.force_login(self.user)
+        for _ in range(2):
+            response = self.client.post('/cart/add/', {'product_id': self.product.pk, 'quantity': 2})
+            self.assertTrue(response.json()['success'])
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 4)
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        self.product = make_product(stock=5)
+
+    def test_guest_add_writes_nothing_and_merges_on_login(self):
+        with self.assertNumQueries(2):  # the product and its checkout holds
+            response = self.client.post('/cart/add/', {'product_id': self.product.pk, 'quantity': 2})
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.client.get('/cart/count/').json(), {'count': 1})
+
+        CartItem.objects.create(user=self.user, product=self.product, quantity=4)
+        response = self.client.post('/accounts/login/', {'username': 'bob', 'password': 'pw'})
+        self.assertEqual(response.cookies['guest_cart'].value, '')
+        # Merged quantities are capped at the available stock
+        self.assertEqual(CartItem.objects.get(user=self.user).quantity, 5)
+
+    def test_malformed_line_ids_are_refused_for_guests_and_members(self):
+        requests = [
+            ('/cart/update/', {'quantity': 1}),
+            ('/cart/update/', {'cart_item_id': 'x', 'quantity': 1}),
+            ('/cart/update/', {'cart_item_id': '\u00b2', 'quantity': 1}),
+            ('/cart/update/', {'cart_item_id': self.product.pk}),
+            ('/cart/update/', {'cart_item_id': self.product.pk, 'quantity': 'q'}),
+            ('/cart/remove/', {}),
+            ('/cart/remove/', {'cart_item_id': 'x'}),
+        ]
+        for member in (False, True):
+            if member:
+                self.client.force_login(self.user)
+            for url, data in requests:
+                with self.subTest(member=member, url=url, data=data):
+                    response = self.client.post(url, data)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertFalse(response.json()['success'])
+
+
+class CartSummaryTests(TestCase):
+    def setUp(self):
+        cache.clear()  # cached counts of earlier tests' users
+        self.user = User.objects.create_user('bob', password='pw')
+        self.laptop = make_product()
+        self.mouse = Product.objects.create(
+            category=self.laptop.category, name='Mouse', description='d', price=5, discount_price=4,
+            stock=10, image='x.jpg',
+        )
+        CartItem.objects.create(user=self.user, product=self.laptop, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.mouse, quantity=3)
+        self.client.force_login(self.user)
+
+    def assertCached(self, count, total):
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_count(self.user), count)
+            self.assertEqual(cart_totals(self.user), (count, total))
+
+    def test_one_query_prices_every_line_and_fills_the_cache(self):
+        with self.assertNumQueries(1):
+            cart = cart_summary(self.user)
+            lines = [(item.product.name, item.line_total) for item in cart]
+        self.assertEqual(lines, [('Laptop Pro', 20), ('Mouse', 12)])
+        self.assertEqual((cart.count, cart.total), (2, 32))
+        self.assertCached(2, 32)
+
+        CartItem.objects.filter(user=self.user).delete()
+        with self.assertNumQueries(1):
+            self.assertFalse(cart_summary(self.user))
+
+    def test_every_cart_change_moves_the_cached_count_on(self):
+        cart_summary(self.user)
+        line = CartItem.objects.get(product=self.mouse)
+        keyboard = Product.objects.create(
+            category=self.laptop.category, name='Keyboard', description='d', price=7, stock=10, image='x.jpg',
+        )
+        changes = [
+            ('add', lambda: self.client.post('/cart/add/', {'product_id': keyboard.pk, 'quantity': 1}), 3, 39),
+            ('update', lambda: self.client.post('/cart/update/', {'cart_item_id': line.pk, 'quantity': 1}), 3, 31),
+            ('remove', lambda: self.client.post('/cart/remove/', {'cart_item_id': line.pk}), 2, 27),
+        ]
+        for name, change, count, total in changes:
+            with self.subTest(change=name):
+                with self.captureOnCommitCallbacks(execute=True):
+                    change()
+                self.assertEqual(cart_count(self.user), count)
+                self.assertEqual(cart_totals(self.user), (count, total))
+                self.assertCached(count, total)
+
+        # A price change reprices the total; the count stays cached
+        with self.captureOnCommitCallbacks(execute=True):
+            keyboard.price = 17
+            keyboard.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_count(self.user), 2)
+        self.assertEqual(cart_totals(self.user), (2, 37))
+
+        address = Address.objects.create(
+            user=self.user, full_name='Bob', phone='1', street_address='1 Main St', city='X',
+            state='Y', postal_code='1', country='Z',
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(self.user, address)
+        self.assertEqual(cart_count(self.user), 0)
+        self.assertEqual(cart_totals(self.user), (0, 0))
+        self.assertCached(0, 0)
+
+
+class CartCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        self.product = make_product()
+
+    def test_count_revalidates_until_the_cart_changes(self):
+        for guest in (True, False):
+            with self.subTest(guest=guest):
+                if not guest:
+                    self.client.force_login(self.user)
+                etag = self.client.get('/cart/count/')['ETag']
+                self.assertEqual(self.client.get('/cart/count/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post('/cart/add/', {'product_id': self.product.pk, 'quantity': 1})
+                response = self.client.get('/cart/count/', HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual((response.status_code, response.json()), (200, {'count': 1}))
+                self.assertNotEqual(response['ETag'], etag)
+
+
+class BatchCartTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        self.product = make_product()
+
+    def test_add_racing_the_batch_insert_is_kept(self):
+        # Another request adds the line just after the batch read the cart
+        CartItem.objects.add(self.user.pk, self.product.pk, 2)
+        reads = []
+
+        def stale_first_read(user, product_ids):
+            reads.append(product_ids)
+            return {} if len(reads) == 1 else _locked_lines(user, product_ids)
+
+        with mock.patch('cart.batch._locked_lines', side_effect=stale_first_read):
+            apply_operations(self.user, [('add', self.product.pk, 3)])
+        self.assertEqual(len(reads), 2)
+        self.assertEqual(CartItem.objects.get(user=self.user, product=self.product).quantity, 5)
+
+    def test_batch_folds_operations_and_refuses_short_stock(self):
+        other = Product.objects.create(
+            category=self.product.category, name='Mouse', description='d', price=5, stock=3, image='x.jpg',
+        )
+        CartItem.objects.create(user=self.user, product=other, quantity=1)
+        apply_operations(self.user, [
+            ('add', self.product.pk, 2), ('add', self.product.pk, 1), ('set', other.pk, 3),
+        ])
+        self.assertEqual(dict(CartItem.objects.values_list('product_id', 'quantity')), {self.product.pk: 3, other.pk: 3})
+
+        with self.assertRaises(CartBatchError):
+            apply_operations(self.user, [('remove', self.product.pk, None), ('add', other.pk, 1)])
+        self.assertEqual(CartItem.objects.count(), 2)
+
+
+class ConcurrentCartAddTests(TransactionTestCase):
+    THREADS = 8
+    ADDS_PER_THREAD = 25
+
+    def test_concurrent_adds_keep_one_line_and_every_increment(self):
+        user = User.objects.create_user('bob', password='pw')
+        product = make_product()
+        errors = []
+        start = threading.Barrier(self.THREADS)
+
+        def hammer():
+            try:
+                start.wait()
+                for _ in range(self.ADDS_PER_THREAD):
+                    # The in-memory SQLite test database reports concurrent
+                    # writers as "locked" instead of waiting; a failed
+                    # statement changed nothing, so retrying it is safe.
+                    while True:
+                        try:
+                            CartItem.objects.add(user.pk, product.pk, 1)
+                            break
+                        except OperationalError as exc:
+                            if 'locked' not in str(exc):
+                                raise
+                            time.sleep(0.001)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hammer) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        lines = CartItem.objects.filter(user=user, product=product)
+        self.assertEqual(lines.count(), 1)
+        self.assertEqual(lines.get().quantity, self.THREADS * self.ADDS_PER_THREAD)
@@ -6,5 +6,6 @@ urlpatterns = [
     path('add/', views.add_to_cart, name='add_to_cart'),
     path('update/', views.update_cart, name='update_cart'),
     path('remove/', views.remove_from_cart, name='remove_from_cart'),
+    path('batch/', views.batch_update_cart, name='batch_update_cart'),
     path('count/', views.get_cart_count, name='get_cart_count'),
 ]
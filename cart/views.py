@@ -1,75 +1,186 @@
+import json
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_cookie
+from django.views.decorators.http import condition, require_POST
 from django.http import JsonResponse
-from .models import CartItem
+from .models import CartItem, cart_version_name
+from .batch import CartBatchError, apply_operations, parse_operations
+from .guest import (
+    MAX_GUEST_LINES, guest_cart_count, guest_cart_summary, read_guest_cart, write_guest_cart,
+)
+from .summary import cart_count, cart_summary, cart_totals
 from products.models import Product
+from products.reservations import available_stock, unheld_stock
+from products.versioning import get_version
+from orders.idempotency import idempotent
+
+# Guests may browse and fill a cart (kept in a signed cookie, see cart.guest);
+# checkout still requires an account, and login merges the guest cart.
 
-@login_required(login_url='login')
 def view_cart(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    total_price = sum(item.total_price for item in cart_items)
+    if request.user.is_authenticated:
+        cart = cart_summary(request.user)
+    else:
+        cart = guest_cart_summary(request)
     
     context = {
-        'cart_items': cart_items,
-        'total_price': total_price,
+        'cart_items': cart.items,
+        'total_price': cart.total,
     }
     return render(request, 'cart/cart.html', context)
 
-@login_required(login_url='login')
 @require_POST
+@idempotent
 def add_to_cart(request):
     product_id = request.POST.get('product_id')
     quantity = int(request.POST.get('quantity', 1))
     
     product = get_object_or_404(Product, id=product_id)
+    # Units held by other shoppers' checkouts are not available
+    viewer = request.user if request.user.is_authenticated else None
+    available = unheld_stock(product, exclude_user=viewer)
     
-    if product.stock < quantity:
+    if available < quantity:
         return JsonResponse({'success': False, 'message': 'Insufficient stock'})
     
-    cart_item, created = CartItem.objects.get_or_create(
-        user=request.user,
-        product=product
-    )
+    if quantity < 1:
+        return JsonResponse({'success': False, 'message': 'Invalid quantity'})
     
-    if not created:
-        cart_item.quantity += quantity
-    else:
-        cart_item.quantity = quantity
+    if not request.user.is_authenticated:
+        cart = dict(read_guest_cart(request))
+        if product.pk not in cart and len(cart) >= MAX_GUEST_LINES:
+            return JsonResponse({'success': False, 'message': 'Cart is full'})
+        if cart.get(product.pk, 0) + quantity > available:
+            return JsonResponse({'success': False, 'message': 'Insufficient stock'})
+        cart[product.pk] = cart.get(product.pk, 0) + quantity
+        response = JsonResponse({'success': True, 'message': 'Added to cart'})
+        return write_guest_cart(request, response, cart)
     
-    cart_item.save()
+    # One INSERT ... ON CONFLICT: concurrent adds can't duplicate the line or lose increments
+    CartItem.objects.add(request.user.pk, product.pk, quantity)
     
     return JsonResponse({'success': True, 'message': 'Added to cart'})
 
-@login_required(login_url='login')
+def _update_guest_cart(request, product_id, quantity):
+    # Guest cart lines are addressed by product id
+    cart = dict(read_guest_cart(request))
+    if product_id not in cart:
+        return JsonResponse({'success': False, 'message': 'Item not in cart'}, status=404)
+    if quantity <= 0:
+        del cart[product_id]
+    else:
+        stock = available_stock([product_id]).get(product_id)
+        if stock is None or stock < quantity:
+            return JsonResponse({'success': False, 'message': 'Insufficient stock'})
+        cart[product_id] = quantity
+    
+    summary = guest_cart_summary(request, cart)
+    line = next((item for item in summary if item.product_id == product_id), None)
+    response = JsonResponse({
+        'success': True,
+        'item_total': float(line.line_total) if line else 0.0,
+        'subtotal': float(summary.total),
+        'count': summary.count,
+    })
+    return write_guest_cart(request, response, cart)
+
+def _posted_int(request, name):
+    try:
+        return int(request.POST.get(name, ''))
+    except ValueError:
+        return None
+
+def _bad_request(message):
+    return JsonResponse({'success': False, 'message': message}, status=400)
+
 @require_POST
 def update_cart(request):
-    cart_item_id = request.POST.get('cart_item_id')
-    quantity = int(request.POST.get('quantity'))
+    cart_item_id = _posted_int(request, 'cart_item_id')
+    quantity = _posted_int(request, 'quantity')
+    if cart_item_id is None:
+        return _bad_request('Invalid cart item')
+    if quantity is None:
+        return _bad_request('Invalid quantity')
     
-    cart_item = get_object_or_404(CartItem, id=cart_item_id, user=request.user)
+    if not request.user.is_authenticated:
+        return _update_guest_cart(request, cart_item_id, quantity)
+    
+    cart_item = get_object_or_404(CartItem.objects.select_related('product'), id=cart_item_id, user=request.user)
     
     if quantity <= 0:
         cart_item.delete()
+        item_total = 0
     else:
-        if cart_item.product.stock < quantity:
+        if unheld_stock(cart_item.product, exclude_user=request.user) < quantity:
             return JsonResponse({'success': False, 'message': 'Insufficient stock'})
         
         cart_item.quantity = quantity
         cart_item.save()
+        item_total = cart_item.total_price
     
-    return JsonResponse({'success': True})
+    count, subtotal = cart_totals(request.user)
+    return JsonResponse({
+        'success': True,
+        'item_total': float(item_total),
+        'subtotal': float(subtotal),
+        'count': count,
+    })
 
-@login_required(login_url='login')
 @require_POST
 def remove_from_cart(request):
-    cart_item_id = request.POST.get('cart_item_id')
+    cart_item_id = _posted_int(request, 'cart_item_id')
+    if cart_item_id is None:
+        return _bad_request('Invalid cart item')
+    if not request.user.is_authenticated:
+        return _update_guest_cart(request, cart_item_id, 0)
     cart_item = get_object_or_404(CartItem, id=cart_item_id, user=request.user)
     cart_item.delete()
     
     return JsonResponse({'success': True})
 
 @login_required(login_url='login')
+@require_POST
+@idempotent
+def batch_update_cart(request):
+    # JSON body: {"operations": [{"op": "add"|"set"|"remove", "product_id": 1, "quantity": 2}, ...]}
+    try:
+        operations = parse_operations(json.loads(request.body or b'null'))
+        apply_operations(request.user, operations)
+    except ValueError as exc:
+        errors = exc.errors if isinstance(exc, CartBatchError) else ['invalid JSON body']
+        return JsonResponse({'success': False, 'errors': errors}, status=400)
+    
+    cart = cart_summary(request.user)
+    return JsonResponse({
+        'success': True,
+        'items': [
+            {
+                'id': item.id,
+                'product_id': item.product_id,
+                'name': item.product.name,
+                'price': float(item.product.effective_price),
+                'quantity': item.quantity,
+                'total': float(item.line_total),
+            }
+            for item in cart
+        ],
+        'total': float(cart.total),
+        'count': cart.count,
+    })
+
+def _cart_etag(request):
+    if not request.user.is_authenticated:
+        return f"cart-guest-{guest_cart_count(request)}"
+    return f"cart-{request.user.pk}-{get_version(cart_version_name(request.user.pk))}"
+
+@cache_control(private=True, no_cache=True)
+@vary_on_cookie
+@condition(etag_func=_cart_etag)
 def get_cart_count(request):
-    count = CartItem.objects.filter(user=request.user).count()
-    return JsonResponse({'count': count})
\ No newline at end of file
+    # Guests' counts come from the cookie without touching the database
+    if not request.user.is_authenticated:
+        return JsonResponse({'count': guest_cart_count(request)})
+    return JsonResponse({'count': cart_count(request.user)})
\ No newline at end of file
@@ -0,0 +1,30 @@
+from django.utils.dateparse import parse_datetime
+
+from orders.models import Order
+from tasks.queue import task
+
+from .models import DeliveryStatusUpdate, DeliveryTracking
+
+
+@task('delivery.open_tracking')
+def open_tracking(order_id):
+    if Order.objects.filter(pk=order_id).exists():
+        DeliveryTracking.objects.get_or_create(order_id=order_id)
+
+
+@task('delivery.record_status')
+def record_status(order_id, status, location='', notes='', at=None):
+    """Log a status change made at `at` and move the tracking to the latest one."""
+    if not Order.objects.filter(pk=order_id).exists():
+        return
+    tracking, _ = DeliveryTracking.objects.get_or_create(order_id=order_id)
+    update = DeliveryStatusUpdate.objects.create(tracking=tracking, status=status, location=location, notes=notes)
+    if at:
+        # Stamp the change, not the moment a worker got to it, so updates
+        # processed out of order still list in order
+        DeliveryStatusUpdate.objects.filter(pk=update.pk).update(timestamp=parse_datetime(at))
+
+    latest = tracking.status_updates.order_by('-timestamp', '-id').first()
+    tracking.current_location = latest.location
+    tracking.notes = latest.notes
+    tracking.save(update_fields=['current_location', 'notes', 'updated_at'])
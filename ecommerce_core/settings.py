@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
     'orders.apps.OrdersConfig',
     'delivery.apps.DeliveryConfig',
     'adminpanel.apps.AdminpanelConfig',
+    'tasks.apps.TasksConfig',
     
     # Third party
     'crispy_forms',
@@ -93,6 +95,23 @@ DATABASES = {
 }
 
 
+# Cache
+# Catalog fragments, facet summaries and the version counters that keep
+# per-process indexes in sync live here. Use a shared backend (Redis or
+# Memcached) when running more than one worker process.
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'eliteshop',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -134,6 +153,24 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Worker processes that build resized product images after an upload
+IMAGE_DERIVATIVE_WORKERS = 2
+
+# Serve catalog browsing from an in-memory NumPy snapshot (when NumPy is installed)
+CATALOG_SNAPSHOT = True
+
+# How long entering checkout holds the cart's stock for the shopper
+STOCK_HOLD_SECONDS = 15 * 60
+
+# How long a write's Idempotency-Key is remembered for replaying retries
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Threads (or processes) per run_tasks worker; always 1 on SQLite
+TASK_WORKERS = 4
+
+# Order numbers embed this id (0-127); give every host serving the site its own
+ORDER_ID_WORKER_ID = int(os.environ.get('ORDER_ID_WORKER_ID', 0))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,73 @@
+import threading
+from collections import namedtuple
+
+from django.utils import timezone
+
+from products.versioning import get_version
+
+from .models import Coupon
+
+# Active coupons held in a per-process dict keyed by normalized code, so
+# checking a code costs a version read instead of a query. Coupon signals bump
+# COUPON_VERSION; every process reloads the (small) table on its next lookup.
+COUPON_VERSION = 'coupons'
+
+
+class ActiveCoupon(namedtuple('ActiveCoupon', 'code discount_percent valid_from valid_to')):
+    __slots__ = ()
+
+    def is_valid_at(self, when):
+        return self.valid_from <= when <= self.valid_to
+
+    def discount(self, total):
+        return (total * self.discount_percent) / 100
+
+
+def normalize_code(code):
+    return (code or '').strip().upper()
+
+
+class CouponRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._coupons = {}
+        self.version = None
+
+    def build(self, coupons, version=None):
+        # Codes that normalize alike resolve to the last coupon given
+        by_code = {}
+        for coupon in coupons:
+            by_code[normalize_code(coupon.code)] = ActiveCoupon(
+                coupon.code, coupon.discount_percent, coupon.valid_from, coupon.valid_to,
+            )
+        with self._lock:
+            self._coupons = by_code
+            self.version = version
+
+    def get(self, code):
+        return self._coupons.get(normalize_code(code))
+
+
+registry = CouponRegistry()
+
+
+def rebuild_registry(coupon_registry=registry):
+    version = get_version(COUPON_VERSION)
+    # Expired coupons can never validate again; editing one bumps the version
+    coupons = Coupon.objects.filter(is_active=True, valid_to__gte=timezone.now()).order_by('pk')
+    coupon_registry.build(coupons, version=version)
+    return coupon_registry
+
+
+def get_registry():
+    if registry.version != get_version(COUPON_VERSION):
+        rebuild_registry()
+    return registry
+
+
+def valid_coupon(code, when=None):
+    """The ActiveCoupon for `code` if it can be used at `when` (default now), else None."""
+    coupon = get_registry().get(code)
+    if coupon is None or not coupon.is_valid_at(when or timezone.now()):
+        return None
+    return coupon
@@ -0,0 +1,55 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from delivery.models import DeliveryStatusUpdate
+from products.images import derivative_name
+from products.pagination import KeysetPaginator
+
+from .models import Order, OrderItem
+
+# A customer's orders, a page at a time, from one query: item count, the
+# first item (name and picture) and the latest delivery status are correlated
+# subqueries, and keyset pagination on (created_at, id) walks the
+# (user, created_at, id) index, so page 40 costs what page 1 does.
+HISTORY_ORDERING = ('-created_at', '-id')
+HISTORY_PAGE_SIZE = 12
+THUMBNAIL_WIDTH = 320
+
+STATUS_LABELS = dict(Order.STATUS_CHOICES)
+
+
+def order_history(user):
+    items = OrderItem.objects.filter(order=OuterRef('pk'))
+    first_item = items.order_by('id')
+    latest_update = DeliveryStatusUpdate.objects.filter(tracking__order=OuterRef('pk')).order_by('-timestamp', '-id')
+    return Order.objects.filter(user=user).annotate(
+        item_count=Coalesce(
+            Subquery(items.order_by().values('order').annotate(count=Count('id')).values('count')),
+            Value(0), output_field=IntegerField(),
+        ),
+        first_item_name=Subquery(first_item.values('product__name')[:1]),
+        first_item_image=Subquery(first_item.values('product__image')[:1]),
+        first_item_digest=Subquery(first_item.values('product__image_digest')[:1]),
+        tracking_status=Subquery(latest_update.values('status')[:1]),
+    )
+
+
+def thumbnail_url(image, digest):
+    # The smallest resized JPEG once it has been built, else the upload itself
+    if digest:
+        name = derivative_name(digest, THUMBNAIL_WIDTH, 'jpg')
+        if os.path.exists(os.path.join(str(settings.MEDIA_ROOT), name)):
+            return f'{settings.MEDIA_URL}{name}'
+    return default_storage.url(image) if image else None
+
+
+def history_page(user, cursor=None, page_size=HISTORY_PAGE_SIZE):
+    page = KeysetPaginator(order_history(user), HISTORY_ORDERING, page_size).page(cursor)
+    for order in page:
+        order.thumbnail_url = thumbnail_url(order.first_item_image, order.first_item_digest)
+        order.tracking_label = STATUS_LABELS.get(order.tracking_status, order.tracking_status)
+    return page
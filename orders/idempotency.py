@@ -0,0 +1,148 @@
+import functools
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyRecord
+
+# Clients send an Idempotency-Key header with a write; a retry with the same
+# key gets the stored response back instead of running the view again. The
+# first request claims the key with a short lease, and its response is stored
+# in the same transaction as the view's own writes, so a record still pending
+# after its lease ran out belongs to a request that died without committing
+# anything and may be taken over. A replay costs one SELECT and no writes.
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+LEASE_SECONDS = 60
+PURGE_BATCH_SIZE = 1000
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', DEFAULT_TTL_SECONDS))
+
+
+def request_hash(request):
+    digest = hashlib.sha256()
+    for part in (request.method.encode(), request.get_full_path().encode(), request.body):
+        digest.update(part)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def _error(message, status):
+    return JsonResponse({'success': False, 'message': message}, status=status)
+
+
+def _in_progress():
+    response = _error('A request with this Idempotency-Key is still in progress', 409)
+    response['Retry-After'] = '1'
+    return response
+
+
+def _replay(record):
+    response = HttpResponse(bytes(record.response_body), status=record.response_status, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(user, key, fingerprint):
+    """(lease, None) if this request should run, else (None, response to send instead)."""
+    now = timezone.now()
+    lease = now + timedelta(seconds=LEASE_SECONDS)
+    records = IdempotencyRecord.objects.filter(user=user, key=key)
+    record = records.first()
+    if record is None:
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(
+                    user=user, key=key, request_hash=fingerprint, locked_until=lease, expires_at=now + key_ttl(),
+                )
+            return lease, None
+        except IntegrityError:
+            # A concurrent duplicate claimed it first
+            record = records.get()
+
+    if record.expires_at <= now:
+        # Expired but not purged yet: the key is free again
+        fresh = records.filter(expires_at=record.expires_at).update(
+            request_hash=fingerprint, response_status=None, response_body=b'',
+            locked_until=lease, expires_at=now + key_ttl(),
+        )
+        return (lease, None) if fresh else (None, _in_progress())
+    if record.request_hash != fingerprint:
+        return None, _error('Idempotency-Key was already used for a different request', 422)
+    if record.response_status is not None:
+        return None, _replay(record)
+    if record.locked_until > now:
+        return None, _in_progress()
+    taken = records.filter(response_status__isnull=True, locked_until=record.locked_until).update(locked_until=lease)
+    return (lease, None) if taken else (None, _in_progress())
+
+
+def _storable(response):
+    return (
+        response.status_code < 500
+        and not response.streaming
+        and response.get('Content-Type', '').startswith('application/json')
+    )
+
+
+def idempotent(view):
+    """
+    Honour Idempotency-Key on a JSON write view. Only logged-in users' requests
+    are recorded: a guest's cart lives in the cookie the retry carries, so
+    replaying a guest request already gives the same result.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key or not request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters', 400)
+
+        lease, response = _claim(request.user, key, request_hash(request))
+        if response is not None:
+            return response
+
+        claimed = IdempotencyRecord.objects.filter(user=request.user, key=key, locked_until=lease)
+        try:
+            with transaction.atomic():
+                response = view(request, *args, **kwargs)
+                if _storable(response):
+                    if not claimed.update(
+                        response_status=response.status_code, response_body=response.content, locked_until=None,
+                    ):
+                        raise LeaseLost
+                    return response
+        except LeaseLost:
+            # Another attempt took the key over; it owns the outcome
+            return _in_progress()
+        except BaseException:
+            claimed.delete()
+            raise
+        # Redirects, pages and server errors are not replayed; free the key for a retry
+        claimed.delete()
+        return response
+    return wrapper
+
+
+def purge_expired(batch_size=PURGE_BATCH_SIZE, now=None):
+    """Delete expired records in batches of `batch_size`; returns how many went."""
+    now = now or timezone.now()
+    expired = IdempotencyRecord.objects.filter(expires_at__lte=now)
+    deleted = 0
+    while True:
+        batch = list(expired.values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += IdempotencyRecord.objects.filter(id__in=batch).delete()[0]
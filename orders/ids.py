@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+# Snowflake-style order numbers, generated without touching the database:
+#
+#   41 bits  milliseconds since EPOCH_MS (good until 2093)
+#    7 bits  worker id: one per host, from the ORDER_ID_WORKER_ID setting
+#   22 bits  process id: unique among a host's live processes (Linux caps
+#            pids at 2**22), so gunicorn workers never need coordinating
+#   10 bits  per-process sequence within one millisecond
+#
+# The 80 bits are written as 16 Crockford base32 digits, whose alphabet is in
+# ASCII order, so order numbers sort by creation time. A recycled pid is
+# harmless: the pid's previous owner exited before the new process's first
+# millisecond.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+TIMESTAMP_BITS = 41
+WORKER_BITS = 7
+PID_BITS = 22
+SEQUENCE_BITS = 10
+ID_BITS = TIMESTAMP_BITS + WORKER_BITS + PID_BITS + SEQUENCE_BITS
+
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+ORDER_NUMBER_PREFIX = 'ORD'
+
+_DECODE = {char: value for value, char in enumerate(ALPHABET)}
+# Crockford's forgiving reads of characters that are easy to mistype
+_DECODE.update({'O': 0, 'I': 1, 'L': 1})
+
+# Two digits per table lookup: encoding runs on every order
+_PAIRS = [high + low for high in ALPHABET for low in ALPHABET]
+_PAIR_SHIFTS = tuple(range(ID_BITS - 10, -1, -10))
+
+
+def encode(number):
+    if not 0 <= number < 1 << ID_BITS:
+        raise ValueError(f'{number} does not fit in {ID_BITS} bits')
+    return ''.join([_PAIRS[number >> shift & 1023] for shift in _PAIR_SHIFTS])
+
+
+def decode(text):
+    number = 0
+    for char in text.upper().replace('-', ''):
+        try:
+            number = number * 32 + _DECODE[char]
+        except KeyError:
+            raise ValueError(f'invalid base32 digit {char!r}') from None
+    return number
+
+
+class IdGenerator:
+    """Thread-safe; one per process (see `new_order_number`)."""
+
+    def __init__(self, worker_id=0, pid=None, clock=time.time_ns):
+        if not 0 <= worker_id < 1 << WORKER_BITS:
+            raise ValueError(f'worker id must be in [0, {1 << WORKER_BITS})')
+        self.pid = os.getpid() if pid is None else pid
+        self.prefix = (worker_id << PID_BITS | self.pid & ((1 << PID_BITS) - 1)) << SEQUENCE_BITS
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.last_ms = -1
+        self.sequence = 0
+
+    def next_id(self):
+        with self.lock:
+            now_ms = self.clock() // 1_000_000 - EPOCH_MS
+            if now_ms > self.last_ms:
+                self.last_ms, self.sequence = now_ms, 0
+            else:
+                # Same millisecond, or the clock stepped back: keep counting
+                # on the last timestamp, borrowing the next millisecond when
+                # the sequence runs out, so ids never repeat or go backwards
+                self.sequence += 1
+                if self.sequence >> SEQUENCE_BITS:
+                    self.last_ms, self.sequence = self.last_ms + 1, 0
+            return self.last_ms << (ID_BITS - TIMESTAMP_BITS) | self.prefix | self.sequence
+
+
+def id_timestamp_ms(number):
+    """Unix time in milliseconds at which `number` was generated."""
+    return (number >> (ID_BITS - TIMESTAMP_BITS)) + EPOCH_MS
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def _reset_after_fork():
+    # The child has a new pid (and maybe a lock held by a thread that didn't survive the fork)
+    global _generator, _generator_lock
+    _generator = None
+    _generator_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _get_generator():
+    global _generator
+    generator = _generator
+    if generator is not None and generator.pid == os.getpid():
+        return generator
+    with _generator_lock:
+        # A pid check as well, for platforms without fork hooks
+        if _generator is None or _generator.pid != os.getpid():
+            _generator = IdGenerator(worker_id=getattr(settings, 'ORDER_ID_WORKER_ID', 0))
+        return _generator
+
+
+def new_order_number():
+    return ORDER_NUMBER_PREFIX + encode(_get_generator().next_id())
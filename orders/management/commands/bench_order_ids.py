@@ -0,0 +1,30 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.ids import new_order_number
+
+
+class Command(BaseCommand):
+    help = "Measure order number generation throughput and check the numbers are unique and ordered"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=1_000_000, help='Order numbers per thread')
+        parser.add_argument('--threads', type=int, default=4, help='Threads generating concurrently')
+
+    def handle(self, *args, **options):
+        count, threads = max(1, options['count']), max(1, options['threads'])
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            batches = list(pool.map(lambda _: [new_order_number() for _ in range(count)], range(threads)))
+        elapsed = time.perf_counter() - started
+
+        generated = [number for batch in batches for number in batch]
+        self.stdout.write(f"{len(generated)} order numbers in {elapsed:.2f}s ({len(generated) / elapsed:,.0f}/s)")
+        if len(set(generated)) != len(generated):
+            raise CommandError(f"{len(generated) - len(set(generated))} duplicate order numbers")
+        if any(batch != sorted(batch) for batch in batches):
+            raise CommandError("Order numbers went backwards within a thread")
+        self.stdout.write(self.style.SUCCESS(f"All unique, e.g. {generated[0]} .. {generated[-1]}"))
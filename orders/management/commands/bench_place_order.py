@@ -0,0 +1,88 @@
+import itertools
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from accounts.models import Address
+from cart.models import CartItem
+from orders.models import OrderItem
+from orders.services import InsufficientStock, place_order
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Place orders concurrently against one scarce product; report throughput and check for overselling"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=200, help='Shoppers, each placing one order')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent order placements')
+        parser.add_argument('--quantity', type=int, default=1, help='Units in each cart')
+        parser.add_argument('--stock', type=int, help='Units on hand (default: enough for half the orders)')
+
+    def handle(self, *args, **options):
+        orders, quantity = max(1, options['orders']), max(1, options['quantity'])
+        stock = options['stock'] if options['stock'] is not None else orders * quantity // 2
+        tag = f"bench-{uuid.uuid4().hex[:8]}"
+
+        category = Category.objects.create(name=tag, slug=tag)
+        product = Product.objects.create(
+            category=category, name=tag, slug=tag, description='Order placement benchmark',
+            price=10, stock=stock, image='products/bench.jpg',
+        )
+        User.objects.bulk_create([User(username=f"{tag}-{n}", password='!') for n in range(orders)])
+        users = list(User.objects.filter(username__startswith=f"{tag}-"))
+        Address.objects.bulk_create([
+            Address(user=user, full_name=user.username, phone='0', street_address='-', city='-',
+                    state='-', postal_code='0', country='-')
+            for user in users
+        ])
+        addresses = {address.user_id: address for address in Address.objects.filter(user__in=users)}
+        CartItem.objects.bulk_create([CartItem(user=user, product=product, quantity=quantity) for user in users])
+
+        def shop(user):
+            try:
+                # SQLite reports a conflicting writer as "locked" rather than
+                # waiting for it; the failed transaction changed nothing, so
+                # back off with jitter and retry
+                for attempt in itertools.count():
+                    try:
+                        place_order(user, addresses[user.pk])
+                        return True
+                    except InsufficientStock:
+                        return False
+                    except OperationalError as exc:
+                        if 'locked' not in str(exc):
+                            raise
+                        time.sleep(random.uniform(0, 0.002 * 2 ** min(attempt, 6)))
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max(1, options['threads'])) as pool:
+                placed = sum(pool.map(shop, users))
+            elapsed = time.perf_counter() - started
+
+            product.refresh_from_db()
+            sold = OrderItem.objects.filter(product=product).aggregate(units=Sum('quantity'))['units'] or 0
+            self.stdout.write(
+                f"{placed} placed, {orders - placed} refused in {elapsed:.2f}s "
+                f"({orders / elapsed:.0f} attempts/s, {placed / elapsed:.0f} orders/s)"
+            )
+            expected_placed = min(orders, stock // quantity)
+            if sold != placed * quantity or product.stock != stock - sold or placed != expected_placed:
+                raise CommandError(
+                    f"Inconsistent stock: started with {stock}, {product.stock} left, "
+                    f"{sold} units in {placed} orders (expected {expected_placed})"
+                )
+            self.stdout.write(self.style.SUCCESS(f"No overselling: {sold} of {stock} units sold, {product.stock} left"))
+        finally:
+            User.objects.filter(username__startswith=f"{tag}-").delete()
+            product.delete()
+            category.delete()
@@ -0,0 +1,67 @@
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from cart.models import CartItem
+from orders.pricing import price_cart, verify_quote
+from products.models import Category, Product
+
+
+class Command(BaseCommand):
+    help = "Time pricing a cart against verifying its signed quote, for carts of increasing size"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', default='1,10,100,500', help='Comma-separated cart sizes')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per cart size')
+
+    def _time(self, func, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return (time.perf_counter() - started) / repeat * 1e6, result
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['lines'].split(',')})
+        except ValueError:
+            raise CommandError('--lines must be comma-separated integers')
+        if not sizes or sizes[0] < 1:
+            raise CommandError('--lines must be positive')
+        repeat = max(1, options['repeat'])
+        tag = f"bench-{uuid.uuid4().hex[:8]}"
+
+        category = Category.objects.create(name=tag, slug=tag)
+        Product.objects.bulk_create([
+            Product(
+                category=category, name=f"{tag} {n}", slug=f"{tag}-{n}", description='Pricing benchmark',
+                price=10 + n % 90, discount_price=(5 + n % 5) if n % 3 == 0 else None,
+                effective_price=(5 + n % 5) if n % 3 == 0 else 10 + n % 90,
+                stock=1000, image='products/bench.jpg',
+            )
+            for n in range(sizes[-1])
+        ])
+        product_ids = list(Product.objects.filter(category=category).order_by('pk').values_list('pk', flat=True))
+        user = User.objects.create(username=tag, password='!')
+
+        try:
+            self.stdout.write(f"{'lines':>6} {'price_cart':>12} {'verify_quote':>13} {'token':>8}")
+            for size in sizes:
+                CartItem.objects.filter(user=user).delete()
+                CartItem.objects.bulk_create([
+                    CartItem(user=user, product_id=pk, quantity=1 + n % 3)
+                    for n, pk in enumerate(product_ids[:size])
+                ])
+                priced_us, quote = self._time(lambda: price_cart(user), repeat)
+                token = quote.token
+                verified_us, verified = self._time(lambda: verify_quote(token, user), repeat)
+                if verified is None or verified.total != quote.total:
+                    raise CommandError(f"Quote for {size} lines did not verify")
+                self.stdout.write(
+                    f"{size:>6} {priced_us:>10.0f}us {verified_us:>11.0f}us {len(token):>7}B"
+                )
+        finally:
+            user.delete()
+            Product.objects.filter(category=category).delete()
+            category.delete()
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.idempotency import PURGE_BATCH_SIZE, purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key records (run periodically, e.g. hourly)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='Records deleted per statement')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = purge_expired(batch_size=max(1, options['batch_size']))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired idempotency records in {elapsed:.2f}s"))
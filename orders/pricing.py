@@ -0,0 +1,100 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core import signing
+
+from cart.models import cart_version_name
+from cart.summary import cart_summary
+from products.versioning import get_version
+
+from .coupons import normalize_code, valid_coupon
+
+# One place that prices a cart: line totals, coupon discount and grand total,
+# all in Decimal, from the single cart query. Checkout and apply_coupon hand
+# the result to the browser as a signed quote token; place_order takes the
+# prices from a token that is unexpired, belongs to the user, names the same
+# coupon, was issued at the cart's current version, still lists exactly the
+# cart's lines and whose coupon is still valid, and re-prices otherwise.
+QUOTE_SALT = 'orders.quote'
+DEFAULT_QUOTE_SECONDS = 15 * 60
+CENT = Decimal('0.01')
+
+
+def quote_max_age():
+    return getattr(settings, 'CHECKOUT_QUOTE_SECONDS', DEFAULT_QUOTE_SECONDS)
+
+
+def to_cents(amount):
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class QuoteLine:
+    __slots__ = ('product_id', 'quantity', 'unit_price', 'line_total')
+
+    def __init__(self, product_id, quantity, unit_price):
+        self.product_id = product_id
+        self.quantity = quantity
+        self.unit_price = to_cents(unit_price)
+        self.line_total = self.unit_price * quantity
+
+
+class Quote:
+    def __init__(self, user_id, cart_version, lines, coupon=None, items=None):
+        self.user_id = user_id
+        self.cart_version = cart_version
+        self.lines = lines
+        self.coupon_code = coupon.code if coupon else None
+        self.subtotal = sum((line.line_total for line in lines), Decimal('0.00'))
+        self.discount = to_cents(coupon.discount(self.subtotal)) if coupon else Decimal('0.00')
+        self.total = self.subtotal - self.discount
+        # The priced cart items when the quote came from the database (not a token)
+        self.items = items
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    @property
+    def token(self):
+        payload = {
+            'u': self.user_id,
+            'v': self.cart_version,
+            'c': self.coupon_code or '',
+            'l': [[line.product_id, line.quantity, str(line.unit_price)] for line in self.lines],
+            'd': str(self.discount),
+        }
+        return signing.dumps(payload, salt=QUOTE_SALT, compress=True)
+
+
+class _QuotedCoupon:
+    # The discount as quoted; place_order re-checks that the coupon is still valid
+    def __init__(self, code, discount):
+        self.code = code
+        self._discount = Decimal(discount)
+
+    def discount(self, subtotal):
+        return self._discount
+
+
+def price_cart(user, coupon_code=None):
+    """Quote `user`'s cart at current prices; an invalid coupon code is ignored."""
+    # Read the version first: a cart change racing the query then invalidates the quote
+    version = get_version(cart_version_name(user.pk))
+    cart = cart_summary(user)
+    lines = [QuoteLine(item.product_id, item.quantity, item.product.effective_price) for item in cart]
+    coupon = valid_coupon(coupon_code) if coupon_code else None
+    return Quote(user.pk, version, lines, coupon=coupon, items=cart.items)
+
+
+def verify_quote(token, user, coupon_code=None):
+    """The Quote in `token` if it still stands for `user`'s cart and coupon, else None. No queries."""
+    try:
+        payload = signing.loads(token, salt=QUOTE_SALT, max_age=quote_max_age())
+        if payload['u'] != user.pk or normalize_code(payload['c']) != normalize_code(coupon_code):
+            return None
+        if payload['v'] != get_version(cart_version_name(user.pk)):
+            return None
+        lines = [QuoteLine(product_id, quantity, price) for product_id, quantity, price in payload['l']]
+        coupon = _QuotedCoupon(payload['c'], payload['d']) if payload['c'] else None
+        return Quote(user.pk, payload['v'], lines, coupon=coupon)
+    except (signing.BadSignature, KeyError, TypeError, ValueError, ArithmeticError):
+        return None
@@ -0,0 +1,146 @@
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Q, When
+from django.utils import timezone
+
+from cart.models import CartItem
+from products.models import Product
+from products.reservations import held_quantities, release
+from products.signals import publish_stock_change
+from tasks.queue import enqueue_many
+
+from .coupons import valid_coupon
+from .ids import new_order_number
+from .models import Order, OrderItem
+from .pricing import price_cart, verify_quote
+
+DELIVERY_DAYS = 4
+
+
+class OrderError(Exception):
+    """Order placement was refused; the message is safe to show the customer."""
+
+
+class InsufficientStock(OrderError):
+    def __init__(self, names):
+        super().__init__(f"Not enough stock left for {', '.join(names)}")
+        self.names = names
+
+
+def place_order(user, address, coupon_code=None, quote_token=None):
+    """
+    Turn `user`'s cart into an Order in one transaction, with the same number
+    of queries whatever the cart size: the product rows are locked in one
+    SELECT ... FOR UPDATE, stock is decremented by a single conditional UPDATE
+    that refuses to go below other shoppers' holds, the lines are
+    bulk-inserted, and the cart and the user's holds are deleted.
+
+    A valid `quote_token` (see orders.pricing) supplies the prices, saving the
+    product reads, as long as the cart still holds exactly its lines and its
+    coupon is still valid; otherwise the cart is priced afresh.
+
+    Raises OrderError (changing nothing) for an empty cart or short stock.
+    """
+    quote = verify_quote(quote_token, user, coupon_code) if quote_token else None
+    with transaction.atomic():
+        if quote is not None:
+            # The token's cart version comes from this process's cache, which
+            # can miss a change made through another process; only the cart
+            # rows themselves say the lines are still the ones quoted
+            cart = set(CartItem.objects.select_for_update().filter(user=user).values_list('product_id', 'quantity'))
+            if cart != {(line.product_id, line.quantity) for line in quote.lines}:
+                quote = None
+            # The quoted discount only stands while its coupon can still be used
+            elif quote.coupon_code and valid_coupon(quote.coupon_code) is None:
+                quote = None
+        if quote is None:
+            # An invalid or expired code is ignored, exactly as apply_coupon reports it
+            quote = price_cart(user, coupon_code)
+        if not quote:
+            raise OrderError('Cart is empty')
+        quantities = {line.product_id: line.quantity for line in quote.lines}
+
+        # Lock the products, then check stock net of other shoppers' holds
+        products = {
+            pk: (stock, name, category_id)
+            for pk, stock, name, category_id in Product.objects.select_for_update()
+            .filter(pk__in=list(quantities)).values_list('pk', 'stock', 'name', 'category_id')
+        }
+        if len(products) != len(quantities):
+            raise OrderError('Some items in your cart are no longer available')
+        held = held_quantities(list(products), exclude_user=user)
+        needed = {pk: quantity + held.get(pk, 0) for pk, quantity in quantities.items()}
+        short = [name for pk, (stock, name, _) in products.items() if stock < needed[pk]]
+        if short:
+            raise InsufficientStock(short)
+
+        # Every row must still cover its quantity; a short row is not updated
+        # and the count mismatch rolls the whole order back
+        updated = Product.objects.filter(
+            reduce(or_, (Q(pk=pk, stock__gte=minimum) for pk, minimum in needed.items()))
+        ).update(
+            stock=Case(
+                *(When(pk=pk, then=F('stock') - quantity) for pk, quantity in quantities.items()),
+                output_field=IntegerField(),
+            ),
+            updated_at=timezone.now(),
+        )
+        if updated != len(quantities):
+            raise InsufficientStock([name for _, name, _ in products.values()])
+
+        order = Order.objects.create(
+            user=user,
+            order_number=new_order_number(),
+            address=address,
+            total_amount=quote.total,
+            discount_amount=quote.discount,
+            coupon_code=quote.coupon_code,
+            estimated_delivery=timezone.now().date() + timedelta(days=DELIVERY_DAYS),
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                quantity=line.quantity,
+                price=line.unit_price,
+                total=line.line_total,
+            )
+            for line in quote.lines
+        ])
+
+        # Clear the cart and the checkout holds
+        CartItem.objects.filter(user=user).delete()
+        release(user)
+
+        # Everything else happens on the task queue, committed with the order
+        enqueue_many([
+            ('delivery.open_tracking', {'order_id': order.pk}),
+            ('orders.send_confirmation', {'order_id': order.pk}),
+            # Fold the basket into co-purchase recommendations and sales velocity
+            ('products.record_order', {'product_ids': list(quantities)}),
+            ('products.record_sales', {'lines': list(quantities.items()), 'day': timezone.localdate()}),
+        ])
+
+        categories = {category_id for _, _, category_id in products.values()}
+        transaction.on_commit(lambda: publish_stock_change(categories))
+    return order
+
+
+def update_status(order, status, location='', notes=''):
+    """
+    Move `order` to `status`. The delivery log entry and the customer's email
+    are queued in the same transaction and happen on a task worker.
+    """
+    with transaction.atomic():
+        order.status = status
+        order.save(update_fields=['status', 'updated_at'])
+        enqueue_many([
+            ('delivery.record_status', {
+                'order_id': order.pk, 'status': status, 'location': location, 'notes': notes,
+                'at': timezone.now(),
+            }),
+            ('orders.send_status_update', {'order_id': order.pk, 'status': status}),
+        ])
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.versioning import bump_version
+
+from .coupons import COUPON_VERSION
+from .models import Coupon
+
+
+@receiver(post_save, sender=Coupon)
+@receiver(post_delete, sender=Coupon)
+def coupon_changed(sender, instance, **kwargs):
+    # Admin and adminpanel edits both save through the model
+    transaction.on_commit(lambda: bump_version(COUPON_VERSION))
@@ -0,0 +1,39 @@
+from django.core.mail import send_mail
+
+from tasks.queue import task
+
+from .models import Order
+
+
+def _order_for_email(order_id):
+    order = Order.objects.select_related('user').filter(pk=order_id).first()
+    return order if order is not None and order.user.email else None
+
+
+@task('orders.send_confirmation')
+def send_confirmation(order_id):
+    order = _order_for_email(order_id)
+    if order is None:
+        return
+    message = f"Thanks for your order {order.order_number} of ${order.total_amount}."
+    if order.estimated_delivery:
+        message += f" It should arrive by {order.estimated_delivery:%b %d, %Y}."
+    send_mail(
+        f"Order {order.order_number} placed",
+        f"Hi {order.user.get_short_name() or order.user.username},\n\n{message}\n",
+        None, [order.user.email],
+    )
+
+
+@task('orders.send_status_update')
+def send_status_update(order_id, status):
+    order = _order_for_email(order_id)
+    if order is None:
+        return
+    label = dict(Order.STATUS_CHOICES).get(status, status)
+    send_mail(
+        f"Order {order.order_number}: {label}",
+        f"Hi {order.user.get_short_name() or order.user.username},\n\n"
+        f"Your order {order.order_number} is now: {label}.\n",
+        None, [order.user.email],
+    )
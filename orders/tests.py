@@ -1,3 +1,288 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Address
+from cart.models import CartItem
+from products.models import Category, Product, StockReservation
+from products.reservations import reserve
+from tasks.models import Task
+
+from . import ids
+from .models import Coupon, IdempotencyRecord, Order, OrderItem
+from .services import InsufficientStock, OrderError, place_order
+
+
+def _order_numbers(count):
+    return [ids.new_order_number() for _ in range(count)]
+
+
+class OrderIdTests(SimpleTestCase):
+    def test_encoding_round_trips_and_sorts_numerically(self):
+        numbers = [0, 1, 31, 32, 1023, 1024, 2 ** 40, (1 << ids.ID_BITS) - 1]
+        encoded = [ids.encode(number) for number in numbers]
+        self.assertEqual([ids.decode(text) for text in encoded], numbers)
+        self.assertEqual(sorted(encoded), encoded)
+        self.assertEqual(ids.decode(encoded[-1].lower()), numbers[-1])
+        with self.assertRaises(ValueError):
+            ids.encode(1 << ids.ID_BITS)
+
+    def test_stuck_or_backwards_clock_never_repeats(self):
+        now_ns = (ids.EPOCH_MS + 10 ** 9) * 10 ** 6
+        # 3000 ids in one millisecond overflow the sequence, then the clock steps back a second
+        ticks = iter([now_ns] * 3000 + [now_ns - 10 ** 9] * 3000)
+        generator = ids.IdGenerator(worker_id=3, pid=42, clock=lambda: next(ticks))
+        generated = [generator.next_id() for _ in range(6000)]
+        self.assertEqual(generated, sorted(set(generated)))
+        self.assertLess(generated[-1], 1 << ids.ID_BITS)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_a_million_ids_across_forked_workers_are_unique(self):
+        # Prime the parent's generator so the children inherit it, as
+        # gunicorn workers forked from a preloaded app would
+        first = ids.new_order_number()
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            batches = pool.map(_order_numbers, [250_000] * 4)
+        generated = [number for batch in batches for number in batch]
+
+        self.assertEqual(len(generated), 1_000_000)
+        self.assertEqual(len(set(generated + [first])), 1_000_001)
+        for batch in batches:
+            self.assertEqual(batch, sorted(batch))
+            self.assertGreater(batch[0], first)
+
+    def test_timestamp_is_recoverable(self):
+        number = ids.decode(ids.new_order_number()[len(ids.ORDER_NUMBER_PREFIX):])
+        self.assertAlmostEqual(ids.id_timestamp_ms(number), time.time() * 1000, delta=1000)
+
+
+class OrderTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        self.product = Product.objects.create(
+            category=category, name='Laptop Pro', description='d', price=10, stock=5, image='x.jpg',
+        )
+        self.address = Address.objects.create(
+            user=self.user, full_name='Bob', phone='1', street_address='1 Main St', city='X',
+            state='Y', postal_code='1', country='Z',
+        )
+        CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+        self.client.force_login(self.user)
+
+
+class PlaceOrderTests(OrderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.mouse = Product.objects.create(
+            category=self.product.category, name='Mouse', description='d', price=5, stock=10, image='x.jpg',
+        )
+        CartItem.objects.create(user=self.user, product=self.mouse, quantity=3)
+
+    def assertNothingChanged(self, laptops=5):
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Laptop Pro': laptops, 'Mouse': 10})
+
+    def test_order_takes_stock_and_clears_cart_and_holds(self):
+        self.assertEqual(reserve(self.user, [(self.product.pk, 2)]), [])
+        order = place_order(self.user, self.address)
+        self.assertEqual(order.total_amount, 35)
+        self.assertEqual(
+            sorted(order.items.values_list('product__name', 'quantity', 'total')),
+            [('Laptop Pro', 2, 20), ('Mouse', 3, 15)],
+        )
+        self.assertEqual(dict(Product.objects.values_list('name', 'stock')), {'Laptop Pro': 3, 'Mouse': 7})
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Task.objects.count(), 4)
+
+    def test_one_short_line_rolls_back_the_whole_order(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        with self.assertRaises(InsufficientStock) as raised:
+            place_order(self.user, self.address)
+        self.assertEqual(raised.exception.names, ['Laptop Pro'])
+        self.assertNothingChanged(laptops=1)
+
+    def test_other_shoppers_holds_are_not_sold(self):
+        other = User.objects.create_user('alice', password='pw')
+        self.assertEqual(reserve(other, [(self.product.pk, 4)]), [])
+        with self.assertRaises(InsufficientStock):
+            place_order(self.user, self.address)
+        self.assertNothingChanged()
+
+    def test_stock_sold_after_the_check_is_caught_by_the_update(self):
+        def sold_meanwhile(product_ids, exclude_user=None):
+            # Another order takes the laptops between the read and the UPDATE
+            Product.objects.filter(pk=self.product.pk).update(stock=1)
+            return {}
+
+        with mock.patch('orders.services.held_quantities', side_effect=sold_meanwhile):
+            with self.assertRaises(InsufficientStock):
+                place_order(self.user, self.address)
+        self.assertNothingChanged()
+
+    def test_empty_cart_is_refused(self):
+        CartItem.objects.all().delete()
+        with self.assertRaises(OrderError):
+            place_order(self.user, self.address)
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        def queries_for(user):
+            with CaptureQueriesContext(connection) as captured:
+                place_order(user, self.address)
+            return len(captured)
+
+        small = User.objects.create_user('small', password='pw')
+        CartItem.objects.create(user=small, product=self.mouse, quantity=1)
+        large = User.objects.create_user('large', password='pw')
+        CartItem.objects.bulk_create([
+            CartItem(user=large, product=Product.objects.create(
+                category=self.product.category, name=f'Cable {n}', description='d', price=1, stock=5, image='x.jpg',
+            ), quantity=1)
+            for n in range(8)
+        ])
+        self.assertEqual(queries_for(small), queries_for(large))
+
+
+class IdempotencyTests(OrderTestCase):
+    def place_order(self, key, address_id=None):
+        return self.client.post(
+            '/orders/place-order/', {'address_id': address_id or self.address.pk}, HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_the_first_response(self):
+        first = self.place_order('retry-1')
+        self.assertTrue(first.json()['success'])
+
+        with self.assertNumQueries(3):  # session, user and the stored record; no writes
+            retry = self.place_order('retry-1')
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_key_reused_for_a_different_request_is_refused(self):
+        self.place_order('reused')
+        self.assertEqual(self.place_order('reused', address_id=self.address.pk + 1).status_code, 422)
+
+    def test_failed_request_frees_the_key(self):
+        self.assertEqual(self.place_order('missing', address_id=self.address.pk + 1).status_code, 404)
+        self.assertFalse(IdempotencyRecord.objects.exists())
+
+
+class CouponTests(OrderTestCase):
+    def add_coupon(self, code, starts, ends):
+        now = timezone.now()
+        # Run the signal's on_commit version bump so the registry reloads
+        with self.captureOnCommitCallbacks(execute=True):
+            Coupon.objects.create(
+                code=code, discount_percent=10,
+                valid_from=now + timedelta(days=starts), valid_to=now + timedelta(days=ends),
+            )
+
+    def test_checkout_and_order_agree_on_the_validity_window(self):
+        self.add_coupon('SAVE10', -1, 1)
+        self.add_coupon('LATER', 1, 2)
+
+        self.assertFalse(self.client.post('/orders/apply-coupon/', {'coupon_code': 'LATER'}).json()['success'])
+        with self.assertNumQueries(3):  # session, user and the cart; coupons are in memory
+            applied = self.client.post('/orders/apply-coupon/', {'coupon_code': 'save10'}).json()
+        self.assertEqual(applied['discount'], 2.0)
+
+        self.client.post('/orders/place-order/', {'address_id': self.address.pk, 'coupon_code': 'LATER'})
+        order = Order.objects.get()
+        self.assertEqual((order.discount_amount, order.coupon_code), (0, None))
+
+
+class QuoteTests(OrderTestCase):
+    def place_order(self, quote):
+        return self.client.post('/orders/place-order/', {'address_id': self.address.pk, 'quote': quote})
+
+    def test_order_uses_a_current_quote(self):
+        quote = self.client.get('/orders/checkout/').context['quote']
+        # The quoted price stands even if the catalog price moves meanwhile
+        Product.objects.filter(pk=self.product.pk).update(price=99, effective_price=99)
+        self.assertTrue(self.place_order(quote).json()['success'])
+        self.assertEqual(Order.objects.get().total_amount, 20)
+
+    def test_cart_change_invalidates_the_quote(self):
+        quote = self.client.get('/orders/checkout/').context['quote']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/cart/add/', {'product_id': self.product.pk, 'quantity': 1})
+        self.assertTrue(self.place_order(quote).json()['success'])
+        self.assertEqual(Order.objects.get().total_amount, 30)
+
+    def test_cart_changed_elsewhere_after_quote_is_repriced(self):
+        quote = self.client.get('/orders/checkout/').context['quote']
+        # A change another process made: no version bump reaches this one
+        CartItem.objects.filter(user=self.user).update(quantity=3)
+        self.assertTrue(self.place_order(quote).json()['success'])
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, 30)
+        self.assertEqual(list(order.items.values_list('quantity', flat=True)), [3])
+
+    def test_coupon_withdrawn_after_quote_is_not_honoured(self):
+        now = timezone.now()
+        for code, change in [('OFF', {'is_active': False}), ('EXPIRED', {'valid_to': now - timedelta(seconds=1)})]:
+            with self.subTest(code=code):
+                with self.captureOnCommitCallbacks(execute=True):
+                    coupon = Coupon.objects.create(
+                        code=code, discount_percent=10,
+                        valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+                    )
+                applied = self.client.post('/orders/apply-coupon/', {'coupon_code': code}).json()
+                self.assertEqual(applied['discount'], 2.0)
+                with self.captureOnCommitCallbacks(execute=True):
+                    Coupon.objects.filter(pk=coupon.pk).update(**change)
+                    coupon.refresh_from_db()
+                    coupon.save()  # the signal moves the coupon version on
+
+                response = self.client.post('/orders/place-order/', {
+                    'address_id': self.address.pk, 'coupon_code': code, 'quote': applied['quote'],
+                })
+                self.assertTrue(response.json()['success'])
+                order = Order.objects.latest('pk')
+                self.assertEqual((order.total_amount, order.discount_amount, order.coupon_code), (20, 0, None))
+                CartItem.objects.create(user=self.user, product=self.product, quantity=2)
+
+    def test_tampered_quote_is_ignored(self):
+        self.assertTrue(self.place_order('not-a-quote').json()['success'])
+        self.assertEqual(Order.objects.get().total_amount, 20)
+
+
+class OrderHistoryTests(OrderTestCase):
+    def test_pages_cost_the_same_and_walk_every_order(self):
+        orders = [
+            Order.objects.create(user=self.user, order_number=f'ORD{n}', address=self.address, total_amount=n)
+            for n in range(30)
+        ]
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=self.product, quantity=1, price=10, total=10)
+            for order in orders for _ in range(3)
+        ])
+
+        seen, url = [], '/orders/my-orders/feed/'
+        while url:
+            with self.assertNumQueries(3):  # session, user and the page
+                page = self.client.get(url).json()
+            seen.extend(page['results'])
+            url = page['next_url']
+        self.assertEqual(len(seen), 30)
+        self.assertEqual([order['id'] for order in seen], [order.pk for order in reversed(orders)])
+        self.assertEqual({order['item_count'] for order in seen}, {3})
+        self.assertEqual(seen[0]['first_item'], 'Laptop Pro')
+
+        with self.assertNumQueries(3):
+            self.assertContains(self.client.get('/orders/my-orders/'), 'Items: 3', count=12)
@@ -7,5 +7,6 @@ urlpatterns = [
     path('place-order/', views.place_order, name='place_order'),
     path('order-confirmation/<int:order_id>/', views.order_confirmation, name='order_confirmation'),
     path('my-orders/', views.order_list, name='order_list'),
+    path('my-orders/feed/', views.order_feed, name='order_feed'),
     path('order-detail/<int:order_id>/', views.order_detail, name='order_detail'),
 ]
@@ -1,117 +1,83 @@
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse
-from django.utils import timezone
-from datetime import timedelta
-from .models import Order, OrderItem, Coupon
+from django.urls import reverse
+from .models import Order, OrderItem
 from .forms import CheckoutForm
-from cart.models import CartItem
+from . import services
+from .coupons import valid_coupon
+from .history import history_page
+from .idempotency import idempotent
+from .pricing import price_cart
 from accounts.models import Address
-import random
+from products.pagination import next_page_url
+from products.reservations import reserve
 
 @login_required(login_url='login')
 def checkout(request):
-    cart_items = CartItem.objects.filter(user=request.user)
+    quote = price_cart(request.user)
     
-    if not cart_items.exists():
+    if not quote:
+        return redirect('view_cart')
+    
+    # Hold the cart's stock while the customer checks out
+    short = reserve(request.user, [(line.product_id, line.quantity) for line in quote.lines])
+    if short:
+        names = ', '.join(item.product.name for item in quote.items if item.product_id in short)
+        messages.error(request, f"Not enough stock left for: {names}")
         return redirect('view_cart')
     
     addresses = Address.objects.filter(user=request.user)
-    total_price = sum(item.total_price for item in cart_items)
     
     context = {
-        'cart_items': cart_items,
+        'cart_items': quote.items,
         'addresses': addresses,
-        'total_price': total_price,
+        'total_price': quote.subtotal,
+        'quote': quote.token,
     }
     return render(request, 'orders/checkout.html', context)
 
 @login_required(login_url='login')
 @require_POST
+@idempotent
 def apply_coupon(request):
     coupon_code = request.POST.get('coupon_code')
-    cart_items = CartItem.objects.filter(user=request.user)
-    total_price = sum(item.total_price for item in cart_items)
     
-    try:
-        coupon = Coupon.objects.get(
-            code=coupon_code,
-            is_active=True,
-            valid_from__lte=timezone.now(),
-            valid_to__gte=timezone.now()
-        )
-        discount = (total_price * coupon.discount_percent) / 100
-        final_total = total_price - discount
-        
-        return JsonResponse({
-            'success': True,
-            'discount': float(discount),
-            'final_total': float(final_total),
-            'coupon_code': coupon_code
-        })
-    except Coupon.DoesNotExist:
+    # Same in-memory check place_order applies, so the two always agree
+    if valid_coupon(coupon_code) is None:
         return JsonResponse({'success': False, 'message': 'Invalid coupon'})
+    
+    quote = price_cart(request.user, coupon_code)
+    
+    return JsonResponse({
+        'success': True,
+        'discount': float(quote.discount),
+        'final_total': float(quote.total),
+        'coupon_code': quote.coupon_code,
+        'quote': quote.token,
+    })
 
 @login_required(login_url='login')
 @require_POST
+@idempotent
 def place_order(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    
-    if not cart_items.exists():
-        return JsonResponse({'success': False, 'message': 'Cart is empty'})
-    
     address_id = request.POST.get('address_id')
     address = get_object_or_404(Address, id=address_id, user=request.user)
     
-    # Calculate total
-    total_amount = sum(item.total_price for item in cart_items)
-    
-    # Apply coupon if exists
-    coupon_code = request.POST.get('coupon_code')
-    discount_amount = 0
-    
-    if coupon_code:
-        try:
-            coupon = Coupon.objects.get(code=coupon_code, is_active=True)
-            discount_amount = (total_amount * coupon.discount_percent) / 100
-            total_amount -= discount_amount
-        except Coupon.DoesNotExist:
-            pass
-    
-    # Create order
-    order_number = f"ORD{random.randint(100000, 999999)}"
-    
-    order = Order.objects.create(
-        user=request.user,
-        order_number=order_number,
-        address=address,
-        total_amount=total_amount,
-        discount_amount=discount_amount,
-        coupon_code=coupon_code,
-        estimated_delivery=timezone.now().date() + timedelta(days=4)
-    )
-    
-    # Create order items
-    for item in cart_items:
-        OrderItem.objects.create(
-            order=order,
-            product=item.product,
-            quantity=item.quantity,
-            price=item.product.current_price,
-            total=item.total_price
+    try:
+        order = services.place_order(
+            request.user, address,
+            coupon_code=request.POST.get('coupon_code'),
+            quote_token=request.POST.get('quote'),
         )
-        
-        # Update stock
-        item.product.stock -= item.quantity
-        item.product.save()
-    
-    # Clear cart
-    cart_items.delete()
+    except services.OrderError as exc:
+        return JsonResponse({'success': False, 'message': str(exc)})
     
     return JsonResponse({
         'success': True,
-        'order_number': order_number,
+        'order_number': order.order_number,
         'redirect_url': f'/orders/order-confirmation/{order.id}/'
     })
 
@@ -124,11 +90,42 @@ def order_confirmation(request, order_id):
 
 @login_required(login_url='login')
 def order_list(request):
-    orders = Order.objects.filter(user=request.user)
+    page = history_page(request.user, request.GET.get('cursor'))
     
-    context = {'orders': orders}
+    context = {
+        'orders': page,
+        'next_page_url': next_page_url(request, page),
+    }
     return render(request, 'orders/order_list.html', context)
 
+@login_required(login_url='login')
+def order_feed(request):
+    # JSON variant of order_list for the mobile app
+    page = history_page(request.user, request.GET.get('cursor'))
+    
+    results = [
+        {
+            'id': order.id,
+            'order_number': order.order_number,
+            'status': order.status,
+            'status_display': order.get_status_display(),
+            'tracking_status': order.tracking_status,
+            'total_amount': str(order.total_amount),
+            'item_count': order.item_count,
+            'first_item': order.first_item_name,
+            'thumbnail': order.thumbnail_url,
+            'created_at': order.created_at.isoformat(),
+            'estimated_delivery': order.estimated_delivery.isoformat() if order.estimated_delivery else None,
+            'url': reverse('order_detail', args=[order.id]),
+        }
+        for order in page
+    ]
+    return JsonResponse({
+        'results': results,
+        'next_cursor': page.next_cursor,
+        'next_url': next_page_url(request, page),
+    })
+
 @login_required(login_url='login')
 def order_detail(request, order_id):
     order = get_object_or_404(Order, id=order_id, user=request.user)
@@ -10,7 +10,7 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ['name', 'category', 'price', 'stock', 'is_trending', 'created_at']
+    list_display = ['name', 'category', 'price', 'stock', 'is_trending', 'trending_rank', 'created_at']
     list_filter = ['category', 'is_trending', 'created_at']
     search_fields = ['name', 'description', 'category__name']
     prepopulated_fields = {'slug': ('name',)}
@@ -0,0 +1,172 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db.models import Sum
+
+from .versioning import get_version, publish_change
+
+# Sorted array of (normalized key, product id) searched with bisect. Every
+# word start of a product name is a key, so "pro" completes "Laptop Pro".
+AUTOCOMPLETE_VERSION = 'autocomplete'
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 20
+MEMO_SIZE = 4096
+
+_SEPARATOR_RE = re.compile(r'[\W_]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _SEPARATOR_RE.sub(' ', text.casefold()).strip()
+
+
+def _keys_for(name):
+    normalized = normalize(name)
+    if not normalized:
+        return []
+    words = normalized.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class Autocompleter:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = []      # sorted [(key, product_id)]
+        self._products = {}     # product_id -> (popularity, name, slug)
+        self._memo = OrderedDict()
+        self.version = None
+
+    def __len__(self):
+        return len(self._products)
+
+    def build(self, rows, popularity, version=None):
+        entries = []
+        products = {}
+        for product_id, name, slug in rows:
+            products[product_id] = (popularity.get(product_id, 0), name, slug)
+            entries.extend((key, product_id) for key in _keys_for(name))
+        entries.sort()
+
+        with self._lock:
+            self._entries = entries
+            self._products = products
+            self._memo.clear()
+            self.version = version
+
+    def add(self, product_id, name, slug):
+        with self._lock:
+            popularity = self._products.get(product_id, (0,))[0]
+            self._discard(product_id)
+            self._products[product_id] = (popularity, name, slug)
+            for key in _keys_for(name):
+                insort(self._entries, (key, product_id))
+                self._forget(key)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._discard(product_id)
+
+    def is_current(self, product_id, name, slug):
+        entry = self._products.get(product_id)
+        return self.version is not None and entry is not None and entry[1:] == (name, slug)
+
+    def complete(self, prefix, limit=DEFAULT_LIMIT):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        limit = min(limit, MAX_LIMIT)
+
+        with self._lock:
+            cached = self._memo.get(prefix)
+            if cached is not None:
+                self._memo.move_to_end(prefix)
+                return cached[:limit]
+
+            start = bisect_left(self._entries, (prefix,))
+            end = bisect_left(self._entries, (prefix + '\uffff',))
+            candidates = {product_id for _, product_id in self._entries[start:end]}
+            ranked = sorted(
+                candidates,
+                key=lambda pid: (-self._products[pid][0], self._products[pid][1]),
+            )[:MAX_LIMIT]
+            results = [
+                {'id': pid, 'name': self._products[pid][1], 'slug': self._products[pid][2]}
+                for pid in ranked
+            ]
+
+            self._memo[prefix] = results
+            if len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+            return results[:limit]
+
+    def _discard(self, product_id):
+        existing = self._products.pop(product_id, None)
+        if existing is None:
+            return
+        for key in _keys_for(existing[1]):
+            position = bisect_left(self._entries, (key, product_id))
+            if position < len(self._entries) and self._entries[position] == (key, product_id):
+                del self._entries[position]
+            self._forget(key)
+
+    def _forget(self, key):
+        # Drop memoized results for every prefix this key answers
+        for end in range(1, len(key) + 1):
+            self._memo.pop(key[:end], None)
+
+
+autocompleter = Autocompleter()
+
+
+def _popularity():
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    totals = (
+        OrderItem.objects.filter(product__isnull=False)
+        .values('product_id')
+        .annotate(sold=Sum('quantity'))
+        .values_list('product_id', 'sold')
+    )
+    return dict(totals)
+
+
+def rebuild_autocompleter(completer=autocompleter):
+    from .models import Product
+
+    version = get_version(AUTOCOMPLETE_VERSION)
+    rows = Product.objects.values_list('id', 'name', 'slug').iterator(chunk_size=2000)
+    completer.build(rows, _popularity(), version=version)
+    return completer
+
+
+def get_autocompleter():
+    if autocompleter.version != get_version(AUTOCOMPLETE_VERSION):
+        rebuild_autocompleter()
+    return autocompleter
+
+
+def autocomplete_version():
+    return get_version(AUTOCOMPLETE_VERSION)
+
+
+def complete(prefix, limit=DEFAULT_LIMIT):
+    return get_autocompleter().complete(prefix, limit=limit)
+
+
+def refresh_product(product):
+    # Stock and price edits don't change completions; skip the version bump
+    # so cached responses stay valid.
+    if autocompleter.is_current(product.pk, product.name, product.slug):
+        return
+    publish_change(
+        autocompleter, AUTOCOMPLETE_VERSION,
+        lambda: autocompleter.add(product.pk, product.name, product.slug),
+    )
+
+
+def forget_product(product_id):
+    publish_change(autocompleter, AUTOCOMPLETE_VERSION, lambda: autocompleter.remove(product_id))
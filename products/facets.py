@@ -0,0 +1,194 @@
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+# Facet counts for the catalog sidebar. All counts for a request come from a
+# single aggregate query with one conditional COUNT per facet value. Counts
+# are disjunctive: a facet's own selection is ignored when counting its
+# values, so ticking a second category still shows what it would add.
+FACET_CACHE_TIMEOUT = 60 * 60 * 24
+FACET_CACHE_PREFIX = 'facets'
+# Largest category id (BigAutoField); larger ones can't exist and overflow the query
+MAX_CATEGORY_ID = 2 ** 63 - 1
+
+PRICE_BUCKETS = [
+    ('0-25', 'Under $25', 0, 25),
+    ('25-50', '$25 - $50', 25, 50),
+    ('50-100', '$50 - $100', 50, 100),
+    ('100-250', '$100 - $250', 100, 250),
+    ('250-500', '$250 - $500', 250, 500),
+    ('500+', '$500 & above', 500, None),
+]
+
+FLAG_FACETS = [
+    ('on_discount', 'On Discount', Q(discount_percentage__gt=0)),
+    ('in_stock', 'In Stock', Q(stock__gt=0)),
+    ('trending', 'Trending', Q(trending_rank__isnull=False)),
+]
+
+FACET_TITLES = {
+    'category': 'Category',
+    'price': 'Price',
+    'on_discount': 'Offers',
+    'in_stock': 'Availability',
+    'trending': 'Popularity',
+}
+
+
+def _bucket_q(lower, upper):
+    condition = Q(effective_price__gte=lower)
+    if upper is not None:
+        condition &= Q(effective_price__lt=upper)
+    return condition
+
+
+class FacetSelection:
+    """The facet values picked in a request's query string."""
+
+    def __init__(self, categories=(), prices=(), flags=()):
+        self.categories = sorted({
+            int(c) for c in categories if str(c).isdecimal() and int(c) <= MAX_CATEGORY_ID
+        })
+        self.prices = [key for key, _, _, _ in PRICE_BUCKETS if key in prices]
+        self.flags = [name for name, _, _ in FLAG_FACETS if name in flags]
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(
+            categories=request.GET.getlist('category'),
+            prices=request.GET.getlist('price'),
+            flags=[name for name, _, _ in FLAG_FACETS if request.GET.get(name)],
+        )
+
+    @property
+    def is_summary(self):
+        # Pages without price or flag filters and at most one category are
+        # served from the cached per-category summary.
+        return not self.prices and not self.flags and len(self.categories) <= 1
+
+    def q(self, exclude=None):
+        condition = Q()
+        if self.categories and exclude != 'category':
+            condition &= Q(category_id__in=self.categories)
+        if self.prices and exclude != 'price':
+            prices = Q()
+            for key, _, lower, upper in PRICE_BUCKETS:
+                if key in self.prices:
+                    prices |= _bucket_q(lower, upper)
+            condition &= prices
+        for name, _, flag_q in FLAG_FACETS:
+            if name in self.flags and exclude != name:
+                condition &= flag_q
+        return condition
+
+    def filter(self, queryset):
+        return queryset.filter(self.q())
+
+
+def count_facets(queryset, selection, category_ids, dimensions=None):
+    """
+    Return {dimension: {value: count}} for every facet value in one query.
+    """
+    aggregates = {}
+    slots = []
+
+    def add(dimension, value, condition):
+        alias = f'facet_{len(slots)}'
+        aggregates[alias] = Count('id', filter=condition & selection.q(exclude=dimension))
+        slots.append((alias, dimension, value))
+
+    wanted = dimensions or ['category', 'price'] + [name for name, _, _ in FLAG_FACETS]
+    if 'category' in wanted:
+        for category_id in category_ids:
+            add('category', category_id, Q(category_id=category_id))
+    if 'price' in wanted:
+        for key, _, lower, upper in PRICE_BUCKETS:
+            add('price', key, _bucket_q(lower, upper))
+    for name, _, flag_q in FLAG_FACETS:
+        if name in wanted:
+            add(name, '1', flag_q)
+
+    counts = {dimension: {} for dimension in wanted}
+    if not aggregates:
+        return counts
+    totals = queryset.aggregate(**aggregates)
+    for alias, dimension, value in slots:
+        counts[dimension][value] = totals[alias]
+    return counts
+
+
+def _summary_key(category_id):
+    return f'{FACET_CACHE_PREFIX}:{category_id or "all"}'
+
+
+def _cached_counts(queryset, category_id, category_ids, dimensions):
+    key = _summary_key(category_id)
+    counts = cache.get(key)
+    if counts is None:
+        selection = FacetSelection(categories=[category_id] if category_id else [])
+        counts = count_facets(queryset, selection, category_ids, dimensions)
+        cache.set(key, counts, FACET_CACHE_TIMEOUT)
+    return counts
+
+
+def summary_counts(queryset, selection, category_ids):
+    # Category counts ignore the category filter, so they always come from
+    # the catalog-wide summary; the other facets from the selected category's.
+    counts = _cached_counts(queryset, None, category_ids, None)
+    if selection.categories:
+        others = [d for d in counts if d != 'category']
+        counts = dict(counts, **_cached_counts(queryset, selection.categories[0], category_ids, others))
+    return counts
+
+
+def invalidate_summaries(category_ids):
+    cache.delete_many([_summary_key(None)] + [_summary_key(c) for c in category_ids if c])
+
+
+def build_facets(queryset, selection, categories, use_summary=True):
+    """
+    Facet groups ready for the sidebar template. `categories` is the list of
+    Category objects shown as options.
+    """
+    category_ids = [c.id for c in categories]
+    if use_summary and selection.is_summary:
+        counts = summary_counts(queryset, selection, category_ids)
+    else:
+        counts = count_facets(queryset, selection, category_ids)
+
+    groups = [{
+        'name': 'category',
+        'title': FACET_TITLES['category'],
+        'options': [
+            {
+                'value': c.id,
+                'label': c.name,
+                'count': counts['category'].get(c.id, 0),
+                'selected': c.id in selection.categories,
+            }
+            for c in categories
+        ],
+    }, {
+        'name': 'price',
+        'title': FACET_TITLES['price'],
+        'options': [
+            {
+                'value': key,
+                'label': label,
+                'count': counts['price'].get(key, 0),
+                'selected': key in selection.prices,
+            }
+            for key, label, _, _ in PRICE_BUCKETS
+        ],
+    }]
+    for name, label, _ in FLAG_FACETS:
+        groups.append({
+            'name': name,
+            'title': FACET_TITLES[name],
+            'options': [{
+                'value': '1',
+                'label': label,
+                'count': counts[name].get('1', 0),
+                'selected': name in selection.flags,
+            }],
+        })
+    return groups
@@ -0,0 +1,297 @@
+import csv
+import json
+from decimal import Context, Decimal, InvalidOperation
+
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import facets
+from .autocomplete import AUTOCOMPLETE_VERSION
+from .models import Category, Product
+from .search import SEARCH_INDEX_VERSION
+from .slugs import SlugAllocator
+from .versioning import CATALOG_VERSION, bump_version, category_version_name
+
+# Streaming product feeds. Rows are read, validated and written one chunk at a
+# time, so memory stays flat however long the feed is. Rows are matched on
+# slug: a known slug updates that product, anything else creates one.
+FEED_FORMATS = ('csv', 'jsonl')
+FEED_FIELDS = [
+    'slug', 'name', 'category', 'description', 'price',
+    'discount_price', 'stock', 'is_trending', 'image',
+]
+# Feed column -> model field that a new product cannot do without
+REQUIRED_FOR_CREATE = {'name': 'name', 'category': 'category_id', 'price': 'price', 'stock': 'stock'}
+DEFAULT_CHUNK_SIZE = 1000
+UPDATE_BATCH_SIZE = 100
+# Column limits, checked per row so one oversized value can't get a whole
+# chunk rejected by the database. Prices are DecimalField(max_digits=10,
+# decimal_places=2); stock is an IntegerField, 32-bit on most backends.
+PRICE_DIGITS = Product._meta.get_field('price').max_digits
+CENT = Decimal('0.01')
+MAX_STOCK = 2 ** 31 - 1
+
+_TRUE = {'1', 'true', 'yes', 'y', 't'}
+_FALSE = {'0', 'false', 'no', 'n', 'f', ''}
+
+
+class FeedRowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    """Yield (line number, row dict) from a CSV or JSON Lines stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_no, FeedRowError(f'invalid JSON: {exc}')
+            continue
+        yield line_no, row if isinstance(row, dict) else FeedRowError('expected a JSON object')
+
+
+def _present(row, field):
+    value = row.get(field)
+    return value is not None and not (isinstance(value, str) and not value.strip())
+
+
+def _decimal(value, field):
+    try:
+        number = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise FeedRowError(f'{field}: not a number')
+    if not number.is_finite() or number < 0:
+        raise FeedRowError(f'{field}: must be a non-negative number')
+    try:
+        # Signals InvalidOperation when the rounded value needs more than PRICE_DIGITS digits
+        return number.quantize(CENT, context=Context(prec=PRICE_DIGITS))
+    except InvalidOperation:
+        raise FeedRowError(f'{field}: must have at most {PRICE_DIGITS} digits')
+
+
+def _integer(value, field):
+    try:
+        number = int(str(value).strip())
+    except ValueError:
+        raise FeedRowError(f'{field}: not an integer')
+    if number < 0:
+        raise FeedRowError(f'{field}: must not be negative')
+    if number > MAX_STOCK:
+        raise FeedRowError(f'{field}: must be at most {MAX_STOCK}')
+    return number
+
+
+def _boolean(value, field):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise FeedRowError(f'{field}: expected true/false')
+
+
+class CategoryResolver:
+    """All categories looked up by name or slug from one query."""
+
+    def __init__(self, create=False):
+        self.create = create
+        self.lookup = {}
+        for pk, name, slug in Category.objects.values_list('pk', 'name', 'slug'):
+            self.lookup[name.casefold()] = pk
+            self.lookup[slug] = pk
+
+    def resolve(self, value):
+        value = str(value).strip()
+        pk = self.lookup.get(value.casefold(), self.lookup.get(value))
+        if pk is None:
+            if not self.create:
+                raise FeedRowError(f'category: unknown category "{value}"')
+            category = Category.objects.create(name=value, slug=slugify(value) or 'category')
+            pk = self.lookup[value.casefold()] = self.lookup[category.slug] = category.pk
+        return pk
+
+
+def clean_row(row, categories):
+    """Validate one feed row into Product field values (only the fields given)."""
+    values = {}
+    if _present(row, 'slug'):
+        slug = str(row['slug']).strip()
+        if slugify(slug) != slug or len(slug) > Product._meta.get_field('slug').max_length:
+            raise FeedRowError(f'slug: "{slug}" is not a valid slug')
+        values['slug'] = slug
+    if _present(row, 'name'):
+        values['name'] = str(row['name']).strip()[:Product._meta.get_field('name').max_length]
+    if _present(row, 'category'):
+        values['category_id'] = categories.resolve(row['category'])
+    if 'description' in row:
+        values['description'] = str(row['description'] or '')
+    if _present(row, 'price'):
+        values['price'] = _decimal(row['price'], 'price')
+    if 'discount_price' in row:
+        values['discount_price'] = _decimal(row['discount_price'], 'discount_price') if _present(row, 'discount_price') else None
+    if _present(row, 'stock'):
+        values['stock'] = _integer(row['stock'], 'stock')
+    if 'is_trending' in row:
+        values['is_trending'] = _boolean(row['is_trending'] or '', 'is_trending')
+    if _present(row, 'image'):
+        values['image'] = str(row['image']).strip()
+
+    price = values.get('price')
+    discount = values.get('discount_price')
+    if price is not None and discount is not None and discount >= price:
+        raise FeedRowError('discount_price: must be below price')
+    return values
+
+
+class FeedImporter:
+    """
+    Upsert feed rows chunk by chunk: one query to find existing slugs, one
+    bulk_create and one bulk_update, all in a transaction per chunk. Bad rows
+    are passed to `on_error(line_no, message)` and skipped.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, create_categories=False, on_error=None):
+        self.chunk_size = chunk_size
+        self.categories = CategoryResolver(create=create_categories)
+        self.on_error = on_error or (lambda line_no, message: None)
+        self.allocator = None
+        self.created = self.updated = self.failed = 0
+        self.touched_categories = set()
+
+    def run(self, rows):
+        chunk = []
+        for line_no, row in rows:
+            if isinstance(row, FeedRowError):
+                self._fail(line_no, row)
+                continue
+            try:
+                chunk.append((line_no, clean_row(row, self.categories)))
+            except FeedRowError as exc:
+                self._fail(line_no, exc)
+                continue
+            if len(chunk) >= self.chunk_size:
+                self._write(chunk)
+                chunk = []
+        if chunk:
+            self._write(chunk)
+        if self.created or self.updated:
+            publish_bulk_change(self.touched_categories)
+        return self
+
+    def _fail(self, line_no, error):
+        self.failed += 1
+        self.on_error(line_no, str(error))
+
+    def _write(self, chunk):
+        slugs = {values['slug'] for _, values in chunk if 'slug' in values}
+        existing = {p.slug: p for p in Product.objects.filter(slug__in=slugs)}
+        now = timezone.now()
+        to_create, to_update = {}, {}
+        fields = set()
+        categories = set()
+        written = []
+        if any('slug' not in values for _, values in chunk):
+            self._allocator()
+
+        for line_no, values in chunk:
+            slug = values.get('slug')
+            product = existing.get(slug) or to_create.get(slug)
+            if product is None:
+                missing = [column for column, field in REQUIRED_FOR_CREATE.items() if field not in values]
+                if missing:
+                    self._fail(line_no, f'new product needs {", ".join(missing)}')
+                    continue
+                product = Product(**{'image': '', 'description': '', **values})
+                if slug is None:
+                    product.slug = self.allocator.allocate(product.name)
+                elif self.allocator is not None:
+                    self.allocator.reserve(slug)
+                to_create[product.slug] = product
+            else:
+                # Unchanged rows (e.g. re-importing an export) cost no writes
+                changed = [f for f, value in values.items() if getattr(product, f) != value]
+                if product.pk and changed:
+                    categories.add(product.category_id)
+                    fields.update(changed)
+                    to_update[product.pk] = product
+                for field in changed:
+                    setattr(product, field, values[field])
+                if not changed:
+                    continue
+            categories.add(product.category_id)
+            written.append(line_no)
+
+        if not written:
+            return
+        try:
+            with transaction.atomic():
+                if to_create:
+                    Product.objects.bulk_create(to_create.values())
+                if to_update:
+                    for product in to_update.values():
+                        product.updated_at = now
+                    fields.discard('slug')
+                    # Small batches: bulk_update's CASE expressions grow with every row
+                    Product.objects.bulk_update(
+                        to_update.values(), sorted(fields) + ['updated_at'], batch_size=UPDATE_BATCH_SIZE,
+                    )
+        except DatabaseError as exc:
+            # The whole chunk rolled back; report it and carry on with the next
+            for line_no in written:
+                self._fail(line_no, f'chunk rejected by the database: {exc}')
+            return
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        self.touched_categories |= categories
+
+    def _allocator(self):
+        # Only feeds with slug-less rows pay for loading every existing slug
+        if self.allocator is None:
+            self.allocator = SlugAllocator(Product, preload=True)
+        return self.allocator
+
+
+def publish_bulk_change(category_ids):
+    # bulk_create/bulk_update send no signals; move every derived cache on
+    for name in (SEARCH_INDEX_VERSION, AUTOCOMPLETE_VERSION, CATALOG_VERSION):
+        bump_version(name)
+    for category_id in category_ids:
+        bump_version(category_version_name(category_id))
+    facets.invalidate_summaries(category_ids)
+
+
+def export_rows(queryset=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield feed rows for `queryset` (default: every product) without loading it all."""
+    queryset = Product.objects.all() if queryset is None else queryset
+    columns = [
+        'slug', 'name', 'category__name', 'description', 'price',
+        'discount_price', 'stock', 'is_trending', 'image',
+    ]
+    for values in queryset.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size):
+        yield dict(zip(FEED_FIELDS, values))
+
+
+def write_rows(stream, rows, fmt):
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FEED_FIELDS)
+        writer.writeheader()
+    count = 0
+    for row in rows:
+        row = {k: str(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+        if fmt == 'csv':
+            writer.writerow({k: '' if v is None else v for k, v in row.items()})
+        else:
+            stream.write(json.dumps(row, ensure_ascii=False) + '\n')
+        count += 1
+    return count
@@ -0,0 +1,142 @@
+import contextlib
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+
+# Resized JPEG and WebP copies of product images for srcset. Derivatives are
+# addressed by the SHA-256 of the original, so re-uploading the same picture
+# (or re-running the backfill) reuses what is already on disk. Each file is
+# named after its real width: originals are never upscaled, so widths past a
+# small original collapse into one copy at the original's own width.
+DERIVATIVE_WIDTHS = (320, 640, 960)
+DERIVATIVE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVE_DIR = 'derivatives'
+HASH_CHUNK_SIZE = 1024 * 1024
+# EXIF orientations that turn the picture by 90 degrees
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def digest_file(fileobj):
+    digest = hashlib.sha256()
+    if hasattr(fileobj, 'chunks'):
+        for chunk in fileobj.chunks():
+            digest.update(chunk)
+        fileobj.seek(0)
+    else:
+        for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def derivative_dir(digest):
+    return f'{DERIVATIVE_DIR}/{digest[:2]}/{digest}'
+
+
+def derivative_name(digest, width, ext):
+    return f'{derivative_dir(digest)}/{width}.{ext}'
+
+
+def derivative_widths(original_width):
+    return sorted({min(width, original_width) for width in DERIVATIVE_WIDTHS})
+
+
+def _stored_widths(directory, ext):
+    # Widths of the finished `ext` derivatives in `directory`; in-flight .tmp files don't match
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    suffix = f'.{ext}'
+    return sorted(
+        int(name[:-len(suffix)]) for name in names
+        if name.endswith(suffix) and name[:-len(suffix)].isdigit()
+    )
+
+
+def build_derivatives(source_path, media_root, digest=None):
+    """
+    Write every missing derivative of `source_path` under `media_root` and
+    return the source digest. Runs in pool workers, so it only touches the
+    filesystem and Pillow.
+    """
+    from PIL import Image, ImageOps
+
+    if digest is None:
+        with open(source_path, 'rb') as source:
+            digest = digest_file(source)
+
+    directory = os.path.join(media_root, derivative_dir(digest))
+    # Opening reads only the header; the pixels load when there is work to do
+    with Image.open(source_path) as original:
+        rotated = original.getexif().get(EXIF_ORIENTATION) in ROTATED_ORIENTATIONS
+        widths = derivative_widths(original.height if rotated else original.width)
+        wanted = []
+        for ext in DERIVATIVE_FORMATS:
+            stored = _stored_widths(directory, ext)
+            # Files at widths this original can't have (older builds upscaled in name only)
+            for width in set(stored) - set(widths):
+                with contextlib.suppress(FileNotFoundError):  # another worker got there first
+                    os.remove(os.path.join(media_root, derivative_name(digest, width, ext)))
+            wanted += [(width, ext) for width in widths if width not in stored]
+        if not wanted:
+            return digest
+
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'L'):
+            original = original.convert('RGB')
+
+        for width, ext in wanted:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+
+            path = os.path.join(media_root, derivative_name(digest, width, ext))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            image_format, options = DERIVATIVE_FORMATS[ext]
+            partial = f'{path}.{os.getpid()}.tmp'
+            resized.save(partial, image_format, **options)
+            os.replace(partial, path)
+    return digest
+
+
+def derivative_srcset(digest, ext):
+    if not digest:
+        return ''
+    widths = _stored_widths(os.path.join(str(settings.MEDIA_ROOT), derivative_dir(digest)), ext)
+    return ', '.join(f'{settings.MEDIA_URL}{derivative_name(digest, width, ext)} {width}w' for width in widths)
+
+
+def get_pool(max_workers=None):
+    # Spawned rather than forked: request processes hold DB connections and threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = max_workers or getattr(settings, 'IMAGE_DERIVATIVE_WORKERS', 2)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+        return _pool
+
+
+def schedule_derivatives(product, on_done=None):
+    """
+    Queue derivative generation for a saved product whose image_digest is
+    set. Returns the future; `on_done` is called in this process when the
+    files exist.
+    """
+    if not product.image or not product.image_digest:
+        return None
+    future = get_pool().submit(
+        build_derivatives, product.image.path, str(settings.MEDIA_ROOT), product.image_digest,
+    )
+    if on_done is not None:
+        future.add_done_callback(lambda f: f.exception() is None and on_done())
+    return future
@@ -0,0 +1,61 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from products.images import build_derivatives
+from products.models import Product
+from products.versioning import CATALOG_VERSION, bump_version, category_version_name
+
+
+class Command(BaseCommand):
+    help = "Generate resized JPEG/WebP derivatives for every product image"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Worker processes')
+
+    def handle(self, *args, **options):
+        media_root = str(settings.MEDIA_ROOT)
+        products = {}
+        for product in Product.objects.exclude(image='').only('pk', 'category_id', 'image', 'image_digest', 'updated_at'):
+            if os.path.exists(product.image.path):
+                products[product.pk] = product
+            else:
+                self.stdout.write(self.style.WARNING(f"MISSING {product.pk}: {product.image.name}"))
+
+        started = time.perf_counter()
+        changed, failed = [], 0
+        now = timezone.now()
+        with ProcessPoolExecutor(max_workers=options['workers'], mp_context=get_context('spawn')) as pool:
+            futures = {
+                pool.submit(build_derivatives, product.image.path, media_root): pk
+                for pk, product in products.items()
+            }
+            for future in as_completed(futures):
+                product = products[futures[future]]
+                try:
+                    digest = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"FAILED {product.pk}: {exc}"))
+                    continue
+                if digest != product.image_digest:
+                    product.image_digest = digest
+                    product.updated_at = now
+                    changed.append(product)
+
+        # updated_at moves so cached product cards re-render with srcset;
+        # bulk_update sends no signals, so move the fragments around them on too
+        Product.objects.bulk_update(changed, ['image_digest', 'updated_at'], batch_size=500)
+        if changed:
+            bump_version(CATALOG_VERSION)
+            for category_id in {product.category_id for product in changed}:
+                bump_version(category_version_name(category_id))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {len(products) - failed} images ({len(changed)} new digests, {failed} failed) in {elapsed:.2f}s"
+        ))
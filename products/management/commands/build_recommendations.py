@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.recommendations import TOP_N, build_recommendations
+
+
+class Command(BaseCommand):
+    help = "Rebuild co-purchase recommendations from order history"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-n', type=int, default=TOP_N, help='Recommendations kept per product')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products, rows = build_recommendations(top_n=options['top_n'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {rows} recommendations for {products} products in {elapsed:.2f}s"
+        ))
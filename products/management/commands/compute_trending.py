@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.trending import TRENDING_SIZE, compute_trending
+
+
+class Command(BaseCommand):
+    help = "Rank trending products from recent sales (run periodically, e.g. every 15 minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=TRENDING_SIZE, help='Products kept in the trending list')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        ranked = compute_trending(size=options['size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Ranked {len(ranked)} trending products in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,38 @@
+import os
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.feeds import DEFAULT_CHUNK_SIZE, FEED_FORMATS, export_rows, write_rows
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Stream every product to a CSV or JSON Lines feed"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help="Output file, or '-' for stdout")
+        parser.add_argument('--format', choices=FEED_FORMATS, help='Defaults to the file extension, or csv')
+        parser.add_argument('--category', help='Only export this category (slug)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows fetched per round trip')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower() or 'csv'
+        if fmt not in FEED_FORMATS:
+            raise CommandError(f"Cannot tell the feed format of {path!r}; pass --format")
+
+        queryset = Product.objects.all()
+        if options['category']:
+            queryset = queryset.filter(category__slug=options['category'])
+        rows = export_rows(queryset, chunk_size=max(1, options['chunk_size']))
+
+        if path == '-':
+            write_rows(sys.stdout, rows, fmt)
+            return
+        try:
+            with open(path, 'w', newline='', encoding='utf-8') as stream:
+                count = write_rows(stream, rows, fmt)
+        except OSError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} products to {path}"))
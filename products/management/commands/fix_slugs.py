@@ -1,25 +1,55 @@
 from django.core.management.base import BaseCommand
-from django.utils.text import slugify
+from django.db import transaction
+from django.utils import timezone
+from products.autocomplete import AUTOCOMPLETE_VERSION
 from products.models import Product
+from products.slugs import SlugAllocator
+from products.versioning import CATALOG_VERSION, bump_version, category_version_name
 
 class Command(BaseCommand):
     help = "Normalize product slugs to URL-safe values"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows written per UPDATE')
+
     def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # All existing slugs are loaded once; candidates are checked in memory
+        allocator = SlugAllocator(Product, preload=True)
+        now = timezone.now()
+        changed = []
+        categories = set()
         updated = 0
-        for p in Product.objects.all():
-            new_slug = slugify(p.name)
-            slug = new_slug
-            n = 1
-            while Product.objects.filter(slug=slug).exclude(pk=p.pk).exists():
-                slug = f"{new_slug}-{n}"
-                n += 1
-            if p.slug != slug:
-                p.slug = slug
-                p.save()
-                updated += 1
-                self.stdout.write(self.style.SUCCESS(f"UPDATED {p.pk} -> {slug}"))
+
+        with transaction.atomic():
+            for p in Product.objects.only('pk', 'name', 'slug', 'category_id', 'updated_at').order_by('pk').iterator(chunk_size=batch_size):
+                slug = allocator.allocate(p.name, pk=p.pk)
+                if p.slug != slug:
+                    p.slug = slug
+                    p.updated_at = now
+                    changed.append(p)
+                    categories.add(p.category_id)
+                    self.stdout.write(self.style.SUCCESS(f"UPDATED {p.pk} -> {slug}"))
+                if len(changed) >= batch_size:
+                    updated += self._flush(changed)
+            updated += self._flush(changed)
+
+        if updated:
+            # bulk_update sends no signals; move cached completions and the
+            # fragments linking to the old slugs (home page, category pages) on by hand
+            bump_version(AUTOCOMPLETE_VERSION)
+            bump_version(CATALOG_VERSION)
+            for category_id in categories:
+                bump_version(category_version_name(category_id))
+
         if not updated:
             self.stdout.write(self.style.WARNING('No slugs needed updating'))
         else:
             self.stdout.write(self.style.SUCCESS(f"Total updated: {updated}"))
+
+    def _flush(self, changed):
+        count = len(changed)
+        if count:
+            Product.objects.bulk_update(changed, ['slug', 'updated_at'])
+            changed.clear()
+        return count
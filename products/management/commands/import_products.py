@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.feeds import DEFAULT_CHUNK_SIZE, FEED_FORMATS, FeedImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = "Create or update products from a CSV or JSON Lines feed, matched on slug"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' for stdin")
+        parser.add_argument('--format', choices=FEED_FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows written per transaction')
+        parser.add_argument('--create-categories', action='store_true', help='Create unknown categories instead of rejecting the row')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in FEED_FORMATS:
+            raise CommandError(f"Cannot tell the feed format of {path!r}; pass --format")
+
+        def report(line_no, message):
+            self.stderr.write(self.style.ERROR(f"line {line_no}: {message}"))
+
+        started = time.perf_counter()
+        importer = FeedImporter(
+            chunk_size=max(1, options['chunk_size']),
+            create_categories=options['create_categories'],
+            on_error=report,
+        )
+        if path == '-':
+            importer.run(read_rows(sys.stdin, fmt))
+        else:
+            try:
+                with open(path, newline='', encoding='utf-8-sig') as stream:
+                    importer.run(read_rows(stream, fmt))
+            except OSError as exc:
+                raise CommandError(str(exc))
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {importer.created}, updated {importer.updated}, "
+            f"rejected {importer.failed} rows in {elapsed:.2f}s"
+        ))
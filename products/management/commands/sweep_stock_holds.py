@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.reservations import SWEEP_BATCH_SIZE, sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired checkout stock holds (run periodically, e.g. every few minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=SWEEP_BATCH_SIZE, help='Holds deleted per statement')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = sweep_expired(batch_size=max(1, options['batch_size']))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired holds in {elapsed:.2f}s"))
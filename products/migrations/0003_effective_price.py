@@ -0,0 +1,65 @@
+# Generated by Django 4.2.16 on 2026-10-18 10:05
+
+from django.db import migrations, models
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Floor
+
+
+def backfill_pricing(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.update(
+        effective_price=Case(
+            When(discount_price__gt=0, then=F('discount_price')),
+            default=F('price'),
+        ),
+        discount_percentage=Case(
+            When(
+                price__gt=0,
+                discount_price__gt=0,
+                then=Cast(Floor((F('price') - F('discount_price')) * 100 / F('price')), IntegerField()),
+            ),
+            default=Value(0),
+            output_field=IntegerField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_price_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_cat_price_idx',
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='discount_percentage',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=10),
+        ),
+        migrations.RunPython(backfill_pricing, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['effective_price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['discount_percentage', 'id'], name='product_discount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'effective_price', 'id'], name='product_cat_price_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.16 on 2026-10-18 10:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def rank_flagged_products(apps, schema_editor):
+    # Until compute_trending first runs, keep showing the manually flagged products
+    Product = apps.get_model('products', 'Product')
+    flagged = Product.objects.filter(is_trending=True).order_by('-created_at').values_list('id', flat=True)
+    for rank, product_id in enumerate(flagged):
+        Product.objects.filter(pk=product_id).update(trending_rank=rank)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_image_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='trending_rank',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='ProductSalesBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_buckets', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='sales_bucket_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='productsalesbucket',
+            constraint=models.UniqueConstraint(fields=('product', 'day'), name='unique_sales_bucket'),
+        ),
+        migrations.RunPython(rank_flagged_products, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,85 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Floor
+from django.db.models.lookups import GreaterThan
 from django.core.validators import MinValueValidator
-from django.utils.text import slugify
 import re
 
+from .images import digest_file
+from .slugs import allocate_slug
+
+# Source fields of the denormalized pricing columns
+PRICING_SOURCE_FIELDS = {'price', 'discount_price'}
+PRICING_FIELDS = ['effective_price', 'discount_percentage']
+
+def _as_decimal(value):
+    if value in (None, ''):
+        return None
+    return Decimal(str(value))
+
+def _price_operand(value):
+    if hasattr(value, 'resolve_expression'):
+        return value
+    return Value(_as_decimal(value), output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
+def pricing_expressions(price=F('price'), discount_price=F('discount_price')):
+    # SQL counterpart of Product.refresh_pricing, for queryset updates
+    price = _price_operand(price)
+    discount = _price_operand(discount_price)
+    decimal = models.DecimalField(max_digits=10, decimal_places=2)
+    effective_price = Case(
+        When(GreaterThan(discount, 0), then=discount),
+        default=price,
+        output_field=decimal,
+    )
+    discount_percentage = Case(
+        When(
+            GreaterThan(price, 0),
+            then=Case(
+                When(
+                    GreaterThan(discount, 0),
+                    then=Cast(Floor((price - discount) * 100 / price), IntegerField()),
+                ),
+                default=Value(0),
+            ),
+        ),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return {'effective_price': effective_price, 'discount_percentage': discount_percentage}
+
+class ProductQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Keep the pricing columns in step with price/discount_price in the same statement
+        if PRICING_SOURCE_FIELDS & kwargs.keys():
+            kwargs.update(pricing_expressions(
+                price=kwargs.get('price', F('price')),
+                discount_price=kwargs.get('discount_price', F('discount_price')),
+            ))
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.refresh_pricing()
+        update_fields = kwargs.get('update_fields')
+        if update_fields and PRICING_SOURCE_FIELDS & set(update_fields):
+            kwargs['update_fields'] = list(update_fields) + [f for f in PRICING_FIELDS if f not in update_fields]
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if PRICING_SOURCE_FIELDS & set(fields):
+            for obj in objs:
+                obj.refresh_pricing()
+            fields = list(fields) + [f for f in PRICING_FIELDS if f not in fields]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def sync_pricing(self):
+        return super().update(**pricing_expressions())
+
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(unique=True)
@@ -25,34 +102,124 @@ class Product(models.Model):
     discount_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     stock = models.IntegerField(validators=[MinValueValidator(0)])
     image = models.ImageField(upload_to='products/')
+    # SHA-256 of the image file; names its resized derivatives (see products.images)
+    image_digest = models.CharField(max_length=64, blank=True, editable=False)
+    # Manual override: pinned to the top of the computed trending list
     is_trending = models.BooleanField(default=False)
+    # Position in the trending list written by compute_trending; NULL when not trending
+    trending_rank = models.PositiveSmallIntegerField(null=True, blank=True, db_index=True, editable=False)
+    # Denormalized from price/discount_price so sorting and filtering run in SQL
+    effective_price = models.DecimalField(max_digits=10, decimal_places=2, default=0, editable=False)
+    discount_percentage = models.IntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored category so signals can invalidate both sides of a move
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        instance._loaded_image_digest = instance.__dict__.get('image_digest')
+        instance._loaded_is_trending = instance.__dict__.get('is_trending')
+        return instance
+
     def save(self, *args, **kwargs):
         # Ensure slug is URL-safe; slugify name or provided slug and ensure uniqueness
         if not self.slug or re.search(r'[^-a-zA-Z0-9_]', str(self.slug)):
-            base = slugify(self.name)
-            slug_candidate = base
-            counter = 1
-            while Product.objects.filter(slug=slug_candidate).exclude(pk=self.pk).exists():
-                slug_candidate = f"{base}-{counter}"
-                counter += 1
-            self.slug = slug_candidate
+            self.slug = allocate_slug(Product, self.name, pk=self.pk)
+        if self.image and not self.image._committed:
+            self.image_digest = digest_file(self.image.file)
+        self.refresh_pricing()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and PRICING_SOURCE_FIELDS & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | set(PRICING_FIELDS)
         super().save(*args, **kwargs)
 
-    @property
-    def discount_percentage(self):
-        if self.discount_price:
-            return int(((self.price - self.discount_price) / self.price) * 100)
-        return 0
+    def refresh_pricing(self):
+        price = _as_decimal(self.price) or Decimal('0')
+        discount = _as_decimal(self.discount_price)
+        self.effective_price = discount if discount else price
+        if discount and price:
+            self.discount_percentage = int(((price - discount) / price) * 100)
+        else:
+            self.discount_percentage = 0
 
     @property
     def current_price(self):
         return self.discount_price if self.discount_price else self.price
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        # Keyset pagination orderings; descending scans walk these backwards
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+            models.Index(fields=['effective_price', 'id'], name='product_price_idx'),
+            models.Index(fields=['discount_percentage', 'id'], name='product_discount_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_cat_created_idx'),
+            models.Index(fields=['category', 'effective_price', 'id'], name='product_cat_price_idx'),
+        ]
+
+
+class ProductRecommendation(models.Model):
+    # Top-N co-purchased products per product, rebuilt by build_recommendations
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    score = models.PositiveIntegerField(default=0)
+    rank = models.PositiveSmallIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.score})"
+
+    class Meta:
+        ordering = ['product', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'recommended'], name='unique_recommendation'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'rank'], name='recommendation_rank_idx'),
+        ]
+
+
+class ProductSalesBucket(models.Model):
+    # Units sold per product per day; the sliding window behind trending scores
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales_buckets')
+    day = models.DateField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.product_id} @ {self.day}: {self.quantity}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'day'], name='unique_sales_bucket'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='sales_bucket_day_idx'),
+        ]
+
+
+class StockReservation(models.Model):
+    # Stock held for a user between entering checkout and placing the order
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey('auth.User', on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.user_id} until {self.expires_at}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_stock_reservation'),
+        ]
+        indexes = [
+            # Active holds per product are summed from this index alone
+            models.Index(fields=['product', 'expires_at', 'quantity'], name='reservation_active_idx'),
+            models.Index(fields=['expires_at'], name='reservation_expiry_idx'),
+        ]
@@ -0,0 +1,135 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+# Keyset (cursor) pagination: the cursor holds the sort key values of the last
+# row on the page, and the next page is "rows strictly after that key". With a
+# matching composite index every page costs the same as the first one.
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+# Every backend binds integer parameters as signed 64-bit
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(values):
+    raw = json.dumps([_encode_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` over `ordering`, a tuple of field names such as
+    ('-created_at', '-id'). The last field must be unique.
+    """
+
+    def __init__(self, queryset, ordering, page_size=DEFAULT_PAGE_SIZE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        values = self.parse_cursor(cursor) if cursor else None
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+
+        rows = list(queryset[:self.page_size + 1])
+        next_cursor = None
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            next_cursor = encode_cursor([self._value(rows[-1], field) for field in self.fields])
+        return KeysetPage(rows, next_cursor)
+
+    def _value(self, obj, field):
+        if isinstance(obj, dict):
+            return obj[field]
+        return getattr(obj, field)
+
+    def _output_field(self, name):
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            # Annotations (e.g. a search rank) have no model field
+            return self.queryset.query.annotations[name].output_field
+
+    def parse_cursor(self, cursor):
+        """The sort key in `cursor`, or None if it isn't a valid key for this ordering."""
+        values = decode_cursor(cursor)
+        if values is None or len(values) != len(self.fields):
+            return None
+        parsed = []
+        for name, value in zip(self.fields, values):
+            # Cursors come from the client: anything that isn't a plain value
+            # of the column's type and range means "first page", not a 500
+            if value is None or isinstance(value, (dict, list)):
+                return None
+            field = self._output_field(name)
+            try:
+                value = field.to_python(value)
+                field.run_validators(value)
+            except (ValidationError, TypeError, ValueError, ArithmeticError):
+                return None
+            if isinstance(value, int) and not MIN_INTEGER <= value <= MAX_INTEGER:
+                return None
+            parsed.append(value)
+        return parsed
+
+    def _after(self, values):
+        # (a, b) after (x, y)  <=>  a > x OR (a = x AND b > y), with the
+        # comparison flipped for descending fields.
+        condition = Q()
+        for position, name in enumerate(self.ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            term = Q(**{f'{self.fields[position]}__{lookup}': values[position]})
+            for earlier in range(position):
+                term &= Q(**{self.fields[earlier]: values[earlier]})
+            condition |= term
+        return condition
+
+
+def next_page_url(request, page):
+    # Current URL with the cursor swapped for the next page's
+    if not page.has_next:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = page.next_cursor
+    return f"{request.path}?{params.urlencode()}"
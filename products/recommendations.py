@@ -0,0 +1,162 @@
+import heapq
+from collections import Counter, defaultdict
+from itertools import chain, groupby, permutations
+from operator import itemgetter
+
+from django.apps import apps
+from django.db import transaction
+
+from .models import Product, ProductRecommendation
+
+try:
+    import numpy as np
+except ImportError:  # optional; co-purchases are counted in Python instead
+    np = None
+
+TOP_N = 10
+# Very large orders (bulk buys) would add O(n^2) pairs of little signal
+MAX_ITEMS_PER_ORDER = 50
+WRITE_BATCH_SIZE = 1000
+
+
+def count_co_purchases(pairs):
+    """
+    Count how often two products appear in the same order. `pairs` is an
+    iterable of (order_id, product_id) sorted by order_id. Returns a Counter
+    of (product_id, other_id) -> orders, with both directions of each pair.
+    """
+    if np is None:
+        return _count_in_python(pairs)
+    return _count_with_numpy(pairs)
+
+
+def _count_in_python(pairs):
+    counts = Counter()
+    for _, rows in groupby(pairs, key=itemgetter(0)):
+        basket = sorted({product_id for _, product_id in rows})[:MAX_ITEMS_PER_ORDER]
+        if len(basket) > 1:
+            counts.update(permutations(basket, 2))
+    return counts
+
+
+def _count_with_numpy(pairs):
+    rows = np.fromiter(chain.from_iterable(pairs), dtype=np.int64).reshape(-1, 2)
+    # One row per distinct (order, product), in product order within each order
+    rows = np.unique(rows, axis=0)
+    orders, products = rows[:, 0], rows[:, 1]
+    if len(rows) < 2:
+        return Counter()
+
+    # Keep each basket's first MAX_ITEMS_PER_ORDER products, as the Python path does
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(rows)])
+    position = np.arange(len(rows)) - np.repeat(starts, sizes)
+    keep = position < MAX_ITEMS_PER_ORDER
+    orders, products = orders[keep], products[keep]
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+
+    # Pair every row with every row of its basket, then drop the self-pairs
+    basket_size = np.repeat(sizes, sizes)
+    left = np.repeat(np.arange(len(orders)), basket_size)
+    first = np.repeat(np.repeat(starts, sizes), basket_size)
+    offset = np.arange(len(left)) - np.repeat(np.cumsum(basket_size) - basket_size, basket_size)
+    right = first + offset
+    distinct = left != right
+    co_purchased = np.stack([products[left[distinct]], products[right[distinct]]], axis=1)
+
+    counted, counts = np.unique(co_purchased, axis=0, return_counts=True)
+    return Counter(dict(zip(map(tuple, counted.tolist()), counts.tolist())))
+
+
+def top_neighbours(counts, top_n=TOP_N):
+    neighbours = defaultdict(list)
+    for (product_id, other_id), score in counts.items():
+        neighbours[product_id].append((score, -other_id))
+    return {
+        product_id: [(-negated, score) for score, negated in heapq.nlargest(top_n, scored)]
+        for product_id, scored in neighbours.items()
+    }
+
+
+def build_recommendations(top_n=TOP_N, chunk_size=5000):
+    """Rebuild the whole recommendation table from order history."""
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    pairs = (
+        OrderItem.objects.filter(product__isnull=False)
+        .order_by('order_id')
+        .values_list('order_id', 'product_id')
+        .iterator(chunk_size=chunk_size)
+    )
+    neighbours = top_neighbours(count_co_purchases(pairs), top_n)
+
+    rows = [
+        ProductRecommendation(product_id=product_id, recommended_id=other_id, score=score, rank=rank)
+        for product_id, ranked in neighbours.items()
+        for rank, (other_id, score) in enumerate(ranked)
+    ]
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductRecommendation.objects.bulk_create(rows, batch_size=WRITE_BATCH_SIZE)
+    return len(neighbours), len(rows)
+
+
+def record_order(product_ids, top_n=TOP_N):
+    """
+    Fold one new order into the stored top-N lists. Pairs that fell out of a
+    top-N list are not tracked, so this approximates a rebuild until the next
+    build_recommendations run.
+    """
+    basket = sorted(set(product_ids))[:MAX_ITEMS_PER_ORDER]
+    if len(basket) < 2:
+        return
+
+    with transaction.atomic():
+        stored = ProductRecommendation.objects.select_for_update().filter(product_id__in=basket)
+        lists = defaultdict(dict)
+        for row in stored:
+            lists[row.product_id][row.recommended_id] = row
+
+        for product_id, other_id in permutations(basket, 2):
+            row = lists[product_id].get(other_id)
+            if row is None:
+                row = ProductRecommendation(product_id=product_id, recommended_id=other_id)
+                lists[product_id][other_id] = row
+            row.score += 1
+
+        to_create, to_update, to_delete = [], [], []
+        for product_id in basket:
+            ranked = sorted(lists[product_id].values(), key=lambda r: (-r.score, r.recommended_id))
+            for rank, row in enumerate(ranked):
+                row.rank = rank
+                if rank >= top_n:
+                    if row.pk:
+                        to_delete.append(row.pk)
+                elif row.pk:
+                    to_update.append(row)
+                else:
+                    to_create.append(row)
+
+        if to_delete:
+            ProductRecommendation.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ProductRecommendation.objects.bulk_update(to_update, ['score', 'rank'], batch_size=WRITE_BATCH_SIZE)
+        if to_create:
+            ProductRecommendation.objects.bulk_create(to_create, batch_size=WRITE_BATCH_SIZE)
+
+
+def related_products(product, limit=4):
+    """Co-purchased products first, topped up from the same category."""
+    related = list(
+        Product.objects.select_related('category')
+        .filter(recommended_for__product=product)
+        .order_by('recommended_for__rank')[:limit]
+    )
+    if len(related) < limit:
+        seen = [p.id for p in related] + [product.id]
+        related += list(
+            Product.objects.select_related('category')
+            .filter(category_id=product.category_id)
+            .exclude(id__in=seen)[:limit - len(related)]
+        )
+    return related
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+# Checkout holds: entering checkout reserves the cart's quantities for a few
+# minutes so concurrent shoppers can't buy the same units. Available stock is
+# on-hand stock minus other users' unexpired holds, summed from the
+# (product, expires_at, quantity) index. Expired holds are simply ignored
+# until sweep_stock_holds deletes them.
+DEFAULT_HOLD_SECONDS = 15 * 60
+SWEEP_BATCH_SIZE = 1000
+
+
+def hold_duration():
+    return timedelta(seconds=getattr(settings, 'STOCK_HOLD_SECONDS', DEFAULT_HOLD_SECONDS))
+
+
+def held_quantities(product_ids, exclude_user=None, now=None):
+    holds = StockReservation.objects.filter(product_id__in=product_ids, expires_at__gt=now or timezone.now())
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    return dict(holds.values('product_id').annotate(held=Sum('quantity')).values_list('product_id', 'held'))
+
+
+def available_stock(product_ids, exclude_user=None, for_update=False):
+    """{product_id: units that can still be bought}, ignoring `exclude_user`'s own holds."""
+    product_ids = list(product_ids)
+    products = Product.objects.filter(id__in=product_ids)
+    if for_update:
+        products = products.select_for_update()
+    stock = dict(products.values_list('id', 'stock'))
+    held = held_quantities(stock, exclude_user=exclude_user)
+    return {pk: max(0, on_hand - held.get(pk, 0)) for pk, on_hand in stock.items()}
+
+
+def unheld_stock(product, exclude_user=None):
+    """available_stock() for one already-loaded product; only the holds are queried."""
+    held = held_quantities([product.pk], exclude_user=exclude_user).get(product.pk, 0)
+    return max(0, product.stock - held)
+
+
+def shortages(lines, available):
+    """Product ids from (product_id, quantity) lines that exceed `available`."""
+    return [pk for pk, quantity in lines if quantity > available.get(pk, 0)]
+
+
+def reserve(user, lines):
+    """
+    Replace `user`'s holds with holds for (product_id, quantity) `lines`.
+    Returns the product ids that are short of stock; nothing is held then.
+    """
+    lines = list(lines)
+    with transaction.atomic():
+        # Locking the products serializes concurrent reservations of the same units
+        available = available_stock([pk for pk, _ in lines], exclude_user=user, for_update=True)
+        short = shortages(lines, available)
+        if short:
+            return short
+        expires_at = timezone.now() + hold_duration()
+        StockReservation.objects.filter(user=user).delete()
+        StockReservation.objects.bulk_create([
+            StockReservation(user=user, product_id=pk, quantity=quantity, expires_at=expires_at)
+            for pk, quantity in lines
+        ])
+    return []
+
+
+def release(user):
+    StockReservation.objects.filter(user=user).delete()
+
+
+def sweep_expired(batch_size=SWEEP_BATCH_SIZE, now=None):
+    """Delete expired holds in batches of `batch_size`; returns how many went."""
+    now = now or timezone.now()
+    expired = StockReservation.objects.filter(expires_at__lte=now)
+    deleted = 0
+    while True:
+        batch = list(expired.values_list('id', flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += StockReservation.objects.filter(id__in=batch).delete()[0]
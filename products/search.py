@@ -0,0 +1,203 @@
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db.models import Case, IntegerField, When
+
+from .versioning import get_version, publish_change
+
+# In-process inverted index over product name, description and category name.
+# Each worker keeps its own copy; the shared 'search_index' version tells it
+# when another process changed the catalog and a rebuild is due.
+SEARCH_INDEX_VERSION = 'search_index'
+SEARCH_RESULT_LIMIT = 500
+MAX_PREFIX_EXPANSIONS = 50
+
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in',
+    'is', 'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    if not text:
+        return []
+    return [t for t in TOKEN_RE.findall(text.casefold()) if t not in STOP_WORDS]
+
+
+class SearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)   # term -> {product_id: weight}
+        self._documents = {}                 # product_id -> {term: weight}
+        self._terms = []                     # sorted vocabulary for prefix lookups
+        self._terms_dirty = False
+        self.version = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    def build(self, rows, version=None):
+        postings = defaultdict(dict)
+        documents = {}
+        for product_id, name, description, category_name in rows:
+            weights = self._weigh(name, description, category_name)
+            documents[product_id] = weights
+            for term, weight in weights.items():
+                postings[term][product_id] = weight
+
+        with self._lock:
+            self._postings = postings
+            self._documents = documents
+            self._terms = sorted(postings)
+            self._terms_dirty = False
+            self.version = version
+
+    def add(self, product_id, name, description, category_name):
+        weights = self._weigh(name, description, category_name)
+        with self._lock:
+            self._discard(product_id)
+            self._documents[product_id] = weights
+            for term, weight in weights.items():
+                if term not in self._postings:
+                    self._terms_dirty = True
+                self._postings[term][product_id] = weight
+
+    def remove(self, product_id):
+        with self._lock:
+            self._discard(product_id)
+
+    def search(self, query, limit=SEARCH_RESULT_LIMIT):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            total = len(self._documents) or 1
+            scores = None
+            # Every term must match; the last one also matches as a prefix so
+            # partially typed words still find results.
+            for position, token in enumerate(tokens):
+                if position == len(tokens) - 1:
+                    candidates = self._expand_prefix(token)
+                else:
+                    candidates = [token] if token in self._postings else []
+
+                matched = {}
+                for term in candidates:
+                    postings = self._postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for product_id, weight in postings.items():
+                        score = weight * idf
+                        if score > matched.get(product_id, 0):
+                            matched[product_id] = score
+
+                if scores is None:
+                    scores = matched
+                else:
+                    scores = {
+                        product_id: score + matched[product_id]
+                        for product_id, score in scores.items()
+                        if product_id in matched
+                    }
+                if not scores:
+                    return []
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [product_id for product_id, _ in ranked]
+
+    def _weigh(self, name, description, category_name):
+        weights = defaultdict(float)
+        for field, text in (('name', name), ('description', description), ('category', category_name)):
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            # Dampen long fields so a keyword-stuffed description can't outrank the name
+            norm = 1 / math.sqrt(len(tokens))
+            for token in tokens:
+                weights[token] += FIELD_WEIGHTS[field] * norm
+        return dict(weights)
+
+    def _discard(self, product_id):
+        weights = self._documents.pop(product_id, None)
+        if not weights:
+            return
+        for term in weights:
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                self._terms_dirty = True
+
+    def _expand_prefix(self, prefix):
+        if self._terms_dirty:
+            self._terms = sorted(self._postings)
+            self._terms_dirty = False
+        start = bisect_left(self._terms, prefix)
+        expansions = []
+        for term in self._terms[start:start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(prefix):
+                break
+            expansions.append(term)
+        return expansions
+
+
+search_index = SearchIndex()
+
+
+def _index_rows(queryset):
+    return queryset.values_list('id', 'name', 'description', 'category__name').iterator(chunk_size=2000)
+
+
+def rebuild_index(index=search_index):
+    from .models import Product
+
+    version = get_version(SEARCH_INDEX_VERSION)
+    index.build(_index_rows(Product.objects.all()), version=version)
+    return index
+
+
+def get_index():
+    if search_index.version != get_version(SEARCH_INDEX_VERSION):
+        rebuild_index()
+    return search_index
+
+
+def search_products(query, limit=SEARCH_RESULT_LIMIT):
+    return get_index().search(query, limit=limit)
+
+
+def order_by_rank(queryset, ranked_ids):
+    # Annotated rather than ordered by the expression so keyset pagination
+    # can page over ('search_rank', 'id').
+    ranking = Case(
+        *[When(id=product_id, then=position) for position, product_id in enumerate(ranked_ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(id__in=ranked_ids).annotate(search_rank=ranking).order_by('search_rank')
+
+
+def index_products(queryset):
+    def change():
+        for row in _index_rows(queryset):
+            search_index.add(*row)
+
+    publish_change(search_index, SEARCH_INDEX_VERSION, change)
+
+
+def unindex_product(product_id):
+    publish_change(search_index, SEARCH_INDEX_VERSION, lambda: search_index.remove(product_id))
@@ -0,0 +1,68 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Category, Product
+from . import autocomplete, facets, images, search, trending
+from .versioning import CATALOG_VERSION, bump_version, category_version_name
+
+
+def _bump_catalog(category_ids):
+    # Versioned fragment keys move on; nothing is flushed
+    bump_version(CATALOG_VERSION)
+    for category_id in {c for c in category_ids if c}:
+        bump_version(category_version_name(category_id))
+
+
+def publish_stock_change(category_ids):
+    # Queryset stock updates send no signals; stock only feeds the catalog
+    # (fragments, snapshot) and the in-stock facet, not the search indexes
+    facets.invalidate_summaries(category_ids)
+    _bump_catalog(category_ids)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    transaction.on_commit(
+        lambda: search.index_products(Product.objects.filter(pk=instance.pk))
+    )
+    transaction.on_commit(lambda: autocomplete.refresh_product(instance))
+    categories = [instance.category_id, getattr(instance, '_loaded_category_id', None)]
+    transaction.on_commit(lambda: facets.invalidate_summaries(categories))
+    transaction.on_commit(lambda: _bump_catalog(categories))
+
+    # The manual trending flag pins a product; re-rank now rather than at the next run
+    if instance.is_trending != getattr(instance, '_loaded_is_trending', False):
+        transaction.on_commit(trending.compute_trending)
+
+    # New upload: build thumbnails off-request, then let cached cards and
+    # the home page fragments around them pick up the srcset
+    if instance.image_digest and instance.image_digest != getattr(instance, '_loaded_image_digest', None):
+        category_id = instance.category_id
+        transaction.on_commit(lambda: images.schedule_derivatives(
+            instance, on_done=lambda: _bump_catalog([category_id]),
+        ))
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: search.unindex_product(product_id))
+    transaction.on_commit(lambda: autocomplete.forget_product(product_id))
+    transaction.on_commit(lambda: facets.invalidate_summaries([instance.category_id]))
+    transaction.on_commit(lambda: _bump_catalog([instance.category_id]))
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    # A renamed category changes the indexed text of all its products
+    if not created:
+        transaction.on_commit(
+            lambda: search.index_products(Product.objects.filter(category_id=instance.pk))
+        )
+    transaction.on_commit(lambda: _bump_catalog([instance.pk]))
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    transaction.on_commit(lambda: _bump_catalog([]))
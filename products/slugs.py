@@ -0,0 +1,72 @@
+from django.utils.text import slugify
+
+# Slug allocation without a query per candidate: load the taken slugs that
+# share the base once, then pick the first free "-N" suffix in memory.
+FALLBACK_SLUG = 'item'
+
+
+def _base_slug(text, max_length):
+    return (slugify(text or '') or FALLBACK_SLUG)[:max_length].strip('-') or FALLBACK_SLUG
+
+
+def _candidate(base, counter, max_length):
+    if not counter:
+        return base
+    suffix = f'-{counter}'
+    return base[:max_length - len(suffix)].rstrip('-') + suffix
+
+
+class SlugAllocator:
+    """
+    Hands out unique slugs for `model`. With `preload=True` every existing
+    slug is read up front (one query), which suits renaming a whole table;
+    otherwise each allocate() reads only the slugs sharing its base.
+    """
+
+    def __init__(self, model, field='slug', preload=False):
+        self.model = model
+        self.field = field
+        self.max_length = model._meta.get_field(field).max_length
+        self.preloaded = preload
+        self.owners = {}  # slug -> pk
+        self.slugs = {}   # pk -> slug
+        if preload:
+            self.owners = dict(model.objects.values_list(field, 'pk'))
+            self.slugs = {pk: slug for slug, pk in self.owners.items()}
+
+    def allocate(self, text, pk=None):
+        base = _base_slug(text, self.max_length)
+        owners = self.owners if self.preloaded else self._load_prefix(base)
+
+        counter = 0
+        slug = base
+        while slug in owners and (pk is None or owners[slug] != pk):
+            counter += 1
+            slug = _candidate(base, counter, self.max_length)
+
+        if self.preloaded:
+            # Free this row's previous slug and claim the new one
+            previous = self.slugs.get(pk) if pk is not None else None
+            if previous is not None and previous != slug:
+                del owners[previous]
+            owners[slug] = pk
+            if pk is not None:
+                self.slugs[pk] = slug
+        return slug
+
+    def reserve(self, slug, pk=None):
+        # Mark a slug taken without allocating it (e.g. one supplied by a feed)
+        if self.preloaded:
+            self.owners[slug] = pk
+
+    def _load_prefix(self, base):
+        # Truncated suffixed candidates always share the first few characters
+        prefix = base[:max(1, self.max_length - 8)]
+        return dict(
+            self.model.objects.filter(**{f'{self.field}__startswith': prefix})
+            .values_list(self.field, 'pk')
+        )
+
+
+def allocate_slug(model, text, pk=None):
+    return SlugAllocator(model).allocate(text, pk=pk)
@@ -0,0 +1,210 @@
+import math
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .facets import PRICE_BUCKETS
+from .pagination import DEFAULT_PAGE_SIZE, KeysetPage, KeysetPaginator, encode_cursor
+from .versioning import CATALOG_VERSION, get_version
+
+try:
+    import numpy as np
+except ImportError:  # optional; product_list queries the database instead
+    np = None
+
+# Column-oriented copy of the catalog for unfiltered-by-text browsing. Facet
+# filters become boolean masks and sorts are precomputed permutations, so a
+# listing page costs one query: hydrating the ids on that page. The snapshot
+# is rebuilt (and swapped in whole) when the catalog version moves on.
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+SORT_FIELDS = ('created_at', 'effective_price', 'discount_percentage')
+# Range of the discount_percentage column (an IntegerField). Nothing stops a
+# discount_price above the price, which makes the percentage negative.
+MIN_DISCOUNT, MAX_DISCOUNT = -2 ** 31, 2 ** 31 - 1
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def _micros(value):
+    return (value - EPOCH) // ONE_MICROSECOND
+
+
+def _cents(value):
+    return int(Decimal(value) * 100)
+
+
+def _percentage(value):
+    return max(MIN_DISCOUNT, min(value, MAX_DISCOUNT))
+
+
+class CatalogSnapshot:
+    def __init__(self, rows, version=None):
+        # rows: (id, category_id, effective_price, stock, created_at, trending_rank, discount_percentage)
+        rows = list(rows)
+        count = len(rows)
+
+        def column(position, dtype, convert=None):
+            values = (row[position] for row in rows)
+            if convert is not None:
+                values = map(convert, values)
+            return np.fromiter(values, dtype=dtype, count=count)
+
+        self.ids = column(0, np.int64)
+        self.category_ids = column(1, np.int64)
+        self.prices = column(2, np.int64, _cents)
+        self.stock = column(3, np.int32)
+        self.created = column(4, np.int64, _micros)
+        self.trending = column(5, np.bool_, lambda rank: rank is not None)
+        self.discounts = column(6, np.int32, _percentage)
+        self.version = version
+
+        self.columns = {
+            'created_at': self.created,
+            'effective_price': self.prices,
+            'discount_percentage': self.discounts,
+        }
+        # Ascending (field, id) orders; descending ones are read backwards
+        self.orders = {field: np.lexsort((self.ids, values)) for field, values in self.columns.items()}
+        # Mirrors facets.FLAG_FACETS
+        self.flags = {
+            'on_discount': self.discounts > 0,
+            'in_stock': self.stock > 0,
+            'trending': self.trending,
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def supports(self, ordering, selection):
+        # (field, id) orderings in one direction, as in views.SORT_ORDERINGS
+        return (
+            len(ordering) == 2
+            and ordering[0].lstrip('-') in SORT_FIELDS
+            and ordering[1].lstrip('-') == 'id'
+            and ordering[0].startswith('-') == ordering[1].startswith('-')
+            and all(flag in self.flags for flag in selection.flags)
+        )
+
+    def mask(self, selection, min_price=None, max_price=None):
+        mask = np.ones(len(self.ids), dtype=np.bool_)
+        if selection.categories:
+            mask &= np.isin(self.category_ids, selection.categories)
+        if selection.prices:
+            prices = np.zeros(len(self.ids), dtype=np.bool_)
+            for key, _, lower, upper in PRICE_BUCKETS:
+                if key in selection.prices:
+                    bucket = self.prices >= lower * 100
+                    if upper is not None:
+                        bucket &= self.prices < upper * 100
+                    prices |= bucket
+            mask &= prices
+        for flag in selection.flags:
+            mask &= self.flags[flag]
+        if min_price is not None:
+            mask &= self.prices >= math.ceil(min_price * 100)
+        if max_price is not None:
+            mask &= self.prices <= math.floor(max_price * 100)
+        return mask
+
+    def page(self, mask, ordering, page_size, after=None):
+        """
+        Ids of the next `page_size` rows matching `mask` in `ordering`,
+        strictly after the sort key `after`, plus the last row's key when
+        more rows follow.
+        """
+        field = ordering[0].lstrip('-')
+        descending = ordering[0].startswith('-')
+        values = self.columns[field]
+        if after is not None:
+            key, last_id = after
+            if descending:
+                mask = mask & ((values < key) | ((values == key) & (self.ids < last_id)))
+            else:
+                mask = mask & ((values > key) | ((values == key) & (self.ids > last_id)))
+
+        order = self.orders[field]
+        if descending:
+            order = order[::-1]
+        selected = order[mask[order]][:page_size + 1]
+
+        next_key = None
+        if len(selected) > page_size:
+            selected = selected[:page_size]
+            last = selected[-1]
+            next_key = (values[last], self.ids[last])
+        return [int(pk) for pk in self.ids[selected]], next_key
+
+    def encode_key(self, field, key):
+        value, pk = int(key[0]), int(key[1])
+        if field == 'created_at':
+            value = EPOCH + timedelta(microseconds=value)
+        elif field == 'effective_price':
+            value = (Decimal(value) / 100).quantize(Decimal('0.01'))
+        return encode_cursor([value, pk])
+
+    def decode_key(self, field, values):
+        value, pk = values
+        if field == 'created_at':
+            if timezone.is_naive(value):
+                # Read a naive cursor the way the ORM path does: in the current time zone
+                value = timezone.make_aware(value)
+            value = _micros(value)
+        elif field == 'effective_price':
+            value = _cents(value)
+        return value, pk
+
+
+def build_snapshot(version=None):
+    from .models import Product
+
+    rows = Product.objects.values_list(
+        'id', 'category_id', 'effective_price', 'stock', 'created_at', 'trending_rank', 'discount_percentage',
+    ).iterator(chunk_size=5000)
+    return CatalogSnapshot(rows, version=version)
+
+
+def get_snapshot():
+    """The current snapshot, or None when NumPy is missing or it is switched off."""
+    global _snapshot
+    if np is None or not getattr(settings, 'CATALOG_SNAPSHOT', True):
+        return None
+    version = get_version(CATALOG_VERSION)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            if _snapshot is None or _snapshot.version != version:
+                _snapshot = build_snapshot(version)
+            snapshot = _snapshot
+    return snapshot
+
+
+def snapshot_page(queryset, selection, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE,
+                  min_price=None, max_price=None):
+    """
+    A KeysetPage for the catalog listing served from the snapshot, or None
+    when the snapshot can't answer it. Cursors are interchangeable with
+    KeysetPaginator's.
+    """
+    snapshot = get_snapshot()
+    if snapshot is None or not snapshot.supports(ordering, selection):
+        return None
+
+    paginator = KeysetPaginator(queryset, ordering, page_size=page_size)
+    field = paginator.fields[0]
+    after = None
+    if cursor:
+        values = paginator.parse_cursor(cursor)
+        if values is not None:
+            after = snapshot.decode_key(field, values)
+
+    mask = snapshot.mask(selection, min_price=min_price, max_price=max_price)
+    ids, next_key = snapshot.page(mask, ordering, paginator.page_size, after=after)
+    found = queryset.in_bulk(ids)
+    rows = [found[pk] for pk in ids if pk in found]
+    next_cursor = snapshot.encode_key(field, next_key) if next_key is not None else None
+    return KeysetPage(rows, next_cursor)
@@ -0,0 +1,23 @@
+from django.utils.dateparse import parse_date
+
+from tasks.queue import task
+
+from .models import Product
+from .recommendations import record_order
+from .trending import record_sales
+
+
+def _existing(product_ids):
+    # The products may have been deleted since the order was placed
+    return set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+
+
+@task('products.record_order')
+def record_order_task(product_ids):
+    record_order(_existing(product_ids))
+
+
+@task('products.record_sales')
+def record_sales_task(lines, day):
+    existing = _existing([product_id for product_id, _ in lines])
+    record_sales([(pk, quantity) for pk, quantity in lines if pk in existing], day=parse_date(day))
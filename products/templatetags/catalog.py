@@ -0,0 +1,40 @@
+from django import template
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from products.images import derivative_srcset
+from products.versioning import category_version_name, get_version
+
+register = template.Library()
+
+PRODUCT_CARD_TIMEOUT = 60 * 60 * 24
+
+
+@register.simple_tag(takes_context=True)
+def product_card(context, product):
+    """
+    Render partials/product_card.html for `product`, cached per product.
+
+    The key carries updated_at (price, stock and text edits) and the
+    category's version (renames), so a stale card is never served and
+    nothing has to be flushed.
+    """
+    versions = context.render_context.setdefault('category_versions', {})
+    if product.category_id not in versions:
+        versions[product.category_id] = get_version(category_version_name(product.category_id))
+
+    key = 'product_card:{}:{}:{}'.format(
+        product.pk, product.updated_at.timestamp(), versions[product.category_id],
+    )
+    html = cache.get(key)
+    if html is None:
+        html = get_template('partials/product_card.html').render({'product': product})
+        cache.set(key, html, PRODUCT_CARD_TIMEOUT)
+    return mark_safe(html)
+
+
+@register.simple_tag
+def product_srcset(product, ext='jpg'):
+    """srcset of the product's resized images, or '' until they exist."""
+    return derivative_srcset(product.image_digest, ext)
@@ -1,3 +1,785 @@
-from django.test import TestCase
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+import warnings
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.template.loader import get_template
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+
+from accounts.models import Address
+from cart.models import CartItem
+from orders.models import Order, OrderItem
+
+from . import autocomplete, images, recommendations, search, trending
+from .reservations import available_stock, reserve, sweep_expired
+from .facets import FacetSelection, build_facets, count_facets
+from .feeds import FeedImporter, read_rows
+from .models import (
+    Category, Product, ProductQuerySet, ProductRecommendation, ProductSalesBucket, StockReservation,
+)
+from .pagination import KeysetPaginator, encode_cursor
+from .versioning import CATALOG_VERSION, category_version_name, get_version
+from .views import SORT_ORDERINGS
+
+
+class CatalogTestCase(TestCase):
+    def setUp(self):
+        # Run the signals' on_commit version bumps so in-memory catalog
+        # structures (search index, snapshot) see these rows
+        with self.captureOnCommitCallbacks(execute=True):
+            self.phones = Category.objects.create(name='Phones', slug='phones')
+            self.laptops = Category.objects.create(name='Laptops', slug='laptops')
+        # Drop what earlier tests' rolled-back rows left in the in-process indexes
+        search.rebuild_index()
+        autocomplete.rebuild_autocompleter()
+
+    def make(self, name, price, category=None, discount_price=None, stock=10, description='d'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                category=category or self.phones, name=name, description=description, price=price,
+                discount_price=discount_price, stock=stock, image='x.jpg',
+            )
+
+
+class PricingColumnTests(CatalogTestCase):
+    def pricing(self, *products):
+        return [
+            tuple(Product.objects.filter(pk=product.pk).values_list('effective_price', 'discount_percentage').get())
+            for product in products
+        ]
+
+    def test_save_keeps_the_pricing_columns_in_step(self):
+        product = self.make('Phone', price=10, discount_price=8)
+        self.assertEqual(self.pricing(product), [(8, 20)])
+        product.discount_price = None
+        product.save(update_fields=['discount_price'])
+        self.assertEqual(self.pricing(product), [(10, 0)])
+        product.price = 0
+        product.save()
+        self.assertEqual(self.pricing(product), [(0, 0)])
+
+    def test_queryset_update_recomputes_in_the_same_statement(self):
+        first = self.make('Phone', price=10, discount_price=8)
+        second = self.make('Tablet', price=40)
+        products = Product.objects.filter(pk__in=[first.pk, second.pk])
+        updates = [
+            ({'price': 16}, [(8, 50), (16, 0)]),                      # price only
+            ({'discount_price': 12}, [(12, 25), (12, 25)]),           # discount only
+            ({'price': F('price') * 2}, [(12, 62), (12, 62)]),        # an expression
+            ({'discount_price': None}, [(32, 0), (32, 0)]),
+            ({'stock': 3}, [(32, 0), (32, 0)]),                       # no pricing source
+        ]
+        for kwargs, expected in updates:
+            with self.subTest(update=kwargs):
+                products.update(**kwargs)
+                self.assertEqual(self.pricing(first, second), expected)
+
+    def test_bulk_writes_recompute_for_their_fields(self):
+        created = Product.objects.bulk_create([
+            Product(category=self.phones, name=name, slug=name, description='d', price=price,
+                    discount_price=discount, stock=1, image='x.jpg')
+            for name, price, discount in [('a', 10, 5), ('b', 20, None)]
+        ])
+        self.assertEqual(self.pricing(*created), [(5, 50), (20, 0)])
+
+        created[0].price = 20
+        created[1].discount_price = 15
+        Product.objects.bulk_update(created, ['price'])
+        self.assertEqual(self.pricing(*created), [(5, 75), (20, 0)])
+        Product.objects.bulk_update(created, ['discount_price'])
+        self.assertEqual(self.pricing(*created), [(5, 75), (15, 25)])
+
+        # Columns that drifted (e.g. raw SQL) are put right in one statement
+        ProductQuerySet.update(Product.objects.all(), effective_price=0, discount_percentage=0)
+        Product.objects.all().sync_pricing()
+        self.assertEqual(self.pricing(*created), [(5, 75), (15, 25)])
+
+    def test_backfill_migration_fills_existing_rows(self):
+        products = [
+            self.make('Phone', price=10, discount_price=8),
+            self.make('Tablet', price=40),
+            self.make('Free', price=0, discount_price=5),
+            self.make('Zero', price=10, discount_price=0),
+        ]
+        expected = self.pricing(*products)
+        ProductQuerySet.update(Product.objects.all(), effective_price=0, discount_percentage=0)
+
+        # Run the migration's RunPython against the models as they were at 0003
+        loader = MigrationLoader(connection)
+        migration = loader.get_migration('products', '0003_effective_price')
+        backfill = next(operation for operation in migration.operations if hasattr(operation, 'code')).code
+        backfill(loader.project_state(('products', '0003_effective_price')).apps, None)
+        self.assertEqual(self.pricing(*products), expected)
+        self.assertEqual(expected, [(8, 20), (40, 0), (5, 0), (10, 0)])
+
+
+class KeysetPaginationTests(CatalogTestCase):
+    def walk(self, paginator):
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen += [product.pk for product in page]
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_visit_every_row_once_in_order_despite_ties(self):
+        for n in range(11):
+            self.make(f'Phone {n}', price=10 + n % 3, discount_price=5 if n % 4 == 0 else None)
+        products = Product.objects.all()
+        for ordering in [('effective_price', 'id'), ('-effective_price', '-id'), ('-created_at', '-id')]:
+            with self.subTest(ordering=ordering):
+                expected = list(products.order_by(*ordering).values_list('pk', flat=True))
+                self.assertEqual(self.walk(KeysetPaginator(products, ordering, page_size=3)), expected)
+
+    def test_malformed_cursor_means_the_first_page(self):
+        self.make('Phone', price=10)
+        user = User.objects.create_user('bob', password='pw')
+        address = Address.objects.create(
+            user=user, full_name='Bob', phone='1', street_address='1 Main St', city='X',
+            state='Y', postal_code='1', country='Z',
+        )
+        Order.objects.create(user=user, order_number='ORD1', address=address, total_amount=10)
+        self.client.force_login(user)
+        cursors = [
+            'not a cursor', encode_cursor([{'a': 1}, 1]), encode_cursor(['abc', 1]), encode_cursor([1, 10 ** 30]),
+            encode_cursor(['2024-01-01T00:00:00+00:00', [1]]), encode_cursor([None, 1]), encode_cursor([1]),
+        ]
+        urls = ['/products/', '/products/?search=phone', '/products/?sort=price', '/products/feed/', '/orders/my-orders/']
+        for snapshot in (True, False):
+            for url in urls:
+                for cursor in cursors:
+                    with self.subTest(url=url, cursor=cursor, snapshot=snapshot), \
+                            override_settings(CATALOG_SNAPSHOT=snapshot):
+                        separator = '&' if '?' in url else '?'
+                        response = self.client.get(f'{url}{separator}cursor={cursor}')
+                        self.assertEqual(response.status_code, 200)
+                        if url == '/products/feed/':
+                            self.assertEqual(len(response.json()['results']), 1)
+
+    def test_malformed_page_size_means_the_default(self):
+        for n in range(3):
+            self.make(f'Phone {n}', price=10)
+        for url in ['/products/', '/products/feed/', '/products/?search=phone']:
+            for page_size in ['\u00b2', '\u0663', '-1', 'x', '99999999999999999999999']:
+                for snapshot in (True, False):
+                    with self.subTest(url=url, page_size=page_size, snapshot=snapshot), \
+                            override_settings(CATALOG_SNAPSHOT=snapshot):
+                        separator = '&' if '?' in url else '?'
+                        response = self.client.get(f'{url}{separator}page_size={page_size}')
+                        self.assertEqual(response.status_code, 200)
+
+
+class SnapshotTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        for n in range(13):
+            self.make(
+                f'Item {n}', price=10 + n % 4, discount_price=(5 + n % 3) if n % 3 == 0 else None,
+                category=self.laptops if n % 2 else self.phones,
+            )
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url).json()
+            pages.append([result['id'] for result in response['results']])
+            url = response['next_url']
+        return pages
+
+    def test_snapshot_and_database_serve_the_same_pages(self):
+        for sort in SORT_ORDERINGS:
+            for filters in ['', f'&category={self.laptops.pk}', '&on_discount=1&price=0-25']:
+                url = f'/products/feed/?sort={sort}&page_size=4{filters}'
+                with self.subTest(url=url):
+                    with override_settings(CATALOG_SNAPSHOT=True):
+                        from_snapshot = self.walk(url)
+                    with override_settings(CATALOG_SNAPSHOT=False):
+                        from_database = self.walk(url)
+                    self.assertEqual(from_snapshot, from_database)
+                    self.assertTrue(from_snapshot[0])
+
+    def test_naive_cursor_reads_the_same_on_both_paths(self):
+        middle = Product.objects.order_by('-created_at', '-id')[5]
+        naive = middle.created_at.replace(tzinfo=None).isoformat()
+        url = f"/products/feed/?cursor={encode_cursor([naive, middle.pk])}"
+        with override_settings(CATALOG_SNAPSHOT=True):
+            from_snapshot = self.walk(url)
+        with override_settings(CATALOG_SNAPSHOT=False), warnings.catch_warnings():
+            # The ORM warns that it is reading the naive value in the current time zone
+            warnings.simplefilter('ignore', RuntimeWarning)
+            from_database = self.walk(url)
+        self.assertEqual(from_snapshot, from_database)
+        self.assertEqual(len(from_snapshot[0]), 7)
+
+    def test_discount_above_price_and_extreme_bounds_serve_both_paths(self):
+        self.make('Typo', price=1, discount_price=500)
+        self.make('Worse Typo', price='0.01', discount_price='99999999.99')
+        for query in ['sort=-discount', 'min_price=1e999999999', 'max_price=-1e999999999',
+                      'min_price=1e-50&sort=price', 'min_price=10.001&max_price=11.999']:
+            url = f'/products/feed/?{query}&page_size=5'
+            with self.subTest(url=url):
+                with override_settings(CATALOG_SNAPSHOT=True):
+                    from_snapshot = self.walk(url)
+                with override_settings(CATALOG_SNAPSHOT=False):
+                    from_database = self.walk(url)
+                self.assertEqual(from_snapshot, from_database)
+
+
+class FacetTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make('Basic Phone', price=20)
+        self.make('Smart Phone', price=30, discount_price=24)
+        self.make('Workstation', price=300, category=self.laptops, stock=0)
+        self.make('Netbook', price=60, category=self.laptops)
+
+    def test_counts_ignore_only_their_own_selection(self):
+        selection = FacetSelection(categories=[self.phones.pk], flags=['on_discount'])
+        counts = count_facets(Product.objects.all(), selection, [self.phones.pk, self.laptops.pk])
+        self.assertEqual(counts['category'], {self.phones.pk: 1, self.laptops.pk: 0})
+        self.assertEqual(counts['price'], {'0-25': 1, '25-50': 0, '50-100': 0, '100-250': 0, '250-500': 0, '500+': 0})
+        self.assertEqual(counts['on_discount'], {'1': 1})
+        self.assertEqual(counts['in_stock'], {'1': 1})
+        self.assertEqual(counts['trending'], {'1': 0})
+
+    def test_cached_summary_matches_a_fresh_count(self):
+        categories = [self.phones, self.laptops]
+        for selected in ([], [self.laptops.pk]):
+            with self.subTest(selected=selected):
+                selection = FacetSelection(categories=selected)
+                self.assertEqual(
+                    build_facets(Product.objects.all(), selection, categories),
+                    build_facets(Product.objects.all(), selection, categories, use_summary=False),
+                )
+
+    def test_impossible_category_ids_are_dropped(self):
+        selection = FacetSelection(categories=['99999999999999999999', '\u00b2', '-1', str(self.laptops.pk)])
+        self.assertEqual(selection.categories, [self.laptops.pk])
+        response = self.client.get('/products/?category=99999999999999999999&category=\u00b2')
+        self.assertEqual(response.status_code, 200)
+
+
+class HomePageCacheTests(CatalogTestCase):
+    def catalog_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        return response, [query['sql'] for query in queries if 'products_' in query['sql']]
+
+    def test_warm_home_page_runs_no_catalog_queries(self):
+        self.make('Phone', price=10)
+        response, queries = self.catalog_queries()
+        self.assertContains(response, 'Phone')
+        self.assertTrue(queries)
+        response, queries = self.catalog_queries()
+        self.assertContains(response, 'Phone')
+        self.assertEqual(queries, [])
+
+    def test_edits_rerender_only_the_cards_they_touch(self):
+        phone = self.make('Phone', price=10)
+        laptop = self.make('Laptop', price=900, category=self.laptops)
+        self.client.get('/')
+
+        with mock.patch('products.templatetags.catalog.get_template', wraps=get_template) as render:
+            with self.captureOnCommitCallbacks(execute=True):
+                phone.price = 12
+                phone.save()
+            self.assertContains(self.client.get('/'), '$12.00')
+            # The section re-renders, but the laptop card comes from the cache
+            self.assertEqual(render.call_count, 1)
+
+            render.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.laptops.name = 'Notebooks'
+                self.laptops.save()
+            response = self.client.get('/')
+            self.assertContains(response, 'Notebooks')
+            self.assertEqual(render.call_count, 1)
+        self.assertEqual(list(response.context['featured_products']), [laptop, phone])
+
+
+@override_settings(STOCK_HOLD_SECONDS=60)
+class StockHoldTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = self.make('Phone', price=10, stock=5)
+        self.alice, self.bob, self.carol = [User.objects.create_user(name) for name in ('alice', 'bob', 'carol')]
+        self.start = timezone.now()
+
+    def at(self, seconds):
+        return mock.patch('django.utils.timezone.now', return_value=self.start + timedelta(seconds=seconds))
+
+    def available(self, seconds, user=None):
+        with self.at(seconds):
+            return available_stock([self.product.pk], exclude_user=user or self.carol)[self.product.pk]
+
+    def test_holds_lapse_after_the_hold_time_and_the_sweep_deletes_them(self):
+        with self.at(0):
+            self.assertEqual(reserve(self.alice, [(self.product.pk, 3)]), [])
+        with self.at(30):
+            self.assertEqual(reserve(self.bob, [(self.product.pk, 2)]), [])
+            self.assertEqual(reserve(self.carol, [(self.product.pk, 1)]), [self.product.pk])
+        self.assertEqual(self.available(59), 0)
+        self.assertEqual(self.available(59, user=self.alice), 3)  # her own hold is hers to buy
+
+        # Alice's hold lapses at 60s, and its units are available before any sweep
+        self.assertEqual(self.available(60), 3)
+        self.assertEqual(self.available(90), 5)
+        self.assertEqual(StockReservation.objects.count(), 2)
+
+        self.assertEqual(sweep_expired(batch_size=1, now=self.start + timedelta(seconds=60)), 1)
+        self.assertEqual(list(StockReservation.objects.values_list('user__username', flat=True)), ['bob'])
+        with self.at(90):
+            out = StringIO()
+            call_command('sweep_stock_holds', '--batch-size', '1', stdout=out)
+        self.assertIn('Deleted 1 expired holds', out.getvalue())
+        self.assertFalse(StockReservation.objects.exists())
+        # Holds never touched the on-hand count
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, self.available(0)), (5, 5))
+
+
+class FixSlugsTests(CatalogTestCase):
+    def test_cached_pages_link_to_the_new_slug(self):
+        product = self.make('Phone X', price=10)
+        Product.objects.filter(pk=product.pk).update(slug='legacy-slug')
+        self.assertContains(self.client.get('/'), '/product/legacy-slug/')
+
+        call_command('fix_slugs', stdout=StringIO())
+        home = self.client.get('/')
+        self.assertNotContains(home, '/product/legacy-slug/')
+        self.assertContains(home, '/product/phone-x/')
+        self.assertEqual(self.client.get('/product/phone-x/').status_code, 200)
+
+
+class ImageDerivativeTests(CatalogTestCase):
+    def test_finished_derivatives_move_the_home_page_on(self):
+        with mock.patch('products.images.schedule_derivatives') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.create(
+                    category=self.phones, name='Phone', description='d', price=10, stock=1,
+                    image='products/phone.jpg', image_digest='a' * 64,
+                )
+        names = [CATALOG_VERSION, category_version_name(self.phones.pk)]
+        before = [get_version(name) for name in names]
+        schedule.call_args.kwargs['on_done']()
+        self.assertTrue(all(new > old for new, old in zip([get_version(name) for name in names], before)))
+
+
+class DerivativeFileTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+
+    def original(self, width, height, orientation=None):
+        from PIL import Image
+
+        path = os.path.join(self.media_root, f'{width}x{height}.jpg')
+        exif = Image.Exif()
+        if orientation:
+            exif[images.EXIF_ORIENTATION] = orientation
+        Image.new('RGB', (width, height), 'red').save(path, 'JPEG', exif=exif)
+        return path
+
+    def built(self, path):
+        from PIL import Image
+
+        digest = images.build_derivatives(path, self.media_root)
+        directory = os.path.join(self.media_root, images.derivative_dir(digest))
+        sizes = {}
+        for name in os.listdir(directory):
+            with Image.open(os.path.join(directory, name)) as image:
+                sizes[name] = image.size
+        return digest, sizes
+
+    def test_small_originals_are_not_upscaled_and_srcset_tells_the_real_width(self):
+        cases = [
+            ((1200, 600), {'320.jpg': (320, 160), '640.jpg': (640, 320), '960.jpg': (960, 480)}),
+            ((400, 200), {'320.jpg': (320, 160), '400.jpg': (400, 200)}),
+            ((200, 100), {'200.jpg': (200, 100)}),
+            ((200, 400, 6), {'320.jpg': (320, 160), '400.jpg': (400, 200)}),  # turned on its side
+        ]
+        for original, expected in cases:
+            with self.subTest(original=original):
+                digest, sizes = self.built(self.original(*original))
+                self.assertEqual({name: size for name, size in sizes.items() if name.endswith('.jpg')}, expected)
+                self.assertEqual(
+                    {name.replace('.webp', '.jpg'): size for name, size in sizes.items() if name.endswith('.webp')},
+                    expected,
+                )
+                widths = sorted(width for width, _ in expected.values())
+                with override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/'):
+                    self.assertEqual(images.derivative_srcset(digest, 'jpg'), ', '.join(
+                        f'/media/{images.derivative_dir(digest)}/{width}.jpg {width}w' for width in widths
+                    ))
+
+    def test_rebuild_drops_files_named_for_widths_the_original_lacks(self):
+        path = self.original(400, 200)
+        digest, _ = self.built(path)
+        stale = os.path.join(self.media_root, images.derivative_name(digest, 960, 'jpg'))
+        with open(stale, 'wb') as upscaled:
+            upscaled.write(b'an older build wrote this at 400px')
+        self.assertEqual(sorted(self.built(path)[1]), ['320.jpg', '320.webp', '400.jpg', '400.webp'])
+        with override_settings(MEDIA_ROOT=self.media_root):
+            self.assertNotIn('960w', images.derivative_srcset(digest, 'jpg'))
+            self.assertEqual(images.derivative_srcset('0' * 64, 'jpg'), '')
+
+
+class ConditionalDetailTests(CatalogTestCase):
+    def test_only_the_etag_validates_the_page(self):
+        product = self.make('Phone', price=10)
+        url = f'/product/{product.slug}/'
+        self.client.get(url)  # settles the CSRF cookie the ETag includes
+        first = self.client.get(url)
+        self.assertFalse(first.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        # A new related product changes the page, not this product's updated_at
+        self.make('Phone Case', price=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date(2 ** 32)).status_code, 200)
+
+
+class ConditionalListTests(CatalogTestCase):
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_listing_and_feed_revalidate_until_the_catalog_changes(self):
+        product = self.make('Phone', price=10)
+        self.client.get('/products/')  # settles the CSRF cookie the listing ETag includes
+        for url in ['/products/', '/products/feed/']:
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                self.assertEqual(self.revalidate(url, etag).status_code, 304)
+                with self.captureOnCommitCallbacks(execute=True):
+                    product.price += 1
+                    product.save()
+                changed = self.revalidate(url, etag)
+                self.assertEqual(changed.status_code, 200)
+                self.assertNotEqual(changed['ETag'], etag)
+
+    def test_pending_messages_are_never_swallowed_by_a_304(self):
+        user = User.objects.create_user('bob', password='pw')
+        product = self.make('Phone', price=10, stock=1)
+        CartItem.objects.create(user=user, product=product, quantity=2)
+        self.client.force_login(user)
+        self.client.get('/products/')
+        etag = self.client.get('/products/')['ETag']
+
+        self.client.get('/orders/checkout/')  # short of stock: flashes an error
+        response = self.revalidate('/products/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertContains(response, 'Not enough stock left for: Phone')
+        self.assertEqual(self.revalidate('/products/', etag).status_code, 304)
+
+
+class SearchIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = search.SearchIndex()
+        self.index.build([
+            (1, 'Wireless Mouse', 'A mouse for the office', 'Accessories'),
+            (2, 'Gaming Keyboard', 'Mechanical keyboard with a wireless receiver', 'Accessories'),
+            (3, 'Mouse Pad', 'Pairs with any wireless mouse', 'Accessories'),
+            (4, 'Laptop Stand', 'Aluminium stand', 'Laptops'),
+        ])
+
+    def test_name_matches_outrank_description_matches(self):
+        self.assertEqual(self.index.search('wireless'), [1, 3, 2])
+        self.assertEqual(self.index.search('MOUSE'), [1, 3])
+        self.assertEqual(self.index.search('laptops'), [4])
+
+    def test_every_term_must_match_and_the_last_may_be_a_prefix(self):
+        self.assertEqual(self.index.search('wireless mo'), [1, 3])
+        self.assertEqual(self.index.search('the wireless keyb'), [2])
+        self.assertEqual(self.index.search('mouse keyboard'), [])
+        self.assertEqual(self.index.search('the of'), [])
+        self.assertEqual(self.index.search('wireless', limit=1), [1])
+
+    def test_incremental_changes_match_a_rebuild(self):
+        self.index.remove(2)
+        self.index.add(4, 'Laptop Riser', 'Adjustable riser', 'Laptops')
+        self.index.add(5, 'Keypad', 'Numeric keypad', 'Accessories')
+        self.assertEqual(self.index.search('keyb'), [])
+        self.assertEqual(self.index.search('key'), [5])
+        self.assertEqual(self.index.search('stand'), [])
+        self.assertEqual(self.index.search('ris'), [4])
+
+        rebuilt = search.SearchIndex()
+        rebuilt.build([
+            (1, 'Wireless Mouse', 'A mouse for the office', 'Accessories'),
+            (3, 'Mouse Pad', 'Pairs with any wireless mouse', 'Accessories'),
+            (4, 'Laptop Riser', 'Adjustable riser', 'Laptops'),
+            (5, 'Keypad', 'Numeric keypad', 'Accessories'),
+        ])
+        for query in ['wireless', 'mouse', 'k', 'laptop', 'accessories']:
+            self.assertEqual(self.index.search(query), rebuilt.search(query), query)
+
+
+class SearchTests(CatalogTestCase):
+    def test_catalog_changes_reach_the_index(self):
+        phone = self.make('Pixel Phone', price=10, description='A camera phone')
+        strap = self.make('Camera Strap', price=5, category=self.laptops)
+        self.assertEqual(search.search_products('camera'), [strap.pk, phone.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptops.name = 'Photography'
+            self.laptops.save()
+        self.assertEqual(search.search_products('photo'), [strap.pk])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            strap.delete()
+        self.assertEqual(search.search_products('camera'), [phone.pk])
+        response = self.client.get('/products/?search=camera')
+        self.assertEqual([product.pk for product in response.context['products']], [phone.pk])
+
+
+class AutocompleteTests(SimpleTestCase):
+    def setUp(self):
+        self.completer = autocomplete.Autocompleter()
+        self.completer.build([
+            (1, 'Laptop Pro', 'laptop-pro'),
+            (2, 'Laptop Air', 'laptop-air'),
+            (3, 'Café Latte Mug', 'cafe-latte-mug'),
+            (4, 'Pro Stylus', 'pro-stylus'),
+        ], popularity={2: 5, 4: 1})
+
+    def names(self, prefix, **kwargs):
+        return [result['name'] for result in self.completer.complete(prefix, **kwargs)]
+
+    def test_word_starts_match_ranked_by_sales_then_name(self):
+        self.assertEqual(self.names('lap'), ['Laptop Air', 'Laptop Pro'])
+        self.assertEqual(self.names('pro'), ['Pro Stylus', 'Laptop Pro'])
+        self.assertEqual(self.names('  CAFE-lat'), ['Café Latte Mug'])
+        self.assertEqual(self.names('mug'), ['Café Latte Mug'])
+        self.assertEqual(self.names('laptop p'), ['Laptop Pro'])
+        self.assertEqual(self.names('lap', limit=1), ['Laptop Air'])
+        self.assertEqual(self.names('x'), [])
+        self.assertEqual(self.names('--'), [])
+
+    def test_changes_invalidate_memoized_prefixes(self):
+        self.assertEqual(self.names('lap'), ['Laptop Air', 'Laptop Pro'])
+        self.completer.add(5, 'Lapel Pin', 'lapel-pin')
+        self.completer.add(2, 'Notebook Air', 'notebook-air')  # keeps its sales
+        self.assertEqual(self.names('lap'), ['Lapel Pin', 'Laptop Pro'])
+        self.assertEqual(self.names('air'), ['Notebook Air'])
+        self.completer.remove(1)
+        self.assertEqual(self.names('lap'), ['Lapel Pin'])
+        self.assertEqual(self.names('pro'), ['Pro Stylus'])
+
+
+class SearchSuggestionTests(CatalogTestCase):
+    def test_suggestions_follow_catalog_changes(self):
+        product = self.make('Pixel Phone', price=10)
+        response = self.client.get('/search-suggestions/?q=pix')
+        self.assertEqual(response.json(), [{'id': product.pk, 'name': 'Pixel Phone', 'slug': product.slug}])
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/search-suggestions/?q=pix', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=product.pk).first().delete()
+        response = self.client.get('/search-suggestions/?q=pix', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()), (200, []))
+
+
+class FeedTests(CatalogTestCase):
+    FIELDS = ('slug', 'name', 'category_id', 'description', 'price', 'discount_price', 'stock', 'is_trending', 'image')
+
+    def snapshot(self):
+        return list(Product.objects.order_by('slug').values_list(*self.FIELDS))
+
+    def import_feed(self, text, fmt, **kwargs):
+        errors = []
+        importer = FeedImporter(on_error=lambda line_no, message: errors.append(line_no), **kwargs)
+        importer.run(read_rows(StringIO(text), fmt))
+        return importer, errors
+
+    def test_export_then_import_round_trips(self):
+        self.make('Pixel Phone', price=499, discount_price='449.50', description='Line one,\n"quoted"')
+        self.make('Café Laptop', price=999, category=self.laptops, stock=0)
+        Product.objects.filter(name='Café Laptop').update(is_trending=True, image='products/laptop.jpg')
+        original = self.snapshot()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for fmt in ('csv', 'jsonl'):
+                with self.subTest(fmt=fmt):
+                    path = os.path.join(directory, f'feed.{fmt}')
+                    call_command('export_products', path, stdout=StringIO())
+                    with open(path, encoding='utf-8') as stream:
+                        feed = stream.read()
+
+                    # Re-importing an unchanged export writes nothing
+                    importer, errors = self.import_feed(feed, fmt)
+                    self.assertEqual((importer.created, importer.updated, errors), (0, 0, []))
+
+                    Product.objects.all().delete()
+                    call_command('import_products', path, '--chunk-size', '1', stdout=StringIO())
+                    self.assertEqual(self.snapshot(), original)
+
+    def test_bad_rows_are_skipped_and_the_rest_written_in_chunks(self):
+        self.make('Pixel Phone', price=499)
+        feed = (
+            'slug,name,category,price,discount_price,stock\n'
+            'pixel-phone,,,450,,\n'           # update: only the given fields change
+            ',Budget Phone,phones,99,,5\n'     # new: slug allocated from the name
+            ',Budget Phone,Phones,89,,5\n'     # new: the name is taken, so is the slug
+            'new-tablet,Tablet,tablets,10,,1\n'  # unknown category
+            'cheap,Cheap,phones,10,12,1\n'     # discount above price
+            'no-price,No Price,phones,,,1\n'   # new product without a price
+            'huge,Huge,phones,1e30,,1\n'       # too many digits for the price column
+            'rounds-up,Rounds Up,phones,99999999.999,,1\n'
+            'hoard,Hoard,phones,10,,2147483648\n'  # beyond the stock column
+        )
+        importer, errors = self.import_feed(feed, 'csv', chunk_size=2)
+        self.assertEqual((importer.created, importer.updated), (2, 1))
+        self.assertEqual(errors, [5, 6, 7, 8, 9, 10])
+        self.assertEqual(
+            list(Product.objects.order_by('pk').values_list('slug', 'price', 'stock')),
+            [('pixel-phone', 450, 10), ('budget-phone', 99, 5), ('budget-phone-1', 89, 5)],
+        )
+        # Imports send no signals but still reach the in-process search index
+        self.assertEqual(len(search.search_products('budget')), 2)
+
+        importer, errors = self.import_feed('{"slug": "new-tablet", "name": "Tablet", "category": "Tablets", '
+                                            '"price": "10", "stock": 1}\nnot json\n', 'jsonl', create_categories=True)
+        self.assertEqual((importer.created, errors), (1, [2]))
+        self.assertEqual(Product.objects.get(slug='new-tablet').category.name, 'Tablets')
+
+
+class TrendingTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.localdate()
+        self.products = [self.make(f'Product {n}', price=10) for n in range(4)]
+
+    def sell(self, product, quantity, days_ago=0):
+        trending.record_sales([(product.pk, quantity)], day=self.today - timedelta(days=days_ago))
+
+    def ranks(self):
+        return dict(Product.objects.filter(trending_rank__isnull=False).values_list('pk', 'trending_rank'))
+
+    def test_sales_fold_into_daily_buckets_and_decay(self):
+        first, second, third, _ = self.products
+        trending.record_sales([(first.pk, 3), (first.pk, 5), (second.pk, 0), (None, 2)], day=self.today)
+        self.sell(second, 8, days_ago=trending.HALF_LIFE_DAYS)
+        self.sell(third, 100, days_ago=trending.WINDOW_DAYS)
+        self.assertEqual(ProductSalesBucket.objects.get(product=first).quantity, 8)
+
+        scores = trending.trending_scores(self.today)
+        self.assertEqual(dict(scores), {first.pk: 8, second.pk: 4})
+
+    def test_ranks_are_rewritten_pinned_first_and_only_when_they_change(self):
+        first, second, third, fourth = self.products
+        self.sell(first, 1)
+        self.sell(second, 5)
+        self.sell(third, 3)
+        self.sell(fourth, 50, days_ago=trending.WINDOW_DAYS)  # outside the window
+        Product.objects.filter(pk=first.pk).update(is_trending=True)
+
+        self.assertEqual(trending.compute_trending(size=2, today=self.today), [first.pk, second.pk])
+        self.assertEqual(self.ranks(), {first.pk: 0, second.pk: 1})
+        self.assertFalse(ProductSalesBucket.objects.filter(product=fourth).exists())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            trending.compute_trending(size=2, today=self.today)
+        self.assertEqual(callbacks, [])  # same ranking: nothing written or invalidated
+
+        Product.objects.filter(pk=first.pk).update(is_trending=False)
+        self.sell(third, 10)
+        trending.compute_trending(size=2, today=self.today)
+        self.assertEqual(self.ranks(), {third.pk: 0, second.pk: 1})
+
+
+class RecommendationTests(CatalogTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob', password='pw')
+        self.address = Address.objects.create(
+            user=self.user, full_name='Bob', phone='1', street_address='1 Main St', city='X',
+            state='Y', postal_code='1', country='Z',
+        )
+        self.phone, self.case, self.charger, self.cable = [
+            self.make(name, price=10) for name in ('Phone', 'Case', 'Charger', 'Cable')
+        ]
+        self.laptop = self.make('Laptop', price=10, category=self.laptops)
+
+    def order(self, *products):
+        order = Order.objects.create(
+            user=self.user, order_number=f'ORD{Order.objects.count()}', address=self.address, total_amount=10,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=10, total=10) for product in products
+        ])
+
+    def stored(self):
+        return list(ProductRecommendation.objects.order_by('product_id', 'rank')
+                    .values_list('product', 'rank', 'recommended', 'score'))
+
+    @unittest.skipIf(recommendations.np is None, 'needs NumPy')
+    def test_numpy_counts_match_the_python_counts(self):
+        pairs = sorted(
+            [(order, (order * 7 + n) % 13) for order in range(1, 40) for n in range(order % 6)]
+            + [(5, 3), (5, 3), (6, 1)]  # repeated lines and a one-product basket
+            + [(50, n) for n in range(recommendations.MAX_ITEMS_PER_ORDER + 10)]
+        )
+        counts = recommendations._count_with_numpy(iter(pairs))
+        self.assertEqual(counts, recommendations._count_in_python(iter(pairs)))
+        self.assertNotIn((0, recommendations.MAX_ITEMS_PER_ORDER), counts)
+        self.assertEqual(recommendations._count_with_numpy(iter([])), {})
+
+    def test_rebuild_ranks_by_co_purchases_then_id(self):
+        self.order(self.phone, self.case, self.charger)
+        self.order(self.phone, self.charger)
+        self.order(self.phone, self.case, self.case)
+        self.order(self.cable)
+        phone, case, charger = self.phone.pk, self.case.pk, self.charger.pk
+        # With NumPy and with the pure-Python fallback
+        for numpy in {recommendations.np, None}:
+            with self.subTest(numpy=numpy), mock.patch.object(recommendations, 'np', numpy):
+                self.assertEqual(recommendations.build_recommendations(top_n=2), (3, 6))
+                self.assertEqual(self.stored(), [
+                    (phone, 0, case, 2), (phone, 1, charger, 2),
+                    (case, 0, phone, 2), (case, 1, charger, 1),
+                    (charger, 0, phone, 2), (charger, 1, case, 1),
+                ])
+
+    def test_recorded_orders_match_a_rebuild(self):
+        self.order(self.phone, self.case)
+        recommendations.build_recommendations()
+        for basket in [(self.phone, self.charger), (self.phone, self.case, self.cable), (self.laptop,)]:
+            self.order(*basket)
+            recommendations.record_order([product.pk for product in basket])
+        recorded = self.stored()
+        recommendations.build_recommendations()
+        self.assertEqual(recorded, self.stored())
+
+        # Lists over top_n drop their weakest entries
+        recommendations.record_order([self.phone.pk, self.laptop.pk], top_n=2)
+        self.assertEqual(
+            list(ProductRecommendation.objects.filter(product=self.phone).values_list('recommended', flat=True)),
+            [self.case.pk, self.charger.pk],
+        )
+
+    def test_related_products_top_up_from_the_category(self):
+        self.order(self.phone, self.laptop)
+        self.order(self.phone, self.laptop, self.charger)
+        recommendations.build_recommendations()
+        related = recommendations.related_products(self.phone, limit=3)
+        self.assertEqual(related[:2], [self.laptop, self.charger])
+        self.assertIn(related[2], [self.case, self.cable])
+
+        # No co-purchases at all: the same category only, never the product itself
+        response = self.client.get(f'/product/{self.cable.slug}/')
+        self.assertCountEqual(response.context['related_products'], [self.phone, self.case, self.charger])
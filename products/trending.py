@@ -0,0 +1,91 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, When
+from django.utils import timezone
+
+from . import facets
+from .models import Product, ProductSalesBucket
+from .versioning import CATALOG_VERSION, bump_version, category_version_name
+
+# Trending products by recent sales velocity. Order lines add to per-day
+# buckets; compute_trending scores the last WINDOW_DAYS of buckets with an
+# exponential decay and stores the top products as Product.trending_rank.
+# Manually flagged products (is_trending) are pinned ahead of the computed ones.
+WINDOW_DAYS = 14
+HALF_LIFE_DAYS = 3
+TRENDING_SIZE = 12
+
+
+def record_sales(lines, day=None):
+    """Add (product_id, quantity) order lines to today's buckets."""
+    day = day or timezone.localdate()
+    totals = defaultdict(int)
+    for product_id, quantity in lines:
+        if product_id and quantity > 0:
+            totals[product_id] += quantity
+
+    for product_id, quantity in totals.items():
+        bucket = ProductSalesBucket.objects.filter(product_id=product_id, day=day)
+        if bucket.update(quantity=F('quantity') + quantity):
+            continue
+        try:
+            with transaction.atomic():
+                ProductSalesBucket.objects.create(product_id=product_id, day=day, quantity=quantity)
+        except IntegrityError:
+            # Another order created today's bucket first
+            bucket.update(quantity=F('quantity') + quantity)
+
+
+def trending_scores(today=None):
+    today = today or timezone.localdate()
+    buckets = (
+        ProductSalesBucket.objects.filter(day__gt=today - timedelta(days=WINDOW_DAYS))
+        .values_list('product_id', 'day', 'quantity')
+        .iterator(chunk_size=5000)
+    )
+    scores = defaultdict(float)
+    for product_id, day, quantity in buckets:
+        scores[product_id] += quantity * 0.5 ** ((today - day).days / HALF_LIFE_DAYS)
+    return scores
+
+
+def compute_trending(size=TRENDING_SIZE, today=None):
+    """Rewrite Product.trending_rank; returns the ranked product ids."""
+    today = today or timezone.localdate()
+    scores = trending_scores(today)
+    pinned = list(Product.objects.filter(is_trending=True).values_list('id', flat=True))
+    pinned.sort(key=lambda pk: (-scores.get(pk, 0), pk))
+    pinned_ids = set(pinned)
+    computed = sorted((pk for pk in scores if pk not in pinned_ids), key=lambda pk: (-scores[pk], pk))
+    ranked = (pinned + computed)[:max(size, len(pinned))]
+
+    with transaction.atomic():
+        previous = dict(Product.objects.filter(trending_rank__isnull=False).values_list('id', 'trending_rank'))
+        wanted = {pk: rank for rank, pk in enumerate(ranked)}
+        if previous != wanted:
+            Product.objects.filter(pk__in=previous.keys() - wanted.keys()).update(trending_rank=None)
+            if wanted:
+                Product.objects.filter(pk__in=wanted).update(trending_rank=Case(
+                    *[When(pk=pk, then=rank) for pk, rank in wanted.items()],
+                    output_field=IntegerField(),
+                ))
+            changed = previous.keys() | wanted.keys()
+            categories = set(Product.objects.filter(pk__in=changed).values_list('category_id', flat=True))
+            transaction.on_commit(lambda: _publish(categories))
+
+        # Slide the window
+        ProductSalesBucket.objects.filter(day__lte=today - timedelta(days=WINDOW_DAYS)).delete()
+    return ranked
+
+
+def _publish(category_ids):
+    bump_version(CATALOG_VERSION)
+    for category_id in category_ids:
+        bump_version(category_version_name(category_id))
+    facets.invalidate_summaries(category_ids)
+
+
+def trending_products(limit=6):
+    return Product.objects.select_related('category').filter(trending_rank__isnull=False).order_by('trending_rank')[:limit]
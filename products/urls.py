@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('', views.home, name='home'),
     path('products/', views.product_list, name='product_list'),
+    path('products/feed/', views.product_feed, name='product_feed'),
     path('product/<slug:slug>/', views.product_detail, name='product_detail'),
     path('search-suggestions/', views.search_suggestions, name='search_suggestions'),
 ]
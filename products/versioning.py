@@ -0,0 +1,56 @@
+import time
+
+from django.core.cache import cache
+
+# Version counters live in the shared cache so every worker process sees the
+# same value. In-process structures remember the version they were built at
+# and rebuild once the counter has moved on.
+VERSION_KEY_PREFIX = 'version'
+
+# Bumped on any product or category change
+CATALOG_VERSION = 'catalog'
+
+
+def _key(name):
+    return f'{VERSION_KEY_PREFIX}:{name}'
+
+
+def _seed(name):
+    # Seed from the clock so a counter that was evicted never restarts at a
+    # value some process already built against.
+    cache.add(_key(name), int(time.time() * 1000), timeout=None)
+
+
+def get_version(name):
+    version = cache.get(_key(name))
+    if version is None:
+        _seed(name)
+        version = cache.get(_key(name))
+    return version
+
+
+def category_version_name(category_id):
+    return f'category:{category_id}'
+
+
+def bump_version(name):
+    try:
+        return cache.incr(_key(name))
+    except ValueError:
+        _seed(name)
+        return cache.incr(_key(name))
+
+
+def publish_change(structure, name, change):
+    # Apply a change to an in-process structure and publish it under `name`.
+    # If another process bumped the version in between, the local copy is
+    # stale and gets rebuilt on next use instead.
+    with structure._lock:
+        built_at = structure.version
+        if built_at is not None:
+            change()
+        new_version = bump_version(name)
+        if built_at is not None and new_version == built_at + 1:
+            structure.version = new_version
+        else:
+            structure.version = None
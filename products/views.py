@@ -1,50 +1,189 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
 from django.http import JsonResponse
-from django.db.models import Q
+from django.views.decorators.cache import cache_control
+from django.contrib import messages
+from django.views.decorators.http import condition
 from .models import Product, Category
+from .facets import FacetSelection, build_facets
+from .pagination import DEFAULT_PAGE_SIZE, KeysetPaginator, next_page_url
+from .recommendations import related_products as related_products_for
+from .search import order_by_rank, search_products
+from .snapshot import snapshot_page
+from .versioning import CATALOG_VERSION, get_version
+from . import autocomplete, trending
 
 def home(request):
+    # Querysets stay lazy; they only run when a cached section misses
     categories = Category.objects.all()
-    trending_products = Product.objects.filter(is_trending=True)[:6]
-    featured_products = Product.objects.all()[:8]
+    trending_products = trending.trending_products(limit=6)
+    featured_products = Product.objects.select_related('category')[:8]
     
     context = {
         'categories': categories,
         'trending_products': trending_products,
         'featured_products': featured_products,
+        'catalog_version': get_version(CATALOG_VERSION),
     }
     return render(request, 'home.html', context)
 
-def product_list(request):
-    products = Product.objects.all()
-    categories = Category.objects.all()
+# Allowed ?sort= values and the keyset ordering behind each one. Every
+# ordering ends in 'id' so the cursor is unique, and has a matching index.
+SORT_ORDERINGS = {
+    '-created_at': ('-created_at', '-id'),
+    'price': ('effective_price', 'id'),
+    '-price': ('-effective_price', '-id'),
+    '-discount': ('-discount_percentage', '-id'),
+}
+DEFAULT_SORT = '-created_at'
+RELEVANCE_ORDERING = ('search_rank', 'id')
+
+# Bounds of the price columns (max_digits=10, decimal_places=2)
+MAX_PRICE = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+def _parse_price(value):
+    try:
+        price = Decimal(value) if value else None
+    except InvalidOperation:
+        return None
+    if price is None or not price.is_finite():
+        return None
+    # Clamp and round to cents, as the database compares it, so the snapshot
+    # and the query see the same bound
+    return max(-MAX_PRICE, min(price, MAX_PRICE)).quantize(CENT)
+
+def _catalog_page(request, selection):
+    products = Product.objects.select_related('category')
     
     # Filtering
-    category_id = request.GET.get('category')
-    if category_id:
-        products = products.filter(category_id=category_id)
+    products = selection.filter(products)
+    min_price = _parse_price(request.GET.get('min_price'))
+    max_price = _parse_price(request.GET.get('max_price'))
+    if min_price is not None:
+        products = products.filter(effective_price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(effective_price__lte=max_price)
     
     # Searching
     search_query = request.GET.get('search')
+    sort_by = request.GET.get('sort')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) | 
-            Q(description__icontains=search_query)
+        products = order_by_rank(products, search_products(search_query))
+    
+    # Sorting (search results stay in relevance order unless asked otherwise)
+    if search_query and sort_by not in SORT_ORDERINGS:
+        ordering = RELEVANCE_ORDERING
+    else:
+        ordering = SORT_ORDERINGS.get(sort_by, SORT_ORDERINGS[DEFAULT_SORT])
+    
+    page_size = request.GET.get('page_size', DEFAULT_PAGE_SIZE)
+    if not str(page_size).isdecimal():
+        page_size = DEFAULT_PAGE_SIZE
+    cursor = request.GET.get('cursor')
+    
+    # Browsing without a search is answered from the in-memory snapshot when available
+    if not search_query:
+        page = snapshot_page(
+            Product.objects.select_related('category'), selection, ordering,
+            cursor=cursor, page_size=page_size, min_price=min_price, max_price=max_price,
         )
+        if page is not None:
+            return page, search_query
+    
+    paginator = KeysetPaginator(products, ordering, page_size=page_size)
+    return paginator.page(cursor), search_query
+
+# Conditional GET. Pages show the navbar (user) and embed the CSRF token, so
+# their ETags include both; pending flash messages disable the validator so
+# they are never swallowed by a 304. Caches must revalidate on every use.
+revalidate = cache_control(private=True, no_cache=True)
+
+def _viewer(request):
+    if len(messages.get_messages(request)):
+        return None
+    user = request.user.pk if request.user.is_authenticated else 'anon'
+    token = request.META.get('CSRF_COOKIE', '')
+    return hashlib.sha1(f'{user}:{token}'.encode()).hexdigest()[:12]
+
+def _list_etag(request):
+    viewer = _viewer(request)
+    if viewer is None:
+        return None
+    return f"list-{get_version(CATALOG_VERSION)}-{viewer}"
+
+@revalidate
+@condition(etag_func=_list_etag)
+def product_list(request):
+    selection = FacetSelection.from_request(request)
+    page, search_query = _catalog_page(request, selection)
+    categories = list(Category.objects.all())
     
-    # Sorting
-    sort_by = request.GET.get('sort', '-created_at')
-    products = products.order_by(sort_by)
+    # Facet counts (cached per category unless searching or filtering)
+    if search_query:
+        facet_base = Product.objects.filter(id__in=search_products(search_query))
+    else:
+        facet_base = Product.objects.all()
+    facet_groups = build_facets(facet_base, selection, categories, use_summary=not search_query)
     
     context = {
-        'products': products,
+        'products': page,
         'categories': categories,
+        'facets': facet_groups,
+        'search_query': search_query or '',
+        'sort': request.GET.get('sort', ''),
+        'next_page_url': next_page_url(request, page),
     }
     return render(request, 'products/product_list.html', context)
 
+def _feed_etag(request):
+    return f"feed-{get_version(CATALOG_VERSION)}"
+
+@cache_control(public=True, no_cache=True)
+@condition(etag_func=_feed_etag)
+def product_feed(request):
+    # JSON variant of product_list for infinite scroll
+    page, _ = _catalog_page(request, FacetSelection.from_request(request))
+    
+    results = [
+        {
+            'id': p.id,
+            'name': p.name,
+            'slug': p.slug,
+            'category': p.category.name,
+            'price': str(p.price),
+            'current_price': str(p.effective_price),
+            'discount_percentage': p.discount_percentage,
+            'stock': p.stock,
+            'image': p.image.url if p.image else None,
+            'url': reverse('product_detail', args=[p.slug]),
+        }
+        for p in page
+    ]
+    return JsonResponse({
+        'results': results,
+        'next_cursor': page.next_cursor,
+        'next_url': next_page_url(request, page),
+    })
+
+def _detail_etag(request, slug):
+    # No Last-Modified: the page also changes with its related products and
+    # the viewer, which only the ETag accounts for
+    updated_at = Product.objects.filter(slug=slug).values_list('updated_at', flat=True).first()
+    viewer = _viewer(request)
+    if updated_at is None or viewer is None:
+        return None
+    # Related products on the page can change without this product changing
+    return f"product-{updated_at.timestamp()}-{get_version(CATALOG_VERSION)}-{viewer}"
+
+@revalidate
+@condition(etag_func=_detail_etag)
 def product_detail(request, slug):
-    product = get_object_or_404(Product, slug=slug)
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+    product = get_object_or_404(Product.objects.select_related('category'), slug=slug)
+    related_products = related_products_for(product, limit=4)
     
     context = {
         'product': product,
@@ -52,14 +191,13 @@ def product_detail(request, slug):
     }
     return render(request, 'products/product_detail.html', context)
 
+def _suggestions_etag(request):
+    return f"ac-{autocomplete.autocomplete_version()}"
+
+@cache_control(public=True, max_age=300)
+@condition(etag_func=_suggestions_etag)
 def search_suggestions(request):
-    import json
     query = request.GET.get('q', '')
-    products = Product.objects.filter(name__icontains=query)[:5]
-    
-    suggestions = [
-        {'id': p.id, 'name': p.name, 'slug': p.slug} 
-        for p in products
-    ]
+    suggestions = autocomplete.complete(query)
     
-    return JsonResponse(suggestions, safe=False)
\ No newline at end of file
+    return JsonResponse(suggestions, safe=False)
@@ -48,7 +48,7 @@ function setupSearchSuggestions() {
     
     if (!searchInput) return;
     
-    searchInput.addEventListener('input', function(e) {
+    searchInput.addEventListener('input', debounce(function(e) {
         const query = this.value.trim();
         
         if (query.length < 2) {
@@ -56,7 +56,7 @@ function setupSearchSuggestions() {
             return;
         }
         
-        fetch(`/search-suggestions/?q=${query}`)
+        fetch(`/search-suggestions/?q=${encodeURIComponent(query.toLowerCase())}`)
             .then(res => res.json())
             .then(suggestions => {
                 if (suggestions.length > 0) {
@@ -77,7 +77,7 @@ function setupSearchSuggestions() {
                 }
             })
             .catch(err => console.log('Search error:', err));
-    });
+    }, 200));
     
     // Close on blur
     searchInput.addEventListener('blur', function() {
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.models import Task
+from tasks.queue import enqueue_many
+from tasks.worker import POOLS, Worker
+
+
+class Command(BaseCommand):
+    help = "Queue no-op tasks and time a worker draining them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=2000, help='Tasks to queue')
+        parser.add_argument('--workers', type=int, default=4, help='Pool size')
+        parser.add_argument('--pool', choices=POOLS, default='thread', help='Run tasks on threads or processes')
+        parser.add_argument('--sleep-ms', type=int, default=0, help='Simulated I/O per task')
+
+    def handle(self, *args, **options):
+        count = max(1, options['tasks'])
+        if Task.objects.exclude(status=Task.FAILED).exists():
+            raise CommandError("The queue is not empty; drain it first (run_tasks --until-idle)")
+
+        enqueue_many([('tasks.sleep', {'milliseconds': options['sleep_ms']})] * count)
+        worker = Worker(workers=options['workers'], pool=options['pool'], poll_seconds=0.05)
+
+        started = time.perf_counter()
+        worker.run(until_idle=True)
+        elapsed = time.perf_counter() - started
+
+        left = Task.objects.filter(name='tasks.sleep').exclude(status=Task.FAILED).count()
+        self.stdout.write(
+            f"{worker.succeeded} of {count} tasks on {worker.workers} {worker.pool}s in {elapsed:.2f}s "
+            f"({worker.succeeded / elapsed:,.0f} tasks/s), {worker.failed} failed, {left} left"
+        )
+        if worker.succeeded != count:
+            raise CommandError("Not every task completed exactly once")
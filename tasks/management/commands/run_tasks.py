@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from tasks.queue import DEFAULT_LEASE_SECONDS
+from tasks.worker import DEFAULT_POLL_SECONDS, POOLS, Worker
+
+
+class Command(BaseCommand):
+    help = "Run queued tasks (order side effects, emails) until interrupted"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, help='Pool size (default: TASK_WORKERS)')
+        parser.add_argument('--pool', choices=POOLS, default='thread', help='Run tasks on threads or processes')
+        parser.add_argument('--batch-size', type=int, help='Tasks claimed ahead (default: twice the pool size)')
+        parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS,
+                            help='Seconds before an unfinished task may be claimed again')
+        parser.add_argument('--poll', type=float, default=DEFAULT_POLL_SECONDS, help='Seconds between polls when idle')
+        parser.add_argument('--until-idle', action='store_true', help='Exit once no task is due')
+
+    def handle(self, *args, **options):
+        worker = Worker(
+            workers=options['workers'], pool=options['pool'], batch_size=options['batch_size'],
+            lease_seconds=options['lease'], poll_seconds=options['poll'],
+        )
+        self.stdout.write(f"Running tasks on {worker.workers} {worker.pool}s (Ctrl+C to stop)")
+        try:
+            worker.run(until_idle=options['until_idle'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"{worker.succeeded} tasks done, {worker.failed} failed or retried"))
@@ -0,0 +1,10 @@
+import os
+
+import django
+
+
+def init_process(settings_module):
+    # Spawned pool workers start from a bare interpreter; nothing that
+    # touches models may be imported before this has run
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
@@ -0,0 +1,189 @@
+import random
+import time
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.db import OperationalError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+# A durable queue in the database. Enqueueing inside a transaction commits the
+# task together with the change that caused it, so nothing is lost or run for
+# a rolled-back change. Workers claim due tasks under a lease (skipping rows
+# other workers hold where the database can SELECT ... FOR UPDATE SKIP
+# LOCKED); a task whose worker died is claimed again once its lease lapses.
+# A handler runs in a transaction that first deletes the task, so its
+# database writes and the task's completion commit together. Failures are
+# retried with exponential backoff until max_attempts, then left as FAILED.
+# Lock conflicts and serialization failures are not the task's fault: they are
+# retried on the spot and, failing that, requeued without using an attempt.
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_LEASE_SECONDS = 5 * 60
+BACKOFF_BASE_SECONDS = 5
+BACKOFF_MAX_SECONDS = 60 * 60
+CONFLICT_RETRIES = 8
+CONFLICT_BACKOFF_SECONDS = 0.05
+# PostgreSQL serialization_failure and deadlock_detected
+CONFLICT_PGCODES = ('40001', '40P01')
+
+_handlers = {}
+
+
+class LeaseLost(Exception):
+    pass
+
+
+def task(name, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register the decorated function as the handler for tasks called `name`."""
+    def register(func):
+        _handlers[name] = (func, max_attempts)
+        func.task_name = name
+        return func
+    return register
+
+
+def _new_task(name, payload, delay):
+    try:
+        _, max_attempts = _handlers[name]
+    except KeyError:
+        raise LookupError(f'no task registered as {name!r}') from None
+    return Task(name=name, payload=payload, max_attempts=max_attempts, run_at=timezone.now() + timedelta(seconds=delay))
+
+
+def enqueue(name, delay=0, **payload):
+    """Queue `name` to run with keyword arguments `payload` (JSON-serializable)."""
+    task = _new_task(name, payload, delay)
+    task.save()
+    return task
+
+
+def enqueue_many(calls, delay=0):
+    """Queue several (name, payload) calls with one INSERT."""
+    return Task.objects.bulk_create([_new_task(name, payload, delay) for name, payload in calls])
+
+
+def backoff(attempts):
+    # 5s, 10s, 20s, ... capped at an hour, with jitter so failures don't retry in lockstep
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** max(0, attempts - 1))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+
+def is_conflict(exc):
+    """Whether `exc` is a transient lock or serialization conflict worth retrying."""
+    if not isinstance(exc, OperationalError):
+        return False
+    # SQLite reports a conflicting writer as "database is locked" (or "database
+    # table is locked" for shared-cache databases) rather than waiting
+    return 'is locked' in str(exc) or getattr(exc.__cause__, 'pgcode', None) in CONFLICT_PGCODES
+
+
+def retry_conflicts(func, *args, **kwargs):
+    """Call `func`, retrying lock conflicts with jittered backoff; re-raises the last one."""
+    for attempt in range(CONFLICT_RETRIES + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as exc:
+            if attempt == CONFLICT_RETRIES or not is_conflict(exc):
+                raise
+        time.sleep(random.uniform(0, CONFLICT_BACKOFF_SECONDS * 2 ** min(attempt, 4)))
+
+
+def claim(limit, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Lease up to `limit` due tasks; returns (lease token, task ids)."""
+    now = timezone.now()
+    token = uuid.uuid4().hex
+    due = Task.objects.filter(
+        Q(status=Task.PENDING, run_at__lte=now) | Q(status=Task.RUNNING, locked_until__lt=now)
+    )
+    candidates = due.order_by('run_at', 'id').values_list('id', flat=True)
+
+    def lease(ids):
+        # The UPDATE re-checks the condition, so without row locks a task
+        # another worker has just claimed is not claimed twice
+        due.filter(id__in=ids).update(
+            status=Task.RUNNING, locked_by=token, locked_until=now + timedelta(seconds=lease_seconds),
+            attempts=F('attempts') + 1,
+        )
+
+    # Each step retries its own lock conflicts: retrying the whole claim
+    # would lease a second batch under a new token and strand the first
+    if connection.features.has_select_for_update_skip_locked:
+        def lock_and_lease():
+            with transaction.atomic():
+                ids = list(candidates.select_for_update(skip_locked=True)[:limit])
+                if ids:
+                    lease(ids)
+            return ids
+
+        ids = retry_conflicts(lock_and_lease)
+    else:
+        # SQLite has no row locks, and a read-then-write transaction there
+        # deadlocks with other writers; the conditional UPDATE alone decides
+        ids = retry_conflicts(list, candidates[:limit])
+        if ids:
+            retry_conflicts(lease, ids)
+    if not ids:
+        return token, []
+    return token, retry_conflicts(list, Task.objects.filter(locked_by=token).values_list('id', flat=True))
+
+
+def execute(task_id, token):
+    """Run one task claimed under `token`. Returns True if it completed."""
+    try:
+        return retry_conflicts(_execute, task_id, token)
+    except OperationalError as exc:
+        if not is_conflict(exc):
+            raise
+    # Still conflicting: hand the task back without counting the attempt. If
+    # even that conflicts, the lease lapses and the task is claimed again
+    try:
+        retry_conflicts(
+            Task.objects.filter(pk=task_id, locked_by=token).update,
+            status=Task.PENDING, attempts=F('attempts') - 1, locked_by='', locked_until=None,
+        )
+    except OperationalError as exc:
+        if not is_conflict(exc):
+            raise
+    return False
+
+
+def _execute(task_id, token):
+    task = Task.objects.filter(pk=task_id, locked_by=token).first()
+    if task is None:
+        return False
+    try:
+        func, _ = _handlers[task.name]
+    except KeyError:
+        _fail(task, token, f'no task registered as {task.name!r}', retry=False)
+        return False
+
+    try:
+        with transaction.atomic():
+            # Delete first: a lapsed lease is caught before any work is done,
+            # and a lock conflict strikes before the handler has sent email
+            # it would send again when retried
+            if not Task.objects.filter(pk=task.pk, locked_by=token).delete()[0]:
+                # The lease ran out and another worker owns the task now
+                raise LeaseLost
+            func(**task.payload)
+    except LeaseLost:
+        return False
+    except Exception as exc:
+        if is_conflict(exc):
+            # Rolled back; execute() runs the task again
+            raise
+        _fail(task, token, traceback.format_exc(), retry=task.attempts < task.max_attempts)
+        return False
+    return True
+
+
+def _fail(task, token, error, retry):
+    changes = {'last_error': error, 'locked_by': '', 'locked_until': None}
+    if retry:
+        changes.update(status=Task.PENDING, run_at=timezone.now() + backoff(task.attempts))
+    else:
+        changes.update(status=Task.FAILED)
+    Task.objects.filter(pk=task.pk, locked_by=token).update(**changes)
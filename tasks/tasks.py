@@ -0,0 +1,10 @@
+import time
+
+from .queue import task
+
+
+@task('tasks.sleep', max_attempts=1)
+def sleep(milliseconds=0):
+    """Do nothing for a while; used by bench_tasks and for checking a worker is alive."""
+    if milliseconds:
+        time.sleep(milliseconds / 1000)
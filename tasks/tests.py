@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.db import OperationalError, transaction
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+
+from accounts.models import Address
+from cart.models import CartItem
+from delivery.models import DeliveryTracking
+from orders.models import Order
+from orders.services import place_order
+from orders.tests import OrderTestCase
+from products.models import Category, Product
+
+from .models import Task
+from .queue import claim, enqueue, execute, task
+from .worker import Worker
+
+calls = []
+
+
+@task('tests.record', max_attempts=2)
+def record(value):
+    calls.append(value)
+    if value == 'boom':
+        raise RuntimeError(value)
+    if value == 'locked' and calls.count(value) < 3:
+        raise OperationalError('database is locked')
+
+
+def run_due():
+    token, ids = claim(10)
+    return [execute(task_id, token) for task_id in ids]
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_rolled_back_enqueue_leaves_no_task(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                enqueue('tests.record', value='lost')
+                raise RuntimeError
+        self.assertFalse(Task.objects.exists())
+
+    def test_completed_task_is_deleted(self):
+        enqueue('tests.record', value='ok')
+        self.assertEqual(run_due(), [True])
+        self.assertEqual(calls, ['ok'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failure_backs_off_then_gives_up(self):
+        queued = enqueue('tests.record', value='boom')
+        self.assertEqual(run_due(), [False])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.PENDING, 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('RuntimeError: boom', queued.last_error)
+        self.assertEqual(run_due(), [])  # not due yet
+
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_due(), [False])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+        Task.objects.update(run_at=timezone.now())
+        self.assertEqual(run_due(), [])
+
+    def test_lock_conflicts_are_retried_without_using_attempts(self):
+        queued = enqueue('tests.record', value='locked')
+        self.assertEqual(run_due(), [True])
+        self.assertEqual(calls, ['locked'] * 3)
+        self.assertFalse(Task.objects.filter(pk=queued.pk).exists())
+
+    def test_lapsed_lease_is_claimed_again(self):
+        enqueue('tests.record', value='ok')
+        first_token, ids = claim(10)
+        self.assertEqual(claim(10)[1], [])
+
+        Task.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        second_token, reclaimed = claim(10)
+        self.assertEqual(reclaimed, ids)
+        # The first worker lost its lease and must not run the task
+        self.assertFalse(execute(ids[0], first_token))
+        self.assertTrue(execute(ids[0], second_token))
+        self.assertEqual(calls, ['ok'])
+
+
+class OrderTaskTests(OrderTestCase):
+    def test_order_side_effects_run_from_the_queue(self):
+        self.client.post('/orders/place-order/', {'address_id': self.address.pk})
+        self.assertCountEqual(Task.objects.values_list('name', flat=True), [
+            'delivery.open_tracking', 'orders.send_confirmation', 'products.record_order', 'products.record_sales',
+        ])
+        self.assertFalse(DeliveryTracking.objects.exists())
+
+        self.assertEqual(run_due(), [True] * 4)
+        self.assertTrue(DeliveryTracking.objects.filter(order__user=self.user).exists())
+        self.assertFalse(Task.objects.exists())
+
+
+class WorkerTests(TransactionTestCase):
+    def test_default_pool_drains_real_order_tasks(self):
+        category = Category.objects.create(name='Electronics', slug='electronics')
+        product = Product.objects.create(
+            category=category, name='Laptop Pro', description='d', price=10, stock=100, image='x.jpg',
+        )
+        for n in range(10):
+            user = User.objects.create_user(f'shopper{n}', email=f'shopper{n}@example.com', password='pw')
+            address = Address.objects.create(
+                user=user, full_name='Shopper', phone='1', street_address='1 Main St', city='X',
+                state='Y', postal_code='1', country='Z',
+            )
+            CartItem.objects.create(user=user, product=product, quantity=1)
+            place_order(user, address)
+        self.assertEqual(Task.objects.count(), 40)
+
+        worker = Worker(poll_seconds=0.01)
+        worker.run(until_idle=True)
+
+        self.assertEqual((worker.succeeded, worker.failed), (40, 0))
+        self.assertFalse(Task.objects.exists())
+        self.assertEqual(DeliveryTracking.objects.count(), Order.objects.count())
+        self.assertEqual(len(mail.outbox), 10)
@@ -0,0 +1,95 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, connection
+
+from .process import init_process
+from .queue import DEFAULT_LEASE_SECONDS, claim, execute, is_conflict
+
+POOLS = ('thread', 'process')
+DEFAULT_POLL_SECONDS = 1.0
+
+
+def run_claimed(task_id, token):
+    # Pool threads and processes are long-lived; treat each task like a
+    # request and drop broken or expired connections around it
+    close_old_connections()
+    try:
+        return execute(task_id, token)
+    finally:
+        close_old_connections()
+
+
+class Worker:
+    """
+    Claim due tasks and run them on a pool of `workers` threads or spawned
+    processes, topping the pool up as tasks finish. Threads suit the I/O-bound
+    side effects here (DB writes, email); processes suit CPU-heavy handlers.
+    On SQLite, which lets one writer in at a time, the pool is a single worker.
+    """
+
+    def __init__(self, workers=None, pool='thread', batch_size=None,
+                 lease_seconds=DEFAULT_LEASE_SECONDS, poll_seconds=DEFAULT_POLL_SECONDS):
+        if pool not in POOLS:
+            raise ValueError(f'pool must be one of {", ".join(POOLS)}')
+        self.workers = max(1, workers or getattr(settings, 'TASK_WORKERS', 4))
+        if connection.vendor == 'sqlite':
+            # More workers would only take turns on the database lock
+            self.workers = 1
+        self.pool = pool
+        # Claim a little ahead so a worker never waits on the next claim
+        self.batch_size = max(1, batch_size or self.workers * 2)
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self.succeeded = 0
+        self.failed = 0
+
+    def _executor(self):
+        if self.pool == 'thread':
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='task')
+        # Spawned rather than forked: the parent holds DB connections and threads
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=get_context('spawn'),
+            initializer=init_process, initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+        )
+
+    def run(self, until_idle=False, max_tasks=None):
+        """
+        Process tasks until interrupted, or, with `until_idle`, until none are
+        due. Returns the number of tasks run.
+        """
+        in_flight = set()
+        started = 0
+        with self._executor() as executor:
+            while True:
+                room = self.batch_size - len(in_flight)
+                if max_tasks is not None:
+                    room = min(room, max_tasks - started)
+                if room > 0:
+                    try:
+                        token, ids = claim(room, lease_seconds=self.lease_seconds)
+                    except OperationalError as exc:
+                        if not is_conflict(exc):
+                            raise
+                        # Busy, not idle: try again after the running tasks
+                        token, ids = None, []
+                        if not in_flight:
+                            time.sleep(self.poll_seconds)
+                            continue
+                    in_flight.update(executor.submit(run_claimed, task_id, token) for task_id in ids)
+                    started += len(ids)
+                if not in_flight:
+                    if until_idle or (max_tasks is not None and started >= max_tasks):
+                        break
+                    time.sleep(self.poll_seconds)
+                    continue
+                done, in_flight = wait(in_flight, timeout=self.poll_seconds, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.result():
+                        self.succeeded += 1
+                    else:
+                        self.failed += 1
+        return self.succeeded + self.failed